@@ -1,69 +1,79 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import os
 import json
+from optparse import make_option
 from urllib2 import urlopen
 
-from django.utils.encoding import smart_str
+from django.db import transaction
 from django.core.management.base import CommandError, BaseCommand
 
 from catalog.addresses.models import Region, Country
 
 
-COUNTRIES_API_URL = \
-    'http://api.geonames.org/countryInfoJSON?username=dinoperovic'
+COUNTRIES_DATA = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+    'data', 'countries.json')
 
 
 class Command(BaseCommand):
-    help = 'Create countries and regions automatically from api.geonames.org.'
+    help = ('Create countries and regions from the bundled geonames.org '
+            'dataset.')
     args = '<code code code code...>'
-    data = None
-
-    def __init__(self, *args, **kwargs):
-        super(Command, self).__init__(*args, **kwargs)
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--source', dest='source', default=COUNTRIES_DATA,
+            help='Path or URL of a geonames.org "countryInfoJSON" dataset '
+                 'to use instead of the bundled one.'),
+    )
 
     def handle(self, *args, **options):
-        print 'Querying database at {}.'.format(COUNTRIES_API_URL)
-
-        api = urlopen(COUNTRIES_API_URL)
-        data = json.loads(api.read()).get('geonames', None)
-        if data is not None:
-            self.data = dict((x['countryCode'], x) for x in data)
-        else:
-            raise CommandError('Error fetching %s.' % COUNTRIES_API_URL)
-
-        codes = list(args) if len(args) else self.data.keys()
-        codes = [x for x in codes if x in self.data]
-
-        created_countries = []
-        created_regions = []
-
-        for code in codes:
-            country = self.data.get(code)
-
-            try:
-                region = Region.objects.get(code=country['continent'])
-            except Region.DoesNotExist:
-                print 'Creating region: \'{}\' ({}).'.\
-                    format(country['continent'],
-                           self.get_unicode(country['continentName']))
-                region = Region.objects.create(code=country['continent'],
-                                               name=country['continentName'])
-                created_regions.append(country['continent'])
-
-            if not Country.objects.filter(code=code):
-                print 'Creating country: \'{}\' ({}).'.\
-                    format(code, self.get_unicode(country['countryName']))
-
-                Country.objects.create(code=code, name=country['countryName'],
-                                       region=region)
-                created_countries.append(code)
+        data = self.load(options['source'])
+        codes = set(args) if len(args) else set(data.keys())
+        countries = [data[x] for x in sorted(codes) if x in data]
+
+        with transaction.atomic():
+            regions = dict(Region.objects.values_list('code', 'pk'))
+            new_regions = {}
+            for country in countries:
+                code = country['continent']
+                if code not in regions and code not in new_regions:
+                    new_regions[code] = Region(
+                        code=code, name=country['continentName'])
+            Region.objects.bulk_create(new_regions.values())
+            if new_regions:
+                regions = dict(Region.objects.values_list('code', 'pk'))
+
+            existing = set(Country.objects.values_list('code', flat=True))
+            new_countries = [Country(
+                code=x['countryCode'], name=x['countryName'],
+                region_id=regions[x['continent']])
+                for x in countries if x['countryCode'] not in existing]
+            Country.objects.bulk_create(new_countries)
+
+        if int(options['verbosity']) > 1:
+            for obj in list(new_regions.values()) + new_countries:
+                print 'Created {}: \'{}\' ({}).'.format(
+                    obj._meta.model_name, obj.code, obj.name).encode('utf-8')
 
         print 'Done! Created {} countries, and {} regions.'.\
-            format(len(created_countries), len(created_regions))
+            format(len(new_countries), len(new_regions))
 
-    def get_unicode(self, string):
+    def load(self, source):
+        """
+        Returns countries from the dataset at `source` as a dictionary
+        keyed by country code.
+        """
         try:
-            return '{}'.format(smart_str(string))
-        except UnicodeDecodeError:
-            return 'Don\'t want to deal with unicode errors right now, sry!'
+            if source.startswith(('http://', 'https://')):
+                data = urlopen(source).read()
+            else:
+                with open(source, 'rb') as f:
+                    data = f.read()
+            data = json.loads(data.decode('utf-8')).get('geonames', None)
+        except (IOError, ValueError) as e:
+            raise CommandError('Error reading {}: {}'.format(source, e))
+        if data is None:
+            raise CommandError('Error reading {}.'.format(source))
+        return dict((x['countryCode'], x) for x in data)
@@ -1,11 +1,14 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import json
+
 from django.core.urlresolvers import reverse
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseRedirect, JsonResponse
 from django.conf.urls import url, patterns
 from django.contrib import admin
 from django.shortcuts import get_object_or_404
+from django.template.response import TemplateResponse
 from django.utils.http import urlencode
 from django.utils.translation import ugettext_lazy as _
 
@@ -23,9 +26,12 @@ from catalog.forms import (
     ModifierModelForm, CategoryModelForm, BrandModelForm,
     ManufacturerModelForm, ProductModelForm,
     ProductAttributeValueInlineFormSet, ProductAttributeValueModelForm,
-    RelatedProductModelForm, RelatedProductInlineFormSet)
+    RelatedProductModelForm, RelatedProductInlineFormSet, GenerateVariantsForm,
+    get_attribute_kinds_map)
 
-from catalog.filters import ProductParentListFilter
+from catalog.filters import (
+    ProductParentListFilter, get_product_names, search_groups)
+from catalog.variants import generate_variants
 from catalog.utils import slug_num_suffix
 from catalog import settings as scs
 
@@ -111,8 +117,12 @@ class CategoryAdminBase(
             }),
         )
 
+    def get_queryset(self, request):
+        queryset = super(CategoryAdminBase, self).get_queryset(request)
+        return queryset.prefetch_related('translations')
+
     def get_name(self, obj):
-        dashes = '---' * obj.get_ancestors().count()
+        dashes = '---' * obj.level
         return '{} {}'.format(dashes, obj.get_name())
     get_name.short_description = _('Name')
 
@@ -189,6 +199,8 @@ class ProductAdmin(
         ProductFlagInline, ProductMeasurementInline,
         ProductAttributeValueInline, RelatedProductInline)
 
+    actions = ['generate_variants']
+
     def __init__(self, *args, **kwargs):
         super(ProductAdmin, self).__init__(*args, **kwargs)
         self.prepopulated_fields = {'slug': ('name', )}
@@ -230,9 +242,28 @@ class ProductAdmin(
             url(r'^(?P<pk>\d+)/add_variant/$',
                 self.admin_site.admin_view(self.add_variant),
                 name='catalog_product_add_variant'),
+            url(r'^parent_lookup/$',
+                self.admin_site.admin_view(self.parent_lookup),
+                name='catalog_product_parent_lookup'),
         )
         return product_urls + urls
 
+    def get_queryset(self, request):
+        """
+        Fetches parent and tax of products with their translations up
+        front, so that inherited prices and names are not queried per row.
+        """
+        queryset = super(ProductAdmin, self).get_queryset(request)
+        return queryset.select_related(
+            'parent', 'parent__tax', 'tax').prefetch_related(
+            'translations')
+
+    def render_change_form(self, request, context, *args, **kwargs):
+        context['attribute_kinds_map'] = json.dumps(
+            get_attribute_kinds_map())
+        return super(ProductAdmin, self).render_change_form(
+            request, context, *args, **kwargs)
+
     def get_categorization_list_filter(self):
         list_filter = ()
         if scs.HAS_CATEGORIES:
@@ -308,6 +339,46 @@ class ProductAdmin(
         return HttpResponseRedirect('{}?{}'.format(
             reverse('admin:catalog_product_add'), urlencode(data)))
 
+    def parent_lookup(self, request):
+        """
+        Returns group products matching the 'q' parameter as JSON, used
+        for autocomplete in the parent list filter.
+        """
+        query = request.GET.get('q', '').strip()
+        groups = search_groups(query, limit=20) if query else \
+            Product.objects.none()
+        return JsonResponse({'results': [
+            {'id': pk, 'name': name} for pk, name in get_product_names(
+                groups)]})
+
+    def generate_variants(self, request, queryset):
+        """
+        Generates variants of the selected products for all combinations
+        of the attribute options picked on an intermediate page.
+        """
+        form = GenerateVariantsForm(
+            request.POST if 'apply' in request.POST else None)
+        if form.is_valid():
+            count = 0
+            for product in queryset.filter(parent__isnull=True):
+                count += len(generate_variants(
+                    product, form.cleaned_data['options']))
+            self.message_user(
+                request, _('%d variants generated.') % count)
+            return None
+
+        context = dict(
+            title=_('Generate variants'),
+            form=form,
+            queryset=queryset,
+            opts=self.model._meta,
+            action_checkbox_name=admin.ACTION_CHECKBOX_NAME,
+        )
+        return TemplateResponse(
+            request, scs.GENERATE_VARIANTS_TEMPLATE, context,
+            current_app=self.admin_site.name)
+    generate_variants.short_description = _('Generate variants')
+
 
 class AttributeOptionInline(TranslatableTabularInline):
     model = AttributeOption
@@ -6,24 +6,70 @@ from django.contrib.admin import SimpleListFilter
 from django.utils.translation import ugettext_lazy as _
 
 from catalog.models import Product
+from catalog.utils import get_language_code
+from catalog import settings as scs
+
+
+def get_product_names(queryset, language_code=None):
+    """
+    Returns a list of product id and name pairs sorted by name, names are
+    fetched in a single query, falling back to any other translation.
+    """
+    language_code = get_language_code(language_code)
+    names = {}
+    for pk, code, name in queryset.values_list(
+            'pk', 'translations__language_code', 'translations__name'):
+        if pk not in names or code == language_code:
+            names[pk] = name or ''
+    return sorted(names.items(), key=lambda x: (x[1].lower(), x[0]))
+
+
+def search_groups(query, limit=None):
+    """
+    Returns a queryset of group products which id or name matches
+    the query.
+    """
+    groups = Product.objects.top_level(variant_count__gt=0)
+    lookup = Q(translations__name__icontains=query)
+    if query.isdigit():
+        lookup |= Q(pk=query)
+    pks = groups.filter(lookup).values_list('pk', flat=True).distinct()
+    if limit is not None:
+        pks = pks[:limit]
+    return groups.filter(pk__in=list(pks))
 
 
 class ProductParentListFilter(SimpleListFilter):
+    """
+    Filters products by their group. When there are more groups than
+    PRODUCT_PARENT_FILTER_LIMIT, groups are not listed and a search
+    field with autocomplete is shown instead.
+    """
     title = _('Parent')
     parameter_name = 'parent'
 
     def lookups(self, request, model_admin):
-        lookups = ()
-
-        for product in Product.objects.all():
-            if product.is_group:
-                lookups += (product.pk, product.get_name()),
+        groups = Product.objects.top_level(variant_count__gt=0)
+        if groups.count() > scs.PRODUCT_PARENT_FILTER_LIMIT:
+            self.template = scs.PRODUCT_PARENT_FILTER_TEMPLATE
+            self.params = [(k, v) for k, v in request.GET.items()
+                           if k != self.parameter_name]
+            groups = groups.none()
+            if self.value() and self.value().isdigit():
+                groups = Product.objects.filter(pk=self.value())
+        return get_product_names(groups)
 
-        return lookups
+    def has_output(self):
+        return (self.template == scs.PRODUCT_PARENT_FILTER_TEMPLATE or
+                super(ProductParentListFilter, self).has_output())
 
     def queryset(self, request, queryset):
         if self.value():
-            queryset = queryset.filter(
-                Q(pk=self.value()) | Q(parent_id=self.value()))
+            if self.value().isdigit():
+                pks = [self.value()]
+            else:
+                pks = list(search_groups(self.value()).values_list(
+                    'pk', flat=True))
+            queryset = queryset.filter(Q(pk__in=pks) | Q(parent_id__in=pks))
 
         return queryset
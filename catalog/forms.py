@@ -5,15 +5,14 @@ from django import forms
 from django.forms.models import BaseInlineFormSet
 from django.utils.translation import get_language
 from django.utils.translation import ugettext_lazy as _
-from django.utils.encoding import force_str
+from django.utils.encoding import force_str, force_text
 
 from parler.forms import TranslatableModelForm
 
 from catalog.models import (
     Modifier, ModifierCode, CartModifierCode, Category, Brand, Manufacturer,
-    Product, Attribute, ProductAttributeValue, RelatedProduct)
-
-from catalog.widgets import AttributeValueKindsMapSelect
+    Product, Attribute, AttributeOption, ProductAttributeValue, RelatedProduct,
+    get_attribute_registry)
 
 
 class CatalogModelFormBase(TranslatableModelForm):
@@ -112,10 +111,64 @@ class ProductModelForm(CatalogModelFormBase):
         return data
 
 
+def get_attribute_kinds_map():
+    """
+    Returns a map of attribute ids to their kind and ids of their
+    options, used to display the matching value field in admin.
+    """
+    registry = get_attribute_registry()
+    kinds_map = dict((pk, {'kind': registry['codes'][code]['type'],
+                           'options': []})
+                     for pk, code in registry['ids'].items())
+    for pk, attribute_id in AttributeOption.objects.order_by('pk').\
+            values_list('pk', 'attribute_id'):
+        if attribute_id in kinds_map:
+            kinds_map[attribute_id]['options'].append(pk)
+    return kinds_map
+
+
 class ProductAttributeValueInlineFormSet(BaseInlineFormSet):
     """
-    Custom formset for products attribute values.
+    Custom formset for products attribute values. Attribute and option
+    choices are loaded once and shared between all forms.
     """
+    def get_choices(self):
+        """
+        Returns a dict of attribute and option choices.
+        """
+        if not hasattr(self, '_choices'):
+            registry = get_attribute_registry()
+            ids = dict((v, k) for k, v in registry['ids'].items())
+            kinds = dict(Attribute.KIND_CHOICES)
+            options = AttributeOption.objects.order_by('pk').\
+                prefetch_related('translations')
+            self._choices = {
+                'attribute': [
+                    (ids[code], '{} ({})'.format(code, kinds[x['type']]))
+                    for code, x in registry['codes'].items()],
+                'value_option': [(x.pk, force_text(x)) for x in options],
+            }
+        return self._choices
+
+    def set_choices(self, form):
+        for name, choices in self.get_choices().items():
+            field = form.fields[name]
+            if field.empty_label is not None:
+                choices = [('', field.empty_label)] + choices
+            field.choices = choices
+
+    def _construct_form(self, i, **kwargs):
+        form = super(ProductAttributeValueInlineFormSet, self).\
+            _construct_form(i, **kwargs)
+        self.set_choices(form)
+        return form
+
+    @property
+    def empty_form(self):
+        form = super(ProductAttributeValueInlineFormSet, self).empty_form
+        self.set_choices(form)
+        return form
+
     def has_duplicates(self, instance, forms):
         """
         Returns if another variant with selected attributes
@@ -177,12 +230,11 @@ class ProductAttributeValueModelForm(forms.ModelForm):
     Creates a custom form for managing multiple attribute values
     on an inline admin.
     """
-    temp_data = ['empty', 'kinds', 'kinds_map']
+    temp_data = ['empty', 'kinds']
 
     empty = forms.CharField(required=False, label=_('Value'))
     kinds = forms.CharField(
         widget=forms.Select(choices=Attribute.KIND_CHOICES))
-    kinds_map = forms.CharField()
 
     class Meta:
         model = ProductAttributeValue
@@ -190,19 +242,17 @@ class ProductAttributeValueModelForm(forms.ModelForm):
         fields = (
             'attribute', 'empty', 'value_integer', 'value_boolean',
             'value_float', 'value_date', 'value_option', 'value_file',
-            'value_image', 'kinds', 'kinds_map')
+            'value_image', 'kinds')
 
     def __init__(self, *args, **kwargs):
         super(ProductAttributeValueModelForm, self).__init__(*args, **kwargs)
 
-        # Assign kinds_map custom widget and get it's choices.
-        self.fields['kinds_map'].widget = AttributeValueKindsMapSelect(
-            choices=self.get_kinds_map_choices())
-
-        # Set javascript event trigger on attribute change.
-        self.fields['attribute'].widget = forms.Select(
-            choices=self.fields['attribute'].choices,
+        # Set javascript event trigger on attribute change, choices are
+        # left lazy so that the formset can replace them.
+        field = self.fields['attribute']
+        field.widget = forms.Select(
             attrs={'onchange': 'shopCatalogAttrValueOnChange(event);'})
+        field.widget.choices = field.choices
 
     def clean(self):
         """
@@ -224,15 +274,6 @@ class ProductAttributeValueModelForm(forms.ModelForm):
                 self.changed_data.remove(item)
         return super(ProductAttributeValueModelForm, self).has_changed()
 
-    def get_kinds_map_choices(self):
-        """
-        Returns choices for a map of all attributes.
-        """
-        choices = ()
-        for item in Attribute.objects.all():
-            choices += (item.kind, item.pk),
-        return choices
-
 
 class RelatedProductModelForm(forms.ModelForm):
     """
@@ -284,3 +325,23 @@ class RelatedProductInlineFormSet(BaseInlineFormSet):
                 _('Related products have to be specified on a top '
                   'level product. It\'s variants will inherit the '
                   'relations automatically.'))
+
+
+class GenerateVariantsForm(forms.Form):
+    """
+    Used in admin to pick attribute options to generate variants from.
+    """
+    options = forms.ModelMultipleChoiceField(
+        queryset=AttributeOption.objects.filter(
+            attribute__kind=Attribute.KIND_OPTION).select_related(
+            'attribute').prefetch_related(
+            'translations', 'attribute__translations').order_by(
+            'attribute', 'pk'),
+        label=_('Options'),
+        help_text=_('A variant is created for every combination of the '
+                    'selected options, one option per attribute.'))
+
+    def __init__(self, *args, **kwargs):
+        super(GenerateVariantsForm, self).__init__(*args, **kwargs)
+        self.fields['options'].label_from_instance = lambda x: '{}: {}'.format(
+            x.attribute.get_name(), x.get_value())
@@ -0,0 +1,402 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import csv
+import json
+import time
+from collections import OrderedDict
+from decimal import Decimal, InvalidOperation
+from datetime import datetime
+
+from django.db import transaction
+from django.utils.text import slugify
+from django.utils.encoding import force_text
+
+from catalog.models import (
+    Category, Brand, Manufacturer, Product, Attribute, AttributeOption,
+    ProductAttributeValue, MeasurementBase, ProductMeasurement, Flag,
+    ProductFlag, ProductFlagIndex, get_attribute_registry,
+    invalidate_variations)
+from catalog.utils import get_language_code, slug_num_suffixes
+from catalog.utils.tree import rebuild_trees
+from catalog import settings as scs
+
+
+ATTRIBUTE_PREFIX = 'attr:'
+MEASUREMENT_PREFIX = 'measurement:'
+FLAG_PREFIX = 'flag:'
+
+TRUE_VALUES = ('1', 'true', 'yes', 'y', 't')
+
+
+class ProductImportError(ValueError):
+    pass
+
+
+def read_csv(fileobj):
+    """
+    Yields rows from a CSV file as dictionaries, first row is a header.
+    """
+    for row in csv.DictReader(fileobj):
+        yield dict((force_text(k), force_text(v)) for k, v in row.items()
+                   if k is not None and v is not None)
+
+
+def read_json_lines(fileobj):
+    """
+    Yields rows from a file with a JSON object on every line.
+    """
+    for line in fileobj:
+        line = line.strip()
+        if line:
+            yield dict((k, force_text(v)) for k, v in json.loads(line).items()
+                       if v is not None)
+
+
+def parse_bool(value):
+    return force_text(value).strip().lower() in TRUE_VALUES
+
+
+def parse_decimal(value):
+    try:
+        return Decimal(value) if value not in (None, '') else None
+    except InvalidOperation:
+        raise ProductImportError('Invalid number "{}".'.format(value))
+
+
+class ProductImporter(object):
+    """
+    Imports products from rows (dictionaries) in batches, using bulk
+    creates for products, translations, attribute values, measurements
+    and flags. Rows are dictionaries with product fields 'upc' (required
+    and unique), 'parent' (upc of a parent product, parents must come
+    before variants), 'name', 'slug', 'description', 'unit_price',
+    'quantity', 'discount_percent', 'active', 'category', 'brand' and
+    'manufacturer' (slugs) and with custom columns:
+
+    - 'attr:<code>' attribute value (options are matched by value),
+    - 'measurement:<kind>' value and unit separated by space (eg. 12 cm),
+    - 'flag:<code>' flag value (eg. 1, true, yes).
+
+    Existing products (matched by upc) are skipped. Every batch is
+    imported in a transaction, together with rebuilding the trees of
+    new products and products with new variants.
+    """
+    def __init__(self, language_code=None, batch_size=500):
+        self.language_code = get_language_code(language_code)
+        self.batch_size = batch_size
+
+        self.parents = {}
+        self.options = {}
+        self.groups = set()
+        self.stats = dict(rows=0, created=0, skipped=0, errors=[], seconds=0)
+
+        self.categorization = dict((x.__name__.lower(), self.get_slugs(x))
+                                   for x in (Category, Brand, Manufacturer))
+        self.attributes = get_attribute_registry(self.language_code)
+        self.attribute_ids = dict(
+            (v, k) for k, v in self.attributes['ids'].items())
+        self.flags = dict(Flag.objects.values_list('code', 'pk'))
+        self.units = dict(MeasurementBase.UNIT_CHOICES)
+        self.kinds = dict(MeasurementBase.KIND_CHOICES)
+
+    def get_slugs(self, model):
+        return dict(model._parler_meta.root_model.objects.filter(
+            language_code=self.language_code).values_list('slug', 'master_id'))
+
+    def run(self, rows):
+        """
+        Imports the given rows and returns stats, a dictionary of number
+        of rows, created and skipped products, errors and seconds.
+        """
+        start = time.time()
+        batch = []
+        for line, row in enumerate(rows, 1):
+            batch.append((line, row))
+            if len(batch) >= self.batch_size:
+                self.import_batch(batch)
+                batch = []
+        if batch:
+            self.import_batch(batch)
+
+        invalidate_variations(*self.groups)
+        self.stats['seconds'] = time.time() - start
+        return self.stats
+
+    def import_batch(self, batch):
+        self.stats['rows'] += len(batch)
+
+        upcs = [x[1].get('upc') for x in batch]
+        existing = set(Product._default_manager.filter(
+            upc__in=[x for x in upcs if x]).values_list('upc', flat=True))
+        self.load_parents(x[1]['parent'] for x in batch if x[1].get('parent'))
+
+        products, variants, pending = [], [], set()
+        for line, row in batch:
+            upc = row.get('upc')
+            if upc in existing:
+                self.stats['skipped'] += 1
+                continue
+            try:
+                data = self.parse_row(row, pending)
+            except ProductImportError as e:
+                self.stats['errors'].append((line, force_text(e)))
+                continue
+            existing.add(upc)
+            if data['parent']:
+                variants.append(data)
+            else:
+                pending.add(upc)
+                products.append(data)
+
+        with transaction.atomic():
+            self.create_products(products)
+            self.create_products(variants)
+            self.rebuild_trees(products, variants)
+
+    def load_parents(self, upcs):
+        """
+        Loads ids of top level products with the given upcs that were
+        not imported.
+        """
+        upcs = set(upcs).difference(self.parents)
+        for upc, pk, parent_id in Product._default_manager.filter(
+                upc__in=upcs).values_list('upc', 'pk', 'parent_id'):
+            if parent_id is None:
+                self.parents[upc] = pk
+
+    def parse_row(self, row, pending=()):
+        """
+        Returns a dictionary of parsed product fields, translations,
+        attribute values, measurements and flags from the given row.
+        Parent must be imported or `pending` (in the same batch).
+        """
+        if not row.get('upc'):
+            raise ProductImportError('Missing upc.')
+        if not row.get('name'):
+            raise ProductImportError('Missing name.')
+        parent = row.get('parent')
+        if parent and parent not in self.parents and parent not in pending:
+            raise ProductImportError('Unknown parent "{}".'.format(parent))
+
+        data = dict(fields=self.parse_fields(row), attrs={}, measurements={},
+                    flags={}, upc=row['upc'], parent=parent)
+        data['translation'] = dict(
+            name=row['name'],
+            slug=slugify(row.get('slug') or row['name']),
+            description=row.get('description', ''))
+
+        for key, value in row.items():
+            if value not in (None, ''):
+                self.parse_column(key, value, data)
+        return data
+
+    def parse_fields(self, row):
+        """
+        Returns a dictionary of product fields from the given row.
+        """
+        quantity = parse_decimal(row.get('quantity'))
+        fields = dict(
+            upc=row['upc'],
+            unit_price=parse_decimal(row.get('unit_price')) or Decimal('0'),
+            discount_percent=parse_decimal(row.get('discount_percent')),
+            quantity=int(quantity) if quantity is not None else None)
+        if row.get('active'):
+            fields['active'] = parse_bool(row['active'])
+
+        for name, slugs in self.categorization.items():
+            if row.get(name):
+                if row[name] not in slugs:
+                    raise ProductImportError('Unknown {} "{}".'.format(
+                        name, row[name]))
+                fields['{}_id'.format(name)] = slugs[row[name]]
+        return fields
+
+    def parse_column(self, key, value, data):
+        """
+        Parses a custom (attribute, measurement or flag) column into
+        the given row data.
+        """
+        if key.startswith(ATTRIBUTE_PREFIX):
+            code = key[len(ATTRIBUTE_PREFIX):]
+            data['attrs'][code] = self.parse_attribute(code, value)
+        elif key.startswith(MEASUREMENT_PREFIX):
+            kind = key[len(MEASUREMENT_PREFIX):]
+            data['measurements'][kind] = self.parse_measurement(kind, value)
+        elif key.startswith(FLAG_PREFIX):
+            code = key[len(FLAG_PREFIX):]
+            if code not in self.flags:
+                raise ProductImportError('Unknown flag "{}".'.format(code))
+            data['flags'][self.flags[code]] = parse_bool(value)
+
+    def parse_attribute(self, code, value):
+        """
+        Returns a tuple of attribute id, field name and a parsed value.
+        """
+        attribute = self.attributes['codes'].get(code)
+        if attribute is None:
+            raise ProductImportError('Unknown attribute "{}".'.format(code))
+
+        attribute_id = self.attribute_ids[code]
+        kind = attribute['type']
+        try:
+            if kind == Attribute.KIND_INTEGER:
+                value = int(value)
+            elif kind == Attribute.KIND_FLOAT:
+                value = float(value)
+            elif kind == Attribute.KIND_BOOLEAN:
+                value = parse_bool(value)
+            elif kind == Attribute.KIND_DATE:
+                value = datetime.strptime(
+                    value, scs.DATE_INPUT_FOMRAT).date()
+            elif kind == Attribute.KIND_OPTION:
+                return attribute_id, 'value_option_id', self.get_option(
+                    attribute_id, value)
+            else:
+                raise ProductImportError(
+                    'Attribute "{}" of type "{}" can\'t be imported.'.format(
+                        code, kind))
+        except ProductImportError:
+            raise
+        except (TypeError, ValueError):
+            raise ProductImportError(
+                'Invalid value "{}" for attribute "{}".'.format(value, code))
+        return attribute_id, 'value_{}'.format(kind), value
+
+    def get_option(self, attribute_id, value):
+        """
+        Returns an id of option with the given value, creating it if
+        it doesn't exist.
+        """
+        if attribute_id not in self.options:
+            self.options[attribute_id] = dict(
+                AttributeOption._parler_meta.root_model.objects.filter(
+                    language_code=self.language_code,
+                    master__attribute_id=attribute_id).values_list(
+                    'value', 'master_id'))
+
+        options = self.options[attribute_id]
+        if value not in options:
+            options[value] = AttributeOption.objects.language(
+                self.language_code).create(
+                attribute_id=attribute_id, value=value).pk
+        return options[value]
+
+    def parse_measurement(self, kind, value):
+        """
+        Returns a tuple of value and unit from eg. '12 cm'.
+        """
+        if kind not in self.kinds:
+            raise ProductImportError('Unknown measurement "{}".'.format(kind))
+        try:
+            value, unit = value.split()
+        except ValueError:
+            raise ProductImportError('Invalid measurement "{}".'.format(value))
+        if unit not in self.units:
+            raise ProductImportError('Unknown unit "{}".'.format(unit))
+        return parse_decimal(value), unit
+
+    def create_products(self, items):
+        """
+        Creates products from the parsed items, with their translations,
+        attribute values, measurements and flags.
+        """
+        if not items:
+            return
+
+        # Position in tree is set once the trees get rebuilt.
+        objs = [Product(tree_id=0, level=0, lft=0, rght=0, **x['fields'])
+                for x in items]
+        for item, obj in zip(items, objs):
+            if item['parent']:
+                obj.parent_id = self.parents[item['parent']]
+                obj.level = 1
+                self.groups.add(obj.parent_id)
+        Product._default_manager.bulk_create(objs)
+
+        pks = dict(Product._default_manager.filter(
+            upc__in=[x['upc'] for x in items]).values_list('upc', 'pk'))
+        for item in items:
+            if not item['parent']:
+                self.parents[item['upc']] = pks[item['upc']]
+
+        self.create_translations(items, pks)
+        self.create_values(items, pks)
+
+        Product.objects.update_variant_count(
+            set(x.parent_id for x in objs if x.parent_id))
+        Product.objects.update_stock(pks.values())
+        self.stats['created'] += len(items)
+
+    def create_values(self, items, pks):
+        """
+        Bulk creates attribute values, measurements and flags of the
+        created products.
+        """
+        values, measurements, flags = [], [], []
+        for item in items:
+            pk = pks[item['upc']]
+            for attribute_id, field, value in item['attrs'].values():
+                values.append(ProductAttributeValue(**{
+                    'product_id': pk, 'attribute_id': attribute_id,
+                    field: value}))
+            for kind, (value, unit) in item['measurements'].items():
+                measurements.append(ProductMeasurement(
+                    product_id=pk, kind=kind, value=value, unit=unit,
+                    standard_value=MeasurementBase.to_standard(value, unit)))
+            for flag_id, is_true in item['flags'].items():
+                flags.append(ProductFlag(
+                    product_id=pk, flag_id=flag_id, is_true=is_true))
+
+        ProductAttributeValue.objects.bulk_create(values)
+        ProductMeasurement.objects.bulk_create(measurements)
+        ProductFlag.objects.bulk_create(flags)
+
+        if values:
+            ProductAttributeValue.update_texts(
+                ProductAttributeValue.objects.filter(
+                    product__in=pks.values()).select_related('attribute'))
+        if flags or any(x['parent'] for x in items):
+            ProductFlagIndex.objects.rebuild(pks.values())
+
+    def create_translations(self, items, pks):
+        """
+        Bulk creates translations, making sure that slugs are unique.
+        Taken slugs get a number suffix, allocated once per slug.
+        """
+        translation_model = Product._parler_meta.root_model
+        slugs = [x['translation']['slug'] for x in items]
+        existing = set(translation_model.objects.filter(
+            language_code=self.language_code, slug__in=slugs).values_list(
+            'slug', flat=True))
+
+        taken = OrderedDict()
+        for item in items:
+            slug = item['translation']['slug']
+            if slug in existing:
+                taken.setdefault(slug, []).append(item)
+            existing.add(slug)
+
+        for slug, taken_items in taken.items():
+            nums = slug_num_suffixes(
+                slug, Product.objects.language(self.language_code),
+                len(taken_items), exclude=existing)
+            for item, num in zip(taken_items, nums):
+                item['translation']['slug'] = '{}-{}'.format(slug, num)
+                existing.add(item['translation']['slug'])
+
+        translation_model.objects.bulk_create([translation_model(
+            master_id=pks[x['upc']], language_code=self.language_code,
+            name=x['translation']['name'], slug=x['translation']['slug'],
+            description=x['translation']['description']) for x in items])
+
+    def rebuild_trees(self, products, variants):
+        """
+        Places the created products in new trees and their variants in
+        the trees of their parents.
+        """
+        if not products and not variants:
+            return
+        parent_ids = set(self.parents[x['parent']] for x in variants)
+        rebuild_trees(Product, Product._default_manager.filter(
+            pk__in=parent_ids).values_list('tree_id', flat=True))
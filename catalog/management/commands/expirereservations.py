@@ -0,0 +1,14 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management.base import NoArgsCommand
+
+from catalog.models import StockReservation
+
+
+class Command(NoArgsCommand):
+    help = 'Deletes expired stock reservations, run it periodically.'
+
+    def handle_noargs(self, **options):
+        count = StockReservation.objects.expire()
+        print 'Deleted {} expired stock reservations.'.format(count)
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+from optparse import make_option
+
+from django.core.management.base import CommandError, BaseCommand
+
+from catalog.importers import ProductImporter, read_csv, read_json_lines
+
+
+class Command(BaseCommand):
+    help = 'Imports products from a CSV or a JSON lines file.'
+    args = '<path>'
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--format', dest='format', default=None,
+            help='File format, "csv" or "jsonl" (guessed from extension).'),
+        make_option(
+            '--language', dest='language', default=None,
+            help='Language code of the translated values.'),
+        make_option(
+            '--batch-size', type='int', dest='batch_size', default=500,
+            help='Number of rows created at once.'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Specify a path of the file to import.')
+
+        path = args[0]
+        fmt = options['format'] or os.path.splitext(path)[1].lstrip('.')
+        readers = {'csv': read_csv, 'jsonl': read_json_lines,
+                   'json': read_json_lines}
+        if fmt not in readers:
+            raise CommandError('Unknown format \'{}\'.'.format(fmt))
+
+        importer = ProductImporter(
+            language_code=options['language'],
+            batch_size=options['batch_size'])
+        with open(path, 'rb') as f:
+            stats = importer.run(readers[fmt](f))
+
+        for line, error in stats['errors']:
+            print 'Line {}: {}'.format(line, error)
+
+        print 'Imported {} products ({} skipped, {} errors) from {} rows ' \
+            'in {:.1f}s, {:.0f} rows/s.'.format(
+                stats['created'], stats['skipped'], len(stats['errors']),
+                stats['rows'], stats['seconds'],
+                stats['rows'] / (stats['seconds'] or 1))
@@ -1,16 +1,20 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from datetime import datetime
+from datetime import datetime, timedelta
 
-from django.db.models import Q
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Q, F, Sum, Count
 from django.db.models import Manager
 from django.db.models.query import QuerySet
+from django.utils import timezone
+from django.utils.encoding import force_str
 from django.utils.translation import get_language
 
 from parler.managers import TranslatableManager, TranslatableQuerySet
 
-from catalog.utils import round_2
+from catalog.utils import get_language_code, round_2
 from catalog import settings as scs
 
 
@@ -69,9 +73,35 @@ class ProductQuerySet(CatalogQuerySet):
     def top_level(self, **kwargs):
         return self.filter(parent_id=None, **kwargs)
 
+    def in_stock(self, **kwargs):
+        """
+        Returns products in stock, groups are in stock when any of it's
+        active variants is (see 'update_stock').
+        """
+        return self.filter(has_stock=True, **kwargs)
+
+    def with_attrs(self, **kwargs):
+        """
+        Returns products that have all of the given attribute code and
+        value pairs, matched against the attribute value texts.
+        """
+        queryset = self
+        language_code = get_language_code()
+        for code, value in kwargs.items():
+            queryset = queryset.filter(
+                attribute_values__attribute__code=code,
+                attribute_values__texts__language_code=language_code,
+                attribute_values__texts__text=force_str(value))
+        return queryset
+
     def filter_attrs(self, **kwargs):
-        pks = [x.pk for x in self if x.filter_variants(**kwargs) is not None]
-        return self.filter(pk__in=pks)
+        """
+        Returns group products that have at least one variant matching
+        the given attributes.
+        """
+        kwargs = dict((k, v) for k, v in kwargs.items() if v is not None)
+        variants = self.model._default_manager.all().with_attrs(**kwargs)
+        return self.filter(pk__in=variants.values('parent'))
 
     def filter_price(self, price_from=None, price_to=None):
         filters = {}
@@ -99,6 +129,96 @@ class ProductQuerySet(CatalogQuerySet):
             pass
         return self.filter(**filters)
 
+    def get_measurement_model(self):
+        return self.model._meta.get_field_by_name('measurements')[0].model
+
+    def with_flags(self, **kwargs):
+        """
+        Filters products by their effective flags, eg. 'with_flags(
+        new=True, on_sale=False)' returns products that are flagged as
+        new and are not flagged as on sale.
+        """
+        index_model = self.model._meta.get_field_by_name(
+            'flag_index')[0].model
+        queryset = self
+        for code, is_true in kwargs.items():
+            pks = index_model.objects.filter(
+                code=code, is_true=True).values('product')
+            if is_true:
+                queryset = queryset.filter(pk__in=pks)
+            else:
+                queryset = queryset.exclude(pk__in=pks)
+        return queryset
+
+    def filter_measurements(self, kind, min_value=None, max_value=None,
+                            unit=None):
+        """
+        Filters products by a measurement of the given kind, values are
+        in the given unit (standard unit by default). Variants inherit
+        their parents measurement unless they define their own, and
+        group products match when any of their variants match.
+        """
+        model = self.get_measurement_model()
+        unit = unit or model.get_standard_unit(kind)
+
+        filters = {}
+        for lookup, value in [('gte', min_value), ('lte', max_value)]:
+            try:
+                value = model.to_standard(float(value), unit)
+            except (TypeError, ValueError):
+                continue
+            if value is not None:
+                filters['standard_value__{}'.format(lookup)] = value
+        if not filters:
+            return self
+
+        kind_pks = model.objects.filter(kind=kind).values('product')
+        matching_pks = model.objects.filter(
+            kind=kind, **filters).values('product')
+
+        matches = Q(pk__in=matching_pks) | (
+            Q(parent__in=matching_pks) & ~Q(pk__in=kind_pks))
+        variants = self.model._default_manager.filter(parent__isnull=False)
+        # Group products only match through their variants.
+        return self.filter(
+            (matches & ~Q(pk__in=variants.values('parent'))) |
+            Q(pk__in=variants.filter(matches).values('parent')))
+
+    def order_by_measurement(self, kind, descending=False):
+        """
+        Orders products by a measurement of the given kind. Variants
+        inherit their parents measurement, group products without a
+        measurement use the smallest (largest when descending) one of
+        their variants.
+        """
+        qn = connection.ops.quote_name
+        opts = self.model._meta
+        measurement_opts = self.get_measurement_model()._meta
+        aggregate = 'MAX' if descending else 'MIN'
+
+        sql = (
+            'COALESCE('
+            '(SELECT m.{value} FROM {measurements} m '
+            'WHERE m.{product} = {table}.{pk} AND m.{kind} = %s), '
+            '(SELECT m.{value} FROM {measurements} m '
+            'WHERE m.{product} = {table}.{parent} AND m.{kind} = %s), '
+            '(SELECT {aggregate}(m.{value}) FROM {measurements} m '
+            'INNER JOIN {table} v ON m.{product} = v.{pk} '
+            'WHERE v.{parent} = {table}.{pk} AND m.{kind} = %s))').format(
+            measurements=qn(measurement_opts.db_table),
+            table=qn(opts.db_table),
+            pk=qn(opts.pk.column),
+            parent=qn(opts.get_field('parent').column),
+            product=qn(measurement_opts.get_field('product').column),
+            kind=qn(measurement_opts.get_field('kind').column),
+            value=qn(measurement_opts.get_field('standard_value').column),
+            aggregate=aggregate)
+
+        name = 'measurement_{}'.format(kind)
+        return self.extra(
+            select={name: sql}, select_params=[kind, kind, kind],
+            order_by=['{}{}'.format('-' if descending else '', name)])
+
 
 class ProductTranslationQuerySet(TranslatableQuerySet, ProductQuerySet):
     pass
@@ -112,3 +232,305 @@ class ProductManager(CatalogManager):
 
     def top_level(self, language_code=None, **kwargs):
         return self.get_queryset().top_level(**kwargs)
+
+    def in_stock(self, **kwargs):
+        return self.get_queryset().in_stock(**kwargs)
+
+    def decrement_stock(self, quantities, cart=None):
+        """
+        Decrements quantity of products from a dictionary of product ids
+        and quantities. Product rows are locked (in order of their ids)
+        and decremented with a conditional update, products with no
+        quantity set are skipped. Quantities reserved by carts other than
+        the given one are kept. Raises `InsufficientStock` and changes
+        nothing if any of the products doesn't have enough stock.
+        """
+        quantities = dict((k, v) for k, v in quantities.items() if v)
+        reservations = self.model.stock_reservations.related.model
+        with transaction.atomic():
+            stock = dict(self.model._default_manager.select_for_update().
+                         filter(pk__in=quantities.keys()).order_by('pk').
+                         values_list('pk', 'quantity'))
+            reserved = reservations.objects.get_reserved(
+                [x for x in stock if stock[x] is not None], exclude_cart=cart)
+            short = []
+            for pk in sorted(stock):
+                if stock[pk] is None:
+                    continue
+                updated = self.model._default_manager.filter(
+                    pk=pk, quantity__gte=quantities[pk] + reserved.get(pk, 0),
+                ).update(quantity=F('quantity') - quantities[pk])
+                if not updated:
+                    short.append(pk)
+            if short:
+                raise InsufficientStock(short)
+            self.update_stock(stock.keys())
+
+    def increment_stock(self, quantities):
+        """
+        Returns quantity of products from a dictionary of product ids and
+        quantities back to stock, products with no quantity set are
+        skipped.
+        """
+        quantities = dict((k, v) for k, v in quantities.items() if v)
+        with transaction.atomic():
+            for pk in sorted(quantities):
+                self.model._default_manager.filter(
+                    pk=pk, quantity__isnull=False).update(
+                    quantity=F('quantity') + quantities[pk])
+            self.update_stock(quantities.keys())
+
+    def update_variant_count(self, product_ids):
+        """
+        Updates denormalized 'variant_count' of the given products from
+        a single aggregate query. Returns a dictionary of the counts.
+        """
+        product_ids = set(product_ids)
+        if not product_ids:
+            return {}
+        queryset = self.model._default_manager.all()
+        counts = dict((x, 0) for x in product_ids)
+        counts.update(dict(queryset.filter(parent__in=product_ids).values_list(
+            'parent').annotate(Count('pk'))))
+
+        by_count = {}
+        for pk, count in counts.items():
+            by_count.setdefault(count, []).append(pk)
+        for count, pks in by_count.items():
+            queryset.filter(pk__in=pks).exclude(variant_count=count).update(
+                variant_count=count)
+        return counts
+
+    def update_stock(self, product_ids):
+        """
+        Updates denormalized 'has_stock' flag of the given products and
+        their parents. A product has stock when it's quantity is not set
+        or is positive, a group when any of it's active variants does.
+        Cached related products that include changed products are
+        invalidated.
+        """
+        product_ids = set(product_ids)
+        if not product_ids:
+            return
+        queryset = self.model._default_manager.all()
+        parent_ids = set(queryset.filter(pk__in=product_ids).exclude(
+            parent=None).values_list('parent_id', flat=True))
+        ids = product_ids | parent_ids
+
+        rows = list(queryset.filter(Q(pk__in=ids) | Q(parent__in=ids)).
+                    values_list('pk', 'parent_id', 'quantity', 'active',
+                                'has_stock'))
+        current = dict((x[0], x[4]) for x in rows if x[0] in ids)
+        has_stock = dict((x[0], x[2] is None or x[2] > 0) for x in rows)
+        groups = set(x[1] for x in rows if x[1])
+        has_stock.update(dict((x, False) for x in groups))
+        for pk, parent_id, quantity, active, old in rows:
+            if parent_id and active and (quantity is None or quantity > 0):
+                has_stock[parent_id] = True
+
+        changed = [x for x in current if current[x] != has_stock[x]]
+        for value in (True, False):
+            pks = [x for x in changed if has_stock[x] is value]
+            if pks:
+                queryset.filter(pk__in=pks).update(has_stock=value)
+
+        if changed:
+            related = self.model.related_products.related.model
+            base_ids = related.objects.filter(product__in=changed).\
+                values_list('base_product_id', flat=True).distinct()
+            cache.delete_many(
+                [get_related_products_cache_key(x) for x in base_ids])
+
+
+class InsufficientStock(Exception):
+    """
+    Raised when products don't have enough stock, `product_ids` holds
+    ids of those products.
+    """
+    def __init__(self, product_ids):
+        self.product_ids = list(product_ids)
+        super(InsufficientStock, self).__init__(
+            'Insufficient stock for products: {}'.format(
+                ', '.join(force_str(x) for x in self.product_ids)))
+
+
+class ProductFlagIndexManager(Manager):
+    """
+    Manages effective flags of products.
+    """
+    def rebuild(self, product_ids):
+        """
+        Rebuilds effective flags of the given products and their
+        variants. Variants inherit flags from their parent unless they
+        define the same flag themselves.
+        """
+        product_model = self.model._meta.get_field('product').rel.to
+        flag_model = product_model._meta.get_field_by_name('flags')[0].model
+
+        product_ids = set(product_ids)
+        products = dict(product_model._default_manager.filter(
+            Q(pk__in=product_ids) | Q(parent__in=product_ids)).
+            values_list('pk', 'parent_id'))
+        ids = set(products.keys()) | set(x for x in products.values() if x)
+
+        flags = {}
+        for product_id, flag_id, code, is_true in flag_model.objects.filter(
+                product__in=ids).values_list(
+                'product_id', 'flag_id', 'flag__code', 'is_true'):
+            flags.setdefault(product_id, {})[flag_id] = (code, is_true)
+
+        objs = []
+        for product_id, parent_id in products.items():
+            effective = dict(
+                (k, v + (True, )) for k, v in flags.get(parent_id, {}).items())
+            effective.update(dict(
+                (k, v + (False, )) for k, v in flags.get(
+                    product_id, {}).items()))
+            for flag_id, (code, is_true, is_inherited) in effective.items():
+                objs.append(self.model(
+                    product_id=product_id, flag_id=flag_id, code=code,
+                    is_true=is_true, is_inherited=is_inherited))
+
+        self.filter(product__in=products.keys()).delete()
+        self.bulk_create(objs)
+
+
+def get_related_products_cache_key(product_id):
+    return 'catalog_related_products_{}'.format(product_id)
+
+
+class RelatedProductManager(Manager):
+    """
+    Adds bulk loading of related products.
+    """
+    def get_related_ids(self, product_ids):
+        """
+        Returns a dictionary of active and available related product
+        ids grouped by kind, for each of the given base products.
+        Results are cached per base product.
+        """
+        product_ids = set(product_ids)
+        keys = dict((get_related_products_cache_key(x), x)
+                    for x in product_ids)
+        related = dict(
+            (keys[k], v) for k, v in cache.get_many(keys.keys()).items())
+
+        missing = product_ids.difference(related.keys())
+        if missing:
+            for x in missing:
+                related[x] = {}
+            queryset = self.filter(
+                Q(product__quantity__isnull=True) | Q(product__quantity__gt=0),
+                base_product__in=missing, product__active=True).order_by('pk')
+            for base_id, kind, product_id in queryset.values_list(
+                    'base_product_id', 'kind', 'product_id'):
+                related[base_id].setdefault(kind, []).append(product_id)
+            cache.set_many(dict(
+                (get_related_products_cache_key(x), related[x])
+                for x in missing), scs.CACHE_TIMEOUT)
+        return related
+
+    def for_products(self, products):
+        """
+        Returns a dictionary of related products grouped by kind (as in
+        RELATED_PRODUCT_KIND_CHOICES) for each of the given products.
+        Variants use related products of their parent.
+        """
+        products = list(products)
+        base_ids = dict((x.pk, x.parent_id or x.pk) for x in products)
+        related = self.get_related_ids(base_ids.values())
+
+        product_model = self.model._meta.get_field('product').rel.to
+        ids = set(x for y in related.values() for z in y.values() for x in z)
+        objs = product_model._default_manager.filter(pk__in=ids).\
+            prefetch_related('translations')
+        objs = dict((x.pk, x) for x in objs)
+
+        data = {}
+        for pk, base_id in base_ids.items():
+            data[pk] = dict((kind, {
+                'name': force_str(name),
+                'products': [objs[x] for x in related[base_id].get(kind, [])
+                             if x in objs],
+            }) for kind, name in scs.RELATED_PRODUCT_KIND_CHOICES)
+        return data
+
+
+class StockReservationManager(Manager):
+    """
+    Holds product quantities for carts for a limited time, see
+    STOCK_RESERVATION_TIMEOUT setting.
+    """
+    def active(self, **kwargs):
+        return self.filter(expires__gt=timezone.now(), **kwargs)
+
+    def get_reserved(self, product_ids, exclude_cart=None):
+        """
+        Returns a dictionary of reserved quantities for the given product
+        ids, optionally excluding reservations of a cart. Reads without
+        locking, a single aggregate query.
+        """
+        queryset = self.active(product__in=product_ids)
+        if exclude_cart is not None:
+            queryset = queryset.exclude(cart=exclude_cart)
+        return dict(queryset.values_list('product').annotate(Sum('quantity')))
+
+    def reserve(self, cart, product, quantity, partial=False):
+        """
+        Reserves (or updates a reservation of) product quantity for the
+        cart and extends it's expiry, cart and product can be given as
+        objects or ids. Product row is locked while checking availability.
+        Raises `InsufficientStock` when there's not enough quantity left
+        for an increased reservation, with `partial` the quantity that's
+        left is reserved instead. Returns expiry of the reservation, or
+        None if product quantity is not tracked or nothing is reserved.
+        """
+        product_model = self.model._meta.get_field('product').rel.to
+        product_id = getattr(product, 'pk', product)
+        with transaction.atomic():
+            stock = list(product_model._default_manager.select_for_update().
+                         filter(pk=product_id).values_list(
+                         'quantity', flat=True))
+            if stock and stock[0] is not None and quantity > 0:
+                reserved = self.get_reserved(
+                    [product_id], exclude_cart=cart).get(product_id, 0)
+                held = sum(self.active(cart=cart, product=product_id).
+                           values_list('quantity', flat=True))
+                available = max(stock[0] - reserved, 0)
+                if quantity > held and available < quantity:
+                    if not partial:
+                        raise InsufficientStock([product_id])
+                    quantity = max(available, held)
+
+            if not stock or stock[0] is None or quantity <= 0:
+                self.filter(cart=cart, product=product_id).delete()
+                return None
+
+            expires = timezone.now() + timedelta(
+                seconds=scs.STOCK_RESERVATION_TIMEOUT)
+            updated = self.filter(cart=cart, product=product_id).update(
+                quantity=quantity, expires=expires)
+            if not updated:
+                self.create(cart_id=getattr(cart, 'pk', cart),
+                            product_id=product_id, quantity=quantity,
+                            expires=expires)
+            return expires
+
+    def release(self, cart, product_ids=None):
+        """
+        Removes reservations of the cart, optionally only for the given
+        product ids.
+        """
+        queryset = self.filter(cart=cart)
+        if product_ids is not None:
+            queryset = queryset.filter(product__in=product_ids)
+        queryset.delete()
+
+    def expire(self):
+        """
+        Deletes expired reservations in bulk and returns their number.
+        """
+        queryset = self.filter(expires__lte=timezone.now())
+        count = queryset.count()
+        queryset.delete()
+        return count
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import models, migrations
+from django.utils.encoding import force_text
+
+from parler import appsettings
+
+
+def get_text(value):
+    """
+    Returns a text of the historical attribute value for non option
+    attributes, mirrors AttributeValueBase.value.
+    """
+    kind = value.attribute.kind
+    if kind in ('file', 'image'):
+        obj = getattr(value, 'value_{}'.format(kind))
+        return obj.file.url if obj else None
+    return getattr(value, 'value_{}'.format(kind), None)
+
+
+def create_texts(apps, schema_editor):
+    ProductAttributeValue = apps.get_model('catalog', 'ProductAttributeValue')
+    AttributeOptionTranslation = apps.get_model(
+        'catalog', 'AttributeOptionTranslation')
+    AttributeValueText = apps.get_model('catalog', 'AttributeValueText')
+
+    options = {}
+    for option_id, language_code, text in AttributeOptionTranslation.\
+            objects.values_list('master_id', 'language_code', 'value'):
+        options.setdefault(option_id, {})[language_code] = text
+
+    languages = [x[0] for x in settings.LANGUAGES]
+    values = ProductAttributeValue.objects.select_related(
+        'attribute', 'value_file', 'value_image')
+
+    texts = []
+    for value in values.iterator():
+        for language_code in languages:
+            if value.attribute.kind == 'option':
+                translations = options.get(value.value_option_id, {})
+                fallback = appsettings.PARLER_LANGUAGES.\
+                    get_fallback_language(language_code)
+                text = translations.get(
+                    language_code, translations.get(fallback))
+            else:
+                text = get_text(value)
+            if text is not None:
+                texts.append(AttributeValueText(
+                    value=value, language_code=language_code,
+                    text=force_text(text)[:255]))
+    AttributeValueText.objects.bulk_create(texts, batch_size=500)
+
+
+def delete_texts(apps, schema_editor):
+    AttributeValueText = apps.get_model('catalog', 'AttributeValueText')
+    AttributeValueText.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttributeValueText',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('language_code', models.CharField(max_length=15, db_index=True)),
+                ('text', models.CharField(max_length=255)),
+                ('value', models.ForeignKey(related_name='texts', editable=False, to='catalog.ProductAttributeValue')),
+            ],
+            options={
+                'db_table': 'catalog_product_attribute_value_texts',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='attributevaluetext',
+            unique_together=set([('value', 'language_code')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='attributevaluetext',
+            index_together=set([('language_code', 'text')]),
+        ),
+        migrations.RunPython(create_texts, delete_texts),
+    ]
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.db.models import F
+
+from measurement.measures import Distance, Weight
+
+
+def get_standard_factor(unit):
+    """
+    Returns the number a value in the given unit is multiplied by to
+    convert it into the standard unit of it's measure.
+    """
+    for measure in (Distance, Weight):
+        try:
+            value = measure(**{unit: 1})
+        except AttributeError:
+            continue
+        return float(getattr(value, measure.STANDARD_UNIT))
+    return None
+
+
+def set_standard_values(apps, schema_editor):
+    ProductMeasurement = apps.get_model('catalog', 'ProductMeasurement')
+    units = ProductMeasurement.objects.values_list(
+        'unit', flat=True).distinct()
+    for unit in list(units):
+        factor = get_standard_factor(unit)
+        if factor is not None:
+            ProductMeasurement.objects.filter(unit=unit).update(
+                standard_value=F('value') * factor)
+
+
+def unset_standard_values(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0002_attribute_value_texts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productmeasurement',
+            name='standard_value',
+            field=models.FloatField(help_text='Value converted into the standard unit, used for filtering and sorting.', verbose_name='Standard value', null=True, editable=False, blank=True),
+            preserve_default=True,
+        ),
+        migrations.AlterIndexTogether(
+            name='productmeasurement',
+            index_together=set([('kind', 'standard_value')]),
+        ),
+        migrations.RunPython(
+            set_standard_values, unset_standard_values),
+    ]
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def build_flag_index(apps, schema_editor):
+    Product = apps.get_model('catalog', 'Product')
+    ProductFlag = apps.get_model('catalog', 'ProductFlag')
+    ProductFlagIndex = apps.get_model('catalog', 'ProductFlagIndex')
+
+    flags = {}
+    for product_id, flag_id, code, is_true in ProductFlag.objects.\
+            values_list('product_id', 'flag_id', 'flag__code', 'is_true'):
+        flags.setdefault(product_id, {})[flag_id] = (code, is_true)
+
+    objs = []
+    for product_id, parent_id in Product.objects.values_list('pk', 'parent'):
+        effective = dict(
+            (k, v + (True, )) for k, v in flags.get(parent_id, {}).items())
+        effective.update(dict(
+            (k, v + (False, )) for k, v in flags.get(product_id, {}).items()))
+        for flag_id, (code, is_true, is_inherited) in effective.items():
+            objs.append(ProductFlagIndex(
+                product_id=product_id, flag_id=flag_id, code=code,
+                is_true=is_true, is_inherited=is_inherited))
+    ProductFlagIndex.objects.bulk_create(objs, batch_size=500)
+
+
+def delete_flag_index(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0003_measurement_standard_value'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductFlagIndex',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('code', models.CharField(max_length=123, editable=False)),
+                ('is_true', models.BooleanField(default=True, editable=False)),
+                ('is_inherited', models.BooleanField(default=False, editable=False)),
+                ('flag', models.ForeignKey(related_name='+', editable=False, to='catalog.Flag')),
+                ('product', models.ForeignKey(related_name='flag_index', editable=False, to='catalog.Product')),
+            ],
+            options={
+                'db_table': 'catalog_product_flag_index',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='productflagindex',
+            unique_together=set([('product', 'flag')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='productflagindex',
+            index_together=set([('code', 'is_true')]),
+        ),
+        migrations.RunPython(build_flag_index, delete_flag_index),
+    ]
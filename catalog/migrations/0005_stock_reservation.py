@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '__first__'),
+        ('catalog', '0004_product_flag_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('quantity', models.PositiveIntegerField(verbose_name='Quantity')),
+                ('expires', models.DateTimeField(verbose_name='Expires', db_index=True)),
+                ('cart', models.ForeignKey(related_name='+', editable=False, to='shop.Cart')),
+                ('product', models.ForeignKey(related_name='stock_reservations', verbose_name='Product', to='catalog.Product')),
+            ],
+            options={
+                'db_table': 'catalog_stock_reservations',
+                'verbose_name': 'Stock reservation',
+                'verbose_name_plural': 'Stock reservations',
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterUniqueTogether(
+            name='stockreservation',
+            unique_together=set([('product', 'cart')]),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.db.models import Q
+
+
+def set_has_stock(apps, schema_editor):
+    Product = apps.get_model('catalog', 'Product')
+    in_stock = Q(quantity__isnull=True) | Q(quantity__gt=0)
+    Product.objects.exclude(in_stock).update(has_stock=False)
+
+    # Groups are in stock when any of their active variants is.
+    groups = Product.objects.exclude(parent=None).values('parent')
+    available = Product.objects.filter(in_stock, active=True).exclude(
+        parent=None).values('parent')
+    Product.objects.filter(pk__in=groups).exclude(
+        pk__in=available).update(has_stock=False)
+    Product.objects.filter(pk__in=available).update(has_stock=True)
+
+
+def unset_has_stock(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0005_stock_reservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='has_stock',
+            field=models.BooleanField(default=True, editable=False, help_text="Is product in stock, for groups this is true when any of it's active variants is in stock.", verbose_name='Has stock', db_index=True),
+            preserve_default=True,
+        ),
+        migrations.RunPython(set_has_stock, unset_has_stock),
+    ]
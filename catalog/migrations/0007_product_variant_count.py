@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+from django.db.models import Count
+
+
+def set_variant_count(apps, schema_editor):
+    Product = apps.get_model('catalog', 'Product')
+    counts = Product.objects.exclude(parent=None).values_list(
+        'parent').annotate(Count('pk'))
+    for parent_id, count in counts:
+        Product.objects.filter(pk=parent_id).update(variant_count=count)
+
+
+def unset_variant_count(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0006_product_has_stock'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='variant_count',
+            field=models.PositiveIntegerField(default=0, help_text='Number of variants, kept up to date when variants are added, moved or deleted.', verbose_name='Variant count', editable=False),
+            preserve_default=True,
+        ),
+        migrations.RunPython(set_variant_count, unset_variant_count),
+    ]
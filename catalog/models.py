@@ -2,16 +2,23 @@
 from __future__ import unicode_literals
 
 import json
-from itertools import chain
+from uuid import uuid4
 from decimal import Decimal
 from datetime import datetime
+from collections import OrderedDict
 
+from django.conf import settings
 from django.db import models
 from django.db.models import Q
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
 from django.core.validators import MinValueValidator
 from django.core.urlresolvers import reverse
-from django.utils.translation import ugettext_lazy as _
-from django.utils.encoding import python_2_unicode_compatible, force_str
+from django.utils.translation import get_language, ugettext_lazy as _
+from django.utils.encoding import (
+    python_2_unicode_compatible, force_str, force_text)
 from django.utils.text import slugify
 from django.utils.module_loading import import_by_path
 
@@ -29,8 +36,10 @@ from currencies.utils import calculate_price
 
 from catalog.fields import NullableCharField, UnderscoreField
 from catalog.managers import (
-    CatalogManager, ModifierCodeManager, ProductManager)
-from catalog.utils import round_2
+    CatalogManager, ModifierCodeManager, ProductManager,
+    ProductFlagIndexManager, RelatedProductManager, StockReservationManager,
+    InsufficientStock, get_related_products_cache_key)
+from catalog.utils import get_language_code, round_2
 from catalog import settings as scs
 
 
@@ -465,6 +474,113 @@ class Tax(models.Model):
         return '{}'.format(self.name)
 
 
+def get_variations_cache_key(product_id, language_code=None):
+    """
+    Returns a cache key for product variations in the given language.
+    """
+    return 'catalog_product_variations_{}_{}'.format(
+        product_id, language_code or get_language())
+
+
+def invalidate_variations(*product_ids):
+    """
+    Deletes cached variations for the given products in all languages.
+    """
+    cache.delete_many([
+        get_variations_cache_key(pk, x[0]) for pk in product_ids if pk
+        for x in settings.LANGUAGES])
+
+
+ATTRIBUTE_REGISTRY_VERSION_KEY = 'catalog_attribute_registry_version'
+
+_attribute_registry = {}
+
+
+def get_attribute_registry(language_code=None):
+    """
+    Returns a registry of attributes in the given language, holding
+    attribute dictionaries keyed by code ('codes') and a map of
+    attribute ids to codes ('ids'). Registry is cached per process
+    and reloaded once any of the attributes change.
+    """
+    language_code = get_language_code(language_code)
+    version = cache.get(ATTRIBUTE_REGISTRY_VERSION_KEY)
+    registry = _attribute_registry.get(language_code)
+
+    if registry is None or registry['version'] != version:
+        registry = {'version': version, 'codes': OrderedDict(), 'ids': {}}
+        attributes = Attribute.objects.language(language_code).\
+            prefetch_related('translations')
+        for obj in attributes:
+            registry['codes'][obj.code] = obj.as_dict
+            registry['ids'][obj.pk] = obj.code
+        _attribute_registry[language_code] = registry
+    return registry
+
+
+def invalidate_attribute_registry():
+    """
+    Clears the registry in this process and marks it as changed
+    for the other processes sharing the cache.
+    """
+    _attribute_registry.clear()
+    cache.set(ATTRIBUTE_REGISTRY_VERSION_KEY, uuid4().hex, None)
+
+
+def get_attribute_dicts(attribute_ids):
+    """
+    Returns a dictionary of attribute dictionaries keyed by their id.
+    Dictionaries are shared with the registry, copy before changing.
+    """
+    attribute_ids = set(attribute_ids)
+    registry = get_attribute_registry()
+    if not attribute_ids.issubset(registry['ids']):
+        _attribute_registry.clear()
+        registry = get_attribute_registry()
+    return dict((x, registry['codes'][registry['ids'][x]])
+                for x in attribute_ids if x in registry['ids'])
+
+
+def group_variations(texts, attributes, included_pks, variant_count):
+    """
+    Groups variants attribute value texts, a list of (product_id,
+    attribute_id, text) tuples, into variations keyed by attribute code.
+    Only texts of `included_pks` are listed as values, an attribute is
+    nullable if less than `variant_count` variants have it set.
+    """
+    variations = {}
+    seen_values = {}
+    code_variants = {}
+
+    for product_id, attribute_id, text in texts:
+        attribute = attributes[attribute_id]
+        code = attribute['code']
+        code_variants.setdefault(code, set()).add(product_id)
+
+        if product_id not in included_pks:
+            continue
+
+        if code not in variations:
+            variations[code] = {
+                'name': attribute['name'],
+                'code': code,
+                'type': attribute['type'],
+                'template': attribute['template'],
+                'is_nullable': False,
+                'values': [],
+            }
+            seen_values[code] = set()
+
+        if text not in seen_values[code]:
+            seen_values[code].add(text)
+            variations[code]['values'].append(text)
+
+    # Attribute is nullable if any of the variants miss it.
+    for code, variation in variations.items():
+        variation['is_nullable'] = len(code_variants[code]) < variant_count
+    return variations
+
+
 @python_2_unicode_compatible
 class ProductBase(MPTTModel, CatalogModel):
     """
@@ -518,12 +634,34 @@ class ProductBase(MPTTModel, CatalogModel):
                     '(out of stock) set this to "0". If left empty, product '
                     'will be treated as if it\'s always available.'))
 
+    variant_count = models.PositiveIntegerField(
+        _('Variant count'), default=0, editable=False,
+        help_text=_('Number of variants, kept up to date when variants are '
+                    'added, moved or deleted.'))
+
+    has_stock = models.BooleanField(
+        _('Has stock'), default=True, editable=False, db_index=True,
+        help_text=_('Is product in stock, for groups this is true when '
+                    'any of it\'s active variants is in stock.'))
+
     class Meta:
         abstract = True
 
     def __str__(self):
         return self.get_name()
 
+    def save(self, *args, **kwargs):
+        # MPTT overwrites it's cached parent while moving the node, keep
+        # the one product is saved from (see 'get_old_parent_id').
+        self._old_parent_id = self._mptt_cached_fields.get('parent')
+        super(ProductBase, self).save(*args, **kwargs)
+
+    def get_old_parent_id(self):
+        """
+        Returns id of the parent product had before it was last saved.
+        """
+        return getattr(self, '_old_parent_id', self.parent_id)
+
     def get_price(self):
         price = self.get_unit_price()
 
@@ -572,7 +710,13 @@ class ProductBase(MPTTModel, CatalogModel):
 
     @property
     def can_be_added_to_cart(self):
-        return self.active and self.is_available and not self.is_group
+        """
+        Checked when adding the product to a cart, quantity reserved by
+        carts is taken into account.
+        """
+        if not (self.active and self.is_available and not self.is_group):
+            return False
+        return self.quantity is None or self.get_available_quantity() > 0
 
     @property
     def is_top_level(self):
@@ -580,7 +724,7 @@ class ProductBase(MPTTModel, CatalogModel):
 
     @property
     def is_group(self):
-        return self.is_top_level and self.variants.exists()
+        return self.is_top_level and self.variant_count > 0
 
     @property
     def is_variant(self):
@@ -643,7 +787,9 @@ class ProductBase(MPTTModel, CatalogModel):
             is_tax_inherited=self.is_tax_inherited,
             discount_percent=force_str(self.get_discount_percent()),
             tax_percent=force_str(self.get_tax_percent()),
-            can_be_added_to_cart=self.can_be_added_to_cart,
+            # Reserved quantity is checked when adding to a cart only.
+            can_be_added_to_cart=(
+                self.active and self.is_available and not self.is_group),
             featured_image=featured_image,
             attrs=self.get_attrs(),
         ))
@@ -662,43 +808,59 @@ class ProductBase(MPTTModel, CatalogModel):
         If product is not a group (doesn't have variants) returns a
         formated list of dictionaries with product attributes.
         """
-        attrs = []
+        if self.is_group:
+            return []
 
-        if not self.is_group:
-            attr_values = self.attribute_values.select_related().all()
-            for value in attr_values:
-                if value.value is not None:
-                    attrs.append(value.as_dict)
+        # Only values that are set have a text in the given language.
+        texts = list(self.attribute_values.filter(
+            texts__language_code=get_language_code()).
+            order_by('pk').values_list('attribute_id', 'texts__text'))
+        attributes = get_attribute_dicts([x[0] for x in texts])
 
+        attrs = []
+        for attribute_id, text in texts:
+            data = attributes[attribute_id].copy()
+            data.update({'value': text})
+            attrs.append(data)
         return attrs
 
     def get_variations(self, exclude={}):
         """
         If product is a group product (has variants) returns a list of
         all it's variants attributes grouped by code in a dictionary.
-        """
-        variations = {}
-
-        if self.is_group:
-            variants = self.variants.select_related().exclude(**exclude)
-            attr_values = list(chain(*[x.get_attrs() for x in variants]))
 
-            for value in attr_values:
-                if value['code'] not in variations:
-                    is_nullable = Attribute.is_nullable(value['code'], self)
+        Variations are built in a single pass over all of the variants
+        attribute values. When nothing is excluded the result is cached
+        until one of the variants (or their attributes) changes.
+        """
+        if not self.is_group:
+            return {}
+
+        cache_key = get_variations_cache_key(self.pk)
+        if not exclude:
+            variations = cache.get(cache_key)
+            if variations is not None:
+                return variations
+
+        variant_pks = set(self.variants.values_list('pk', flat=True))
+        if exclude:
+            included_pks = set(self.variants.exclude(**exclude).
+                               values_list('pk', flat=True))
+        else:
+            included_pks = variant_pks
 
-                    variations[value['code']] = {
-                        'name': value['name'],
-                        'code': value['code'],
-                        'type': value['type'],
-                        'template': value['template'],
-                        'is_nullable': is_nullable,
-                        'values': [],
-                    }
+        texts = list(self.attribute_values.model.objects.filter(
+            product_id__in=variant_pks,
+            texts__language_code=get_language_code()).
+            order_by('product__lft', 'pk').
+            values_list('product_id', 'attribute_id', 'texts__text'))
+        attributes = get_attribute_dicts([x[1] for x in texts])
 
-                if value['value'] not in variations[value['code']]['values']:
-                    variations[value['code']]['values'].append(value['value'])
+        variations = group_variations(
+            texts, attributes, included_pks, len(variant_pks))
 
+        if not exclude:
+            cache.set(cache_key, variations, scs.CACHE_TIMEOUT)
         return variations
 
     def get_variant(self, **kwargs):
@@ -709,17 +871,17 @@ class ProductBase(MPTTModel, CatalogModel):
             return None
 
         # Cast keys and values to str and filter out empty values.
-        kwargs = [(force_str(k), force_str(v)) for k, v in kwargs.items() if v]
-
-        # Loop through variants and compare their attribute values to
-        # kwargs. If they match, return that variant.
-        for obj in self.variants.select_related().all():
-            attrs = [(x['code'], x['value']) for x in obj.get_attrs()]
-            if sorted(attrs) == sorted(kwargs):
-                return obj
-
-        # No variants match the given kwargs, return None.
-        return None
+        kwargs = dict((force_str(k), force_str(v))
+                      for k, v in kwargs.items() if v)
+
+        # Variant must match all of the kwargs and have no other
+        # attribute values set.
+        other_values = self.attribute_values.model.objects.filter(
+            texts__language_code=get_language_code()).exclude(
+            attribute__code__in=kwargs.keys())
+        variants = self.variants.all().with_attrs(**kwargs).exclude(
+            pk__in=other_values.values('product'))
+        return variants.first()
 
     def filter_variants(self, **kwargs):
         """
@@ -729,21 +891,13 @@ class ProductBase(MPTTModel, CatalogModel):
         if not self.is_group:
             return None
 
-        variants = []
-
         # Cast keys and values to str and filter out empty values.
-        kwargs = [(force_str(k), force_str(v)) for k, v in kwargs.items()
-                  if v is not None]
-
-        # Loop through variants and compare their attribute values
-        # to kwargs. Make sure that all kwargs are a part of attributes.
-        for obj in self.variants.select_related().all():
-            attrs = [(x['code'], x['value']) for x in obj.get_attrs()]
-            if set(sorted(kwargs)).issubset(sorted(attrs)):
-                variants.append(obj)
+        kwargs = dict((force_str(k), force_str(v)) for k, v in kwargs.items()
+                      if v is not None)
 
         # Return variants if any.
-        return variants if any(variants) else None
+        variants = list(self.variants.all().with_attrs(**kwargs))
+        return variants or None
 
 
 class Product(ProductBase, ModifierModel, TranslatableModel):
@@ -819,6 +973,7 @@ class Product(ProductBase, ModifierModel, TranslatableModel):
             currencies=self.get_currencies(),
             flags=self.get_flags(),
             related_products=self.get_related_products(),
+            rating=self.get_rating(),
         )
         data.update(self.get_categorization())
         return data
@@ -858,6 +1013,18 @@ class Product(ProductBase, ModifierModel, TranslatableModel):
     def is_body_inherited(self):
         return self.is_variant and not self.body.get_plugins().exists()
 
+    def get_rating(self):
+        """
+        Returns a summary of product reviews if 'catalog.reviews' is
+        installed and product has been reviewed, otherwise None.
+        """
+        if not scs.HAS_REVIEWS:
+            return None
+        try:
+            return self.rating.as_dict
+        except ObjectDoesNotExist:
+            return None
+
     def get_currencies(self):
         """
         Calculates prices for all currencies and returns them in a dict.
@@ -899,10 +1066,11 @@ class Product(ProductBase, ModifierModel, TranslatableModel):
             manufacturer=manufacturer,
         )
 
-    def get_measurements(self):
+    def get_measurements(self, units=None):
         """
         Check if measure is inherited and returns correct dict of all
-        product measurements.
+        product measurements, optionally only converted into the given
+        units (see 'MeasurementBase.get_dict').
         """
         measurements = self.measurements.select_related().all()
 
@@ -912,44 +1080,45 @@ class Product(ProductBase, ModifierModel, TranslatableModel):
             parent_mesurements = parent_mesurements.exclude(kind__in=kinds)
             measurements = measurements | parent_mesurements
 
+        measurements = dict((x.kind, x) for x in measurements)
         measurements_dict = {}
         for kind in dict(MeasurementBase.KIND_CHOICES).keys():
-            try:
-                measurements_dict[kind] = measurements.get(kind=kind).as_dict
-            except ProductMeasurement.DoesNotExist:
-                measurements_dict[kind] = None
+            obj = measurements.get(kind)
+            measurements_dict[kind] = obj.get_dict(units) if obj else None
         return measurements_dict
 
     def get_flags(self):
         """
-        Checks for parent flags and returns correct list of dictionaries
-        for product flags.
+        Returns a dictionary of product flags, including flags inherited
+        from a parent (see 'ProductFlagIndex').
         """
-        flags = self.flags.select_related().all()
-
-        if self.is_variant:
-            flag_ids = flags.values_list('flag_id', flat=True)
-            parent_flags = self.parent.flags.select_related()
-            parent_flags = parent_flags.exclude(flag_id__in=flag_ids)
-            flags = flags | parent_flags
+        flags = self.flag_index.select_related('flag').\
+            prefetch_related('flag__translations')
         return dict((x.get_code(), x.as_dict) for x in flags)
 
     def get_related_products(self):
         """
-        Returns all related products for this product.
+        Returns ids of active and available related products for this
+        product (or it's parent) grouped by kind.
         """
-        if self.is_variant:
-            return self.parent.get_related_products()
+        base_id = self.parent_id or self.pk
+        related = RelatedProduct.objects.get_related_ids([base_id])[base_id]
 
-        products_dict = dict(
-            (x[0], {'name': force_str(x[1]), 'products': []})
-            for x in scs.RELATED_PRODUCT_KIND_CHOICES)
+        return dict((kind, {
+            'name': force_str(name),
+            'products': [force_str(x) for x in related.get(kind, [])],
+        }) for kind, name in scs.RELATED_PRODUCT_KIND_CHOICES)
 
-        for obj in self.related_products.select_related().all():
-            if obj.kind in products_dict:
-                products_dict[obj.kind]['products'].append(
-                    force_str(obj.product.pk))
-        return products_dict
+    def get_available_quantity(self, cart=None):
+        """
+        Returns quantity that's not reserved by carts (other than the
+        given one), or None if quantity is not tracked.
+        """
+        if self.quantity is None:
+            return None
+        reserved = StockReservation.objects.get_reserved(
+            [self.pk], exclude_cart=cart).get(self.pk, 0)
+        return max(self.quantity - reserved, 0)
 
 
 @python_2_unicode_compatible
@@ -1034,8 +1203,17 @@ class Attribute(TranslatableModel):
             template=template,
         )
 
+    def save(self, *args, **kwargs):
+        kind_changed = self.pk and Attribute.objects.filter(
+            pk=self.pk).exclude(kind=self.kind).exists()
+        super(Attribute, self).save(*args, **kwargs)
+        if kind_changed:
+            ProductAttributeValue.update_texts(
+                self.values.select_related('value_file', 'value_image'))
+
     def get_values(self):
-        return list(set([x.value for x in self.values.select_related().all()]))
+        values = self.values.filter(texts__language_code=get_language_code())
+        return list(set(values.values_list('texts__text', flat=True)))
 
     @classmethod
     def is_nullable(cls, attr_code, obj):
@@ -1047,20 +1225,16 @@ class Attribute(TranslatableModel):
         required and returns False.
         """
         if obj.is_group:
-            for variant in obj.variants.select_related().all():
-                if attr_code not in [x['code'] for x in variant.get_attrs()]:
-                    return True
-            return False
+            variation = obj.get_variations().get(attr_code, None)
+            return variation['is_nullable'] if variation else True
 
     @classmethod
     def template_for(cls, attr_code):
         """
         Returns an attribute template for attribute with a given code.
         """
-        try:
-            return cls.objects.get(code=attr_code).template
-        except cls.DoesNotExist:
-            return None
+        attribute = get_attribute_registry()['codes'].get(attr_code)
+        return attribute['template'] if attribute else None
 
     @classmethod
     def filter_dict(cls, dictionary):
@@ -1068,7 +1242,7 @@ class Attribute(TranslatableModel):
         Filters the given dictionary, removes items where key is not
         an attribute code.
         """
-        codes = [x.code for x in cls.objects.all()]
+        codes = get_attribute_registry()['codes']
         return dict((k, v) for k, v in dictionary.items() if k in codes and v)
 
 
@@ -1111,7 +1285,9 @@ class AttributeValueBase(models.Model):
 
     @property
     def as_dict(self):
-        data = self.attribute.as_dict
+        data = get_attribute_dicts([self.attribute_id]).get(
+            self.attribute_id) or self.attribute.as_dict
+        data = data.copy()
         data.update({'value': force_str(self.value)})
         return data
 
@@ -1141,6 +1317,61 @@ class ProductAttributeValue(AttributeValueBase):
         verbose_name_plural = _('Attributes')
         unique_together = ('attribute', 'product')
 
+    def save(self, *args, **kwargs):
+        super(ProductAttributeValue, self).save(*args, **kwargs)
+        self.update_texts([self])
+
+    @classmethod
+    def update_texts(cls, values):
+        """
+        Rewrites normalized value texts of the given attribute values in
+        all languages. Option texts are translated, other values share
+        the same text for every language. Unset values get no text.
+        """
+        values = list(values)
+        option_ids = [x.value_option_id for x in values if x.value_option_id]
+        options = AttributeOption.objects.filter(pk__in=option_ids).\
+            prefetch_related('translations')
+        options = dict((x.pk, x) for x in options)
+        languages = [x[0] for x in settings.LANGUAGES]
+
+        texts = []
+        for obj in values:
+            if obj.attribute.is_option:
+                option = options.get(obj.value_option_id)
+                items = [(x, option.safe_translation_getter(
+                    'value', language_code=x) if option else None)
+                    for x in languages]
+            else:
+                items = [(x, obj.value) for x in languages]
+            texts.extend([AttributeValueText(
+                value=obj, language_code=x,
+                text=force_text(text)[:255]) for x, text in items
+                if text is not None])
+
+        AttributeValueText.objects.filter(value__in=values).delete()
+        AttributeValueText.objects.bulk_create(texts)
+
+
+@python_2_unicode_compatible
+class AttributeValueText(models.Model):
+    """
+    Denormalized text of a product attribute value in a language, used
+    for filtering and matching variants on a single indexed column.
+    """
+    value = models.ForeignKey(
+        ProductAttributeValue, related_name='texts', editable=False)
+    language_code = models.CharField(max_length=15, db_index=True)
+    text = models.CharField(max_length=255)
+
+    class Meta:
+        db_table = 'catalog_product_attribute_value_texts'
+        unique_together = ('value', 'language_code')
+        index_together = ('language_code', 'text')
+
+    def __str__(self):
+        return self.text
+
 
 @python_2_unicode_compatible
 class AttributeOption(TranslatableModel):
@@ -1166,25 +1397,56 @@ class AttributeOption(TranslatableModel):
         return self.safe_translation_getter('value')
 
 
-def get_measure_alias(measure):
+_measure_tables = {}
+
+
+def get_measure_tables(measure):
     """
-    Adds prefixes to SI aliases and returns them in a dict.
+    Returns a tuple of alias and unit pairs and a frozenset of units for
+    the given measure (class or instance). Tables are computed once per
+    measure class and MEASUREMENT_UNITS setting, and are immutable.
     """
+    if not isinstance(measure, type):
+        measure = type(measure)
+
+    key = (measure, tuple(scs.MEASUREMENT_UNITS))
+    if key in _measure_tables:
+        return _measure_tables[key]
+
+    # Add prefixes to SI aliases.
     SI_ALIAS = {}
+    unit_aliases = dict((v, k) for k, v in measure.ALIAS.items())
     for unit in measure.SI_UNITS:
-        alias = dict((v, k) for k, v in measure.ALIAS.items())[unit]
+        alias = unit_aliases[unit]
         for prefix_alias, prefix_unit in MeasureBase.SI_PREFIXES.items():
             SI_ALIAS['{}{}'.format(prefix_alias, alias)] = '{}{}'.\
                 format(prefix_unit, unit)
     aliases = dict(measure.ALIAS.items() + SI_ALIAS.items())
 
-    # Only return keys that are specified in MEASUREMENT_UNITS setting.
+    # Only keep keys that are specified in MEASUREMENT_UNITS setting.
     if scs.MEASUREMENT_UNITS:
-        for key, value in aliases.copy().items():
+        for key_alias, value in aliases.copy().items():
             if (value not in scs.MEASUREMENT_UNITS and
                     value != measure.STANDARD_UNIT):
-                del aliases[key]
-    return aliases
+                del aliases[key_alias]
+
+    _measure_tables[key] = (
+        tuple(aliases.items()), frozenset(aliases.values()))
+    return _measure_tables[key]
+
+
+def get_measure_alias(measure):
+    """
+    Adds prefixes to SI aliases and returns them in a dict.
+    """
+    return dict(get_measure_tables(measure)[0])
+
+
+def get_measure_units(measure):
+    """
+    Returns a frozenset of all available units for the given measure.
+    """
+    return get_measure_tables(measure)[1]
 
 
 @python_2_unicode_compatible
@@ -1203,9 +1465,9 @@ class MeasurementBase(models.Model):
         (KIND_WEIGHT, _('Weight')),
     )
 
-    aliases = [get_measure_alias(Distance), get_measure_alias(Weight)]
+    aliases = [get_measure_tables(Distance)[0], get_measure_tables(Weight)[0]]
     UNIT_CHOICES = tuple(
-        (v, k.capitalize()) for x in aliases for k, v in x.items())
+        (v, k.capitalize()) for x in aliases for k, v in x)
 
     kind = models.CharField(
         _('Kind'), max_length=20,
@@ -1215,6 +1477,10 @@ class MeasurementBase(models.Model):
     unit = models.CharField(
         _('Unit'), max_length=20,
         choices=UNIT_CHOICES, default=Distance.STANDARD_UNIT)
+    standard_value = models.FloatField(
+        _('Standard value'), blank=True, null=True, editable=False,
+        help_text=_('Value converted into the standard unit, used for '
+                    'filtering and sorting.'))
 
     class Meta:
         abstract = True
@@ -1222,20 +1488,53 @@ class MeasurementBase(models.Model):
     def __str__(self):
         return '{}'.format(self.distance or self.weight)
 
+    def save(self, *args, **kwargs):
+        self.standard_value = self.to_standard(self.value, self.unit)
+        super(MeasurementBase, self).save(*args, **kwargs)
+
+    @classmethod
+    def get_standard_unit(cls, kind):
+        """
+        Returns a standard unit for the given measurement kind.
+        """
+        if kind == cls.KIND_WEIGHT:
+            return Weight.STANDARD_UNIT
+        return Distance.STANDARD_UNIT
+
+    @classmethod
+    def to_standard(cls, value, unit):
+        """
+        Converts the value in a given unit into the standard unit of
+        it's measure, returns None if unit is not available.
+        """
+        for measure in (Distance, Weight):
+            if unit in get_measure_units(measure):
+                measure = measure(**{unit: value})
+                return float(getattr(measure, measure.STANDARD_UNIT))
+        return None
+
     @property
     def distance(self):
-        if self.unit in get_measure_alias(Distance).values():
+        if self.unit in get_measure_units(Distance):
             return Distance(**{self.unit: self.value})
         return None
 
     @property
     def weight(self):
-        if self.unit in get_measure_alias(Weight).values():
+        if self.unit in get_measure_units(Weight):
             return Weight(**{self.unit: self.value})
         return None
 
     @property
     def as_dict(self):
+        return self.get_dict()
+
+    def get_dict(self, units=None):
+        """
+        Returns a dictionary with measurement values converted into the
+        given units. If units are not given, converts into all of the
+        available units.
+        """
         values = []
         measure = self.distance or self.weight
 
@@ -1248,8 +1547,11 @@ class MeasurementBase(models.Model):
             values.append(('original_value',
                            getattr(measure, self.unit, None)))
 
-            # Add all values to dict.
-            for unit in get_measure_alias(measure).values():
+            # Add values for requested (or all available) units to dict.
+            available_units = get_measure_units(measure)
+            if units is not None:
+                available_units = available_units.intersection(units)
+            for unit in available_units:
                 values.append((unit, getattr(measure, unit, None)))
 
         # Cast all values to strings, remove null's and return the dict.
@@ -1269,6 +1571,7 @@ class ProductMeasurement(MeasurementBase):
         verbose_name = _('Measurement')
         verbose_name_plural = _('Measurements')
         unique_together = ('product', 'kind')
+        index_together = ('kind', 'standard_value')
 
 
 @python_2_unicode_compatible
@@ -1330,6 +1633,41 @@ class ProductFlag(models.Model):
         )
 
 
+@python_2_unicode_compatible
+class ProductFlagIndex(models.Model):
+    """
+    Effective flags of a product, with flags inherited from a parent
+    product already resolved. Rebuilt when product flags change.
+    """
+    product = models.ForeignKey(
+        Product, related_name='flag_index', editable=False)
+    flag = models.ForeignKey(Flag, related_name='+', editable=False)
+    code = models.CharField(max_length=123, editable=False)
+    is_true = models.BooleanField(default=True, editable=False)
+    is_inherited = models.BooleanField(default=False, editable=False)
+
+    objects = ProductFlagIndexManager()
+
+    class Meta:
+        db_table = 'catalog_product_flag_index'
+        unique_together = ('product', 'flag')
+        index_together = ('code', 'is_true')
+
+    def __str__(self):
+        return self.flag.get_name()
+
+    def get_code(self):
+        return self.code
+
+    @property
+    def as_dict(self):
+        return dict(
+            name=force_str(self.__str__()),
+            code=force_str(self.get_code()),
+            is_true=self.is_true,
+        )
+
+
 @python_2_unicode_compatible
 class RelatedProduct(models.Model):
     """
@@ -1347,6 +1685,8 @@ class RelatedProduct(models.Model):
         choices=scs.RELATED_PRODUCT_KIND_CHOICES,
         default=scs.RELATED_PRODUCT_KIND_CHOICES[0][0])
 
+    objects = RelatedProductManager()
+
     class Meta:
         db_table = 'catalog_related_products'
         verbose_name = _('Related Product')
@@ -1362,3 +1702,240 @@ class RelatedProduct(models.Model):
             product=force_str(self.product_id),
             kind=force_str(self.kind),
         )
+
+
+@python_2_unicode_compatible
+class StockReservation(models.Model):
+    """
+    Product quantity held for a cart until it expires, kept in sync with
+    cart items. See 'StockReservationManager'.
+    """
+    product = models.ForeignKey(
+        Product, related_name='stock_reservations', verbose_name=_('Product'))
+    cart = models.ForeignKey(
+        get_model_string('Cart'), related_name='+', editable=False)
+    quantity = models.PositiveIntegerField(_('Quantity'))
+    expires = models.DateTimeField(_('Expires'), db_index=True)
+
+    objects = StockReservationManager()
+
+    class Meta:
+        db_table = 'catalog_stock_reservations'
+        verbose_name = _('Stock reservation')
+        verbose_name_plural = _('Stock reservations')
+        unique_together = ('product', 'cart')
+
+    def __str__(self):
+        return '{} x {}'.format(self.quantity, self.product_id)
+
+
+@receiver([post_save, post_delete], sender=Product)
+def product_changed(sender, instance, **kwargs):
+    """
+    Invalidates variations of the group product when a variant is
+    changed, including the group it was moved from.
+    """
+    old_parent_id = instance.get_old_parent_id()
+    invalidate_variations(instance.parent_id, old_parent_id)
+
+
+@receiver([post_save, post_delete], sender=ProductAttributeValue)
+def product_attribute_value_changed(sender, instance, **kwargs):
+    """
+    Invalidates variations of the group product when a variants
+    attribute value is changed.
+    """
+    parent_ids = Product.objects.filter(pk=instance.product_id).\
+        values_list('parent_id', flat=True)
+    invalidate_variations(*parent_ids)
+
+
+@receiver(post_save, sender=Attribute)
+@receiver(post_save, sender=AttributeOption)
+def attribute_changed(sender, instance, **kwargs):
+    """
+    Invalidates variations of all group products that have a variant
+    using the changed attribute or option.
+    """
+    if sender is Attribute:
+        filters = {'variants__attribute_values__attribute': instance}
+    else:
+        filters = {'variants__attribute_values__value_option': instance}
+    pks = Product.objects.filter(**filters).values_list('pk', flat=True)
+    invalidate_variations(*set(pks))
+
+
+@receiver([post_save, post_delete], sender=Attribute)
+@receiver([post_save, post_delete], sender=Attribute._parler_meta.root_model)
+def attribute_registry_changed(sender, instance, **kwargs):
+    """
+    Invalidates the attribute registry when attribute or it's
+    translation is changed.
+    """
+    invalidate_attribute_registry()
+
+
+@receiver(post_save, sender=AttributeOption._parler_meta.root_model)
+def attribute_option_translation_saved(sender, instance, **kwargs):
+    """
+    Rewrites texts of attribute values using the translated option.
+    """
+    values = ProductAttributeValue.objects.filter(
+        value_option_id=instance.master_id).select_related('attribute')
+    ProductAttributeValue.update_texts(values)
+
+
+@receiver(post_delete, sender=AttributeOption._parler_meta.root_model)
+def attribute_option_translation_deleted(sender, instance, **kwargs):
+    """
+    Removes texts of attribute values in the deleted option language.
+    """
+    AttributeValueText.objects.filter(
+        value__value_option_id=instance.master_id,
+        language_code=instance.language_code).delete()
+
+
+@receiver([post_save, post_delete], sender=ProductFlag)
+def product_flag_changed(sender, instance, **kwargs):
+    """
+    Rebuilds effective flags of the product and it's variants.
+    """
+    ProductFlagIndex.objects.rebuild([instance.product_id])
+
+
+@receiver(post_save, sender=Flag)
+def flag_saved(sender, instance, **kwargs):
+    """
+    Updates indexed flag code.
+    """
+    ProductFlagIndex.objects.filter(flag=instance).exclude(
+        code=instance.code).update(code=instance.code)
+
+
+@receiver(post_save, sender=Product)
+def product_saved_flags(sender, instance, created, **kwargs):
+    """
+    Rebuilds effective flags when a product is added or moved to
+    another parent.
+    """
+    old_parent_id = instance.get_old_parent_id()
+    if (created and instance.parent_id) or \
+            old_parent_id != instance.parent_id:
+        ProductFlagIndex.objects.rebuild([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=Product)
+def product_changed_variant_count(sender, instance, **kwargs):
+    """
+    Updates variant count of the products parent (and the old one, if
+    product was moved). Parent instance cached on the product is updated
+    in memory too.
+    """
+    old_parent_id = instance.get_old_parent_id()
+    if kwargs.get('created', True) or old_parent_id != instance.parent_id:
+        counts = Product.objects.update_variant_count(
+            [x for x in (instance.parent_id, old_parent_id) if x])
+        parent = getattr(instance, '_parent_cache', None)
+        if parent is not None and parent.pk in counts:
+            parent.variant_count = counts[parent.pk]
+
+
+@receiver([post_save, post_delete], sender=Product)
+def product_changed_stock(sender, instance, **kwargs):
+    """
+    Updates 'has_stock' flag of the product and it's parents (the old
+    one too, if product was moved).
+    """
+    old_parent_id = instance.get_old_parent_id()
+    ids = [x for x in (instance.pk, instance.parent_id, old_parent_id) if x]
+    Product.objects.update_stock(ids)
+
+
+@receiver([post_save, post_delete], sender=RelatedProduct)
+def related_product_changed(sender, instance, **kwargs):
+    """
+    Invalidates cached related products of the base product.
+    """
+    cache.delete(get_related_products_cache_key(instance.base_product_id))
+
+
+@receiver(post_save, sender=Product)
+def product_saved_related(sender, instance, **kwargs):
+    """
+    Invalidates cached related products of all products that relate
+    to the saved one, since it's availability might have changed.
+    """
+    base_ids = RelatedProduct.objects.filter(product=instance).\
+        values_list('base_product_id', flat=True)
+    cache.delete_many([get_related_products_cache_key(x) for x in base_ids])
+
+
+@receiver([post_save, post_delete], sender=get_model_string('CartItem'))
+def cart_item_changed(sender, instance, **kwargs):
+    """
+    Reserves the total quantity of a product in the cart, or as much of
+    it as is available. Quantity that's not reserved is checked again
+    when the order is confirmed.
+    """
+    quantity = sender.objects.filter(
+        cart_id=instance.cart_id, product_id=instance.product_id).aggregate(
+        quantity=models.Sum('quantity'))['quantity'] or 0
+    StockReservation.objects.reserve(
+        instance.cart_id, instance.product_id, quantity, partial=True)
+
+
+def get_order_quantities(order):
+    """
+    Returns a dictionary of ordered quantities keyed by product id.
+    """
+    quantities = {}
+    for product_id, quantity in order.items.filter(
+            product__isnull=False).values_list('product_id', 'quantity'):
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities
+
+
+def is_stock_taken(order, status):
+    """
+    Returns True if stock of an order with the given status has been
+    decremented, from confirmation on until it's canceled.
+    """
+    return order.CONFIRMED <= status < order.CANCELED
+
+
+def update_order_stock(order, old_status):
+    """
+    Decrements stock of ordered products when an order gets confirmed,
+    before the payment, and releases reservations of the orders cart.
+    Stock is returned when a confirmed order gets canceled. When a
+    product has sold out in the meantime the order's status is changed
+    to canceled instead, with a note of the products in it's extra info.
+    """
+    taken = is_stock_taken(order, order.status)
+    if is_stock_taken(order, old_status) == taken:
+        return
+
+    quantities = get_order_quantities(order)
+    if not taken:
+        Product.objects.increment_stock(quantities)
+        return
+    try:
+        Product.objects.decrement_stock(quantities, cart=order.cart_pk)
+    except InsufficientStock as e:
+        order.status = order.CANCELED
+        order.extra_info.create(text=force_text(e))
+    else:
+        if order.cart_pk:
+            StockReservation.objects.release(order.cart_pk)
+
+
+@receiver(pre_save, sender=get_model_string('Order'))
+def order_status_changed_stock(sender, instance, **kwargs):
+    """
+    Updates stock when status of a saved order changes, see
+    'update_order_stock'.
+    """
+    old = list(sender._default_manager.filter(pk=instance.pk).values_list(
+        'status', flat=True)) if instance.pk else []
+    if old:
+        update_order_stock(instance, old[0])
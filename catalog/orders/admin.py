@@ -1,9 +1,13 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+from django.conf.urls import url, patterns
 from django.contrib import admin
 from django.contrib.admin.options import ModelAdmin
-from django.utils.translation import ugettext_lazy as _
+from django.db import transaction
+from django.template.response import TemplateResponse
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _, ungettext
 
 from shop.admin.orderadmin import (
     OrderItemInline, OrderExtraInfoInline, ExtraOrderPriceFieldInline,
@@ -11,7 +15,13 @@ from shop.admin.orderadmin import (
 from shop.admin.mixins import LocalizeDecimalFieldsMixin
 from shop.order_signals import completed, shipped, cancelled
 
-from catalog.orders.models import Order
+from catalog.orders.models import (
+    Order, QueuedNotification, OrderSalesDay, ProductSalesDay,
+    batch_notifications)
+from catalog.orders.forms import SalesReportForm
+from catalog.filters import get_product_names
+from catalog.models import Product, Category, update_order_stock
+from catalog import settings as scs
 
 
 class OrderAdmin(LocalizeDecimalFieldsMixin, ModelAdmin):
@@ -51,9 +61,61 @@ class OrderAdmin(LocalizeDecimalFieldsMixin, ModelAdmin):
         }),
     )
 
+    actions = ['mark_completed', 'mark_shipped', 'mark_cancelled']
+
     def __init__(self, *args, **kwargs):
         super(OrderAdmin, self).__init__(*args, **kwargs)
 
+    def get_urls(self):
+        urls = super(OrderAdmin, self).get_urls()
+        order_urls = patterns(
+            '',
+            url(r'^sales_report/$',
+                self.admin_site.admin_view(self.sales_report),
+                name='orders_order_sales_report'),
+        )
+        return order_urls + urls
+
+    def sales_report(self, request):
+        """
+        Displays sales per currency, product and category from the
+        daily rollups (see 'rollupsales' command).
+        """
+        form = SalesReportForm(request.GET or None)
+        data = form.cleaned_data if form.is_valid() else {}
+        dates = data.get('date_from'), data.get('date_to')
+        category = data.get('category')
+
+        products = ProductSalesDay.objects.by_product(
+            *dates, limit=scs.ORDERS_SALES_REPORT_LIMIT)
+        names = dict(get_product_names(Product.objects.filter(
+            pk__in=[x['product_id'] for x in products])))
+        for row in products:
+            row['name'] = names.get(row['product_id'], row['product_id'])
+
+        categories = ProductSalesDay.objects.by_category(
+            *dates, category=category)
+        names = dict((x.pk, x.get_name()) for x in Category.objects.filter(
+            pk__in=[x['category_id'] for x in categories]).prefetch_related(
+            'translations'))
+        for row in categories:
+            row['name'] = names.get(row['category_id'], _('Uncategorized'))
+
+        context = dict(
+            self.admin_site.each_context(),
+            title=_('Sales report'),
+            opts=self.model._meta,
+            form=form,
+            currencies=OrderSalesDay.objects.by_currency(*dates),
+            products=products,
+            categories=categories,
+            category_totals=ProductSalesDay.objects.for_category(
+                category, *dates) if category else None,
+            has_rollups=OrderSalesDay.objects.exists(),
+        )
+        return TemplateResponse(
+            request, scs.ORDERS_SALES_REPORT_TEMPLATE, context)
+
     def save_model(self, request, order, form, change):
         instance = Order.objects.get(pk=order.pk)
         super(OrderAdmin, self).save_model(request, order, form, change)
@@ -66,5 +128,56 @@ class OrderAdmin(LocalizeDecimalFieldsMixin, ModelAdmin):
             elif order.status == Order.CANCELLED:
                 cancelled.send(sender=self, order=order)
 
+    def change_status(self, request, queryset, status, signal):
+        """
+        Changes status of the selected orders in bulk and sends their
+        notifications at once. Orders that can't be confirmed for a lack
+        of stock are canceled instead, see 'update_order_stock'.
+        """
+        orders = list(queryset.exclude(status=status))
+        with transaction.atomic(), batch_notifications():
+            for order in orders:
+                old_status, order.status = order.status, status
+                update_order_stock(order, old_status)
+            for new_status in set(x.status for x in orders):
+                Order.objects.filter(pk__in=[
+                    x.pk for x in orders if x.status == new_status]).update(
+                    status=new_status, modified=timezone.now())
+            for order in orders:
+                if order.status == status:
+                    signal.send(sender=self, order=order)
+                else:
+                    cancelled.send(sender=self, order=order)
+
+        orders = [x for x in orders if x.status == status]
+
+        self.message_user(request, ungettext(
+            'Status of %(count)d order was changed to "%(status)s".',
+            'Status of %(count)d orders was changed to "%(status)s".',
+            len(orders)) % {'count': len(orders),
+                            'status': dict(Order.STATUS_CODES)[status]})
+
+    def mark_completed(self, request, queryset):
+        self.change_status(request, queryset, Order.COMPLETED, completed)
+    mark_completed.short_description = _('Mark selected orders as completed')
+
+    def mark_shipped(self, request, queryset):
+        self.change_status(request, queryset, Order.SHIPPED, shipped)
+    mark_shipped.short_description = _('Mark selected orders as shipped')
+
+    def mark_cancelled(self, request, queryset):
+        self.change_status(request, queryset, Order.CANCELLED, cancelled)
+    mark_cancelled.short_description = _('Mark selected orders as cancelled')
+
+
+class QueuedNotificationAdmin(ModelAdmin):
+    list_display = (
+        'subject', 'recipients', 'order', 'created', 'attempts', 'sent')
+    list_filter = ('sent', 'created')
+    search_fields = ('subject', 'recipients')
+    raw_id_fields = ('order', )
+    readonly_fields = ('created', 'sent', 'last_error')
+
 
 admin.site.register(Order, OrderAdmin)
+admin.site.register(QueuedNotification, QueuedNotificationAdmin)
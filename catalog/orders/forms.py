@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django import forms
+from django.utils.translation import ugettext_lazy as _
+
+from catalog.models import Category
+
+
+class SalesReportForm(forms.Form):
+    """
+    Filters the sales report by a date range and category.
+    """
+    date_from = forms.DateField(label=_('From'), required=False)
+    date_to = forms.DateField(label=_('To'), required=False)
+    category = forms.ModelChoiceField(
+        Category.objects.all(), label=_('Category'), required=False)
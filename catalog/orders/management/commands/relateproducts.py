@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from itertools import combinations
+from optparse import make_option
+
+from django.db import transaction
+from django.core.management.base import CommandError, BaseCommand
+from django.utils import timezone
+
+from shop.models import OrderItem
+
+from catalog.orders.models import (
+    Order, ProductCoPurchase, ProductCoPurchaseOrder, ProductCoPurchaseRun,
+    chunked)
+from catalog import settings as scs
+
+
+class Command(BaseCommand):
+    help = ('Counts products bought together in orders (changed since the '
+            'last run) and makes the top ones related products.')
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--full', action='store_true', dest='full', default=False,
+            help='Discard existing counts and count all of the orders.'),
+        make_option(
+            '--top', type='int', dest='top', default=5,
+            help='Number of related products per product.'),
+        make_option(
+            '--batch-size', type='int', dest='batch_size', default=100000,
+            help='Number of product pairs kept in memory before saving.'),
+        make_option(
+            '--kind', dest='kind', default='cross_sell',
+            help='Kind of the related products.'),
+    )
+
+    statuses = (Order.CONFIRMED, Order.COMPLETED, Order.SHIPPED)
+
+    def handle(self, *args, **options):
+        kind = options['kind']
+        if kind not in dict(scs.RELATED_PRODUCT_KIND_CHOICES):
+            raise CommandError('Unknown related product kind \'{}\'.'.
+                               format(kind))
+
+        started = timezone.now()
+        orders = Order.objects.all()
+        if options['full']:
+            ProductCoPurchase.objects.clear(kind)
+        else:
+            try:
+                orders = orders.filter(
+                    modified__gte=ProductCoPurchaseRun.objects.latest().
+                    started)
+            except ProductCoPurchaseRun.DoesNotExist:
+                pass
+
+        # Orders that got one of the statuses are counted, counted ones
+        # that lost it (eg. got cancelled) are discounted.
+        counted = ProductCoPurchaseOrder.objects.values('order')
+        add_ids = list(orders.filter(status__in=self.statuses).exclude(
+            pk__in=counted).values_list('pk', flat=True))
+        remove_ids = list(orders.exclude(status__in=self.statuses).filter(
+            pk__in=counted).values_list('pk', flat=True))
+
+        self.counts, self.affected = {}, set()
+        self.added, self.removed = [], []
+        for order_ids, sign in [(add_ids, 1), (remove_ids, -1)]:
+            for chunk in chunked(order_ids):
+                self.count_orders(chunk, sign)
+                if len(self.counts) >= options['batch_size']:
+                    self.save_counts()
+        self.save_counts()
+
+        ProductCoPurchase.objects.update_related(
+            self.affected, options['top'], kind)
+        ProductCoPurchaseRun.objects.create(started=started)
+
+        print 'Counted {} orders, discounted {}, updated {} products.'.format(
+            len(add_ids), len(remove_ids), len(self.affected))
+
+    def count_orders(self, order_ids, sign):
+        """
+        Adds (or subtracts) pairs of products bought together in the
+        given orders, variants are counted as their (top level) parent.
+        """
+        baskets = {}
+        for order_id, product_id, parent_id in OrderItem.objects.filter(
+                order_id__in=order_ids, product__isnull=False).values_list(
+                'order_id', 'product_id', 'product__parent_id'):
+            baskets.setdefault(order_id, set()).add(parent_id or product_id)
+
+        for basket in baskets.values():
+            for a, b in combinations(basket, 2):
+                self.counts[(a, b)] = self.counts.get((a, b), 0) + sign
+                self.counts[(b, a)] = self.counts.get((b, a), 0) + sign
+        (self.added if sign > 0 else self.removed).extend(order_ids)
+
+    def save_counts(self):
+        """
+        Saves the counts together with the orders they were counted from.
+        """
+        with transaction.atomic():
+            ProductCoPurchase.objects.add_counts(self.counts)
+            ProductCoPurchaseOrder.objects.bulk_create([
+                ProductCoPurchaseOrder(order_id=x) for x in self.added])
+            for chunk in chunked(self.removed):
+                ProductCoPurchaseOrder.objects.filter(
+                    order__in=chunk).delete()
+        self.affected.update(x[0] for x in self.counts)
+        self.counts, self.added, self.removed = {}, [], []
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from datetime import datetime
+from optparse import make_option
+
+from django.core.management.base import CommandError, BaseCommand
+from django.utils import timezone
+
+from catalog.orders.models import (
+    Order, OrderSalesDay, ProductSalesDay, SalesRollupRun, get_day_range,
+    get_order_days)
+
+
+class Command(BaseCommand):
+    help = ('Rolls up daily sales of orders changed since the last run, '
+            'used by sales reports. Run it periodically.')
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--full', action='store_true', dest='full', default=False,
+            help='Discard existing rollups and roll up all of the orders.'),
+        make_option(
+            '--since', dest='since', default=None,
+            help='Roll up orders created since the given date (YYYY-MM-DD).'),
+    )
+
+    def handle(self, *args, **options):
+        started = timezone.now()
+        orders = Order.objects.all()
+
+        if options['full']:
+            OrderSalesDay.objects.all().delete()
+            ProductSalesDay.objects.all().delete()
+        elif options['since']:
+            try:
+                since = datetime.strptime(options['since'], '%Y-%m-%d')
+            except ValueError:
+                raise CommandError('Invalid date \'{}\', use YYYY-MM-DD.'.
+                                   format(options['since']))
+            orders = orders.filter(
+                created__gte=get_day_range(since.date())[0])
+        else:
+            try:
+                orders = orders.filter(
+                    modified__gte=SalesRollupRun.objects.latest().started)
+            except SalesRollupRun.DoesNotExist:
+                pass
+
+        days = get_order_days(orders)
+        order_rows = OrderSalesDay.objects.rollup(days)
+        product_rows = ProductSalesDay.objects.rollup(days)
+        SalesRollupRun.objects.create(started=started)
+
+        print 'Rolled up {} days into {} order and {} product rows.'.format(
+            len(days), order_rows, product_rows)
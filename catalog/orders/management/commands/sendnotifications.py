@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import time
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from catalog.orders.models import QueuedNotification
+
+
+class Command(NoArgsCommand):
+    help = ('Sends queued order notifications, failed ones are retried on '
+            'the next runs.')
+    option_list = NoArgsCommand.option_list + (
+        make_option(
+            '--batch-size', type='int', dest='batch_size', default=100,
+            help='Number of notifications loaded at once.'),
+        make_option(
+            '--loop', action='store_true', dest='loop', default=False,
+            help='Keep running and check the queue every interval.'),
+        make_option(
+            '--interval', type='int', dest='interval', default=10,
+            help='Number of seconds between checks when looping.'),
+    )
+
+    def handle_noargs(self, **options):
+        while True:
+            sent, failed = QueuedNotification.objects.send_due(
+                options['batch_size'])
+            if sent or failed or not options['loop']:
+                print 'Sent {} notifications, {} failed.'.format(sent, failed)
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
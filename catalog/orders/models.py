@@ -1,33 +1,121 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import operator
+import threading
+from uuid import uuid4
+from contextlib import contextmanager
 from decimal import Decimal
+from datetime import datetime, time, timedelta
 
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import Q, F, Count, Sum
+from django.db.models.query import QuerySet, prefetch_related_objects
+from django.core.cache import cache
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.utils import timezone
+from django.utils.encoding import force_text, python_2_unicode_compatible
 from django.utils.translation import get_language, ugettext_lazy as _
 from django.dispatch import receiver
 
 from shop.models_bases import BaseOrder
 from shop.models_bases.managers import OrderManager as BaseOrderManager
 from shop.order_signals import confirmed, completed, shipped, cancelled
+from shop.util.fields import CurrencyField
 
-from catalog.orders.notifications import ClientNotification, OwnersNotification
+from catalog.orders.notifications import (
+    ClientNotification, OwnersNotification, render_messages,
+    send_notifications)
+from catalog.managers import get_related_products_cache_key
+from catalog.models import Product, RelatedProduct, Category
 from catalog.utils import round_2
+from catalog import settings as scs
+
+
+_batch = threading.local()
+
+
+@contextmanager
+def batch_notifications():
+    """
+    Context manager that collects notifications dispatched by order
+    signals and sends or queues them at once on exit. Use it when
+    changing the status of many orders.
+    """
+    if getattr(_batch, 'notifications', None) is not None:
+        yield
+        return
+
+    _batch.notifications = []
+    try:
+        yield
+        notifications = _batch.notifications
+    finally:
+        _batch.notifications = None
+    dispatch_notifications(notifications)
+
+
+def dispatch_notifications(notifications):
+    """
+    Queues the notifications to be sent by the 'sendnotifications'
+    command, or sends them right away if queueing is disabled.
+    """
+    prefetch_order_items(dict(
+        (id(x.order), x.order) for x in notifications).values())
+    if scs.ORDERS_QUEUE_NOTIFICATIONS:
+        QueuedNotification.objects.enqueue_many(notifications)
+    else:
+        send_notifications(notifications)
+
+
+def dispatch_notification(notification):
+    batch = getattr(_batch, 'notifications', None)
+    if batch is not None:
+        batch.append(notification)
+    else:
+        dispatch_notifications([notification])
 
 
 @receiver([confirmed, completed, shipped, cancelled])
 def notify_client(sender, **kwargs):
-    notification = ClientNotification(kwargs.get('order'))
-    notification.send()
+    dispatch_notification(ClientNotification(kwargs.get('order')))
 
 
 @receiver([confirmed, completed, cancelled])
 def notify_owners(sender, **kwargs):
-    notification = OwnersNotification(kwargs.get('order'))
-    notification.send()
+    dispatch_notification(OwnersNotification(kwargs.get('order')))
+
+
+ORDER_ITEMS_LOOKUPS = (
+    'items__extraorderitempricefield_set', 'extraorderpricefield_set')
+
+
+def prefetch_order_items(orders):
+    """
+    Loads items and extra price fields of the given orders in a
+    constant number of queries.
+    """
+    orders = [x for x in orders if not hasattr(x, '_items')]
+    prefetch_related_objects(orders, ORDER_ITEMS_LOOKUPS)
+
+
+class OrderQuerySet(QuerySet):
+    def prefetch_items(self):
+        """
+        Prefetches items and extra price fields used by 'get_items' and
+        'extra_price_fields'.
+        """
+        return self.prefetch_related(*ORDER_ITEMS_LOOKUPS)
 
 
 class OrderManager(BaseOrderManager):
+    def get_queryset(self):
+        return OrderQuerySet(self.model, using=self._db)
+
+    def prefetch_items(self):
+        return self.get_queryset().prefetch_items()
+
     def create_order_object(self, cart, request):
         """
         Override order creation to fill out new fields.
@@ -101,27 +189,38 @@ class Order(BaseOrder):
         return self.billing_name or self.shipping_name or ''
 
     def get_items(self):
-        items = self.items.all()
-        for item in items:
-            item.currency_unit_price = self.calculate_currency(item.unit_price)
-            item.currency_line_total = self.calculate_currency(item.line_total)
-            item.currency_line_subtotal = \
-                self.calculate_currency(item.line_subtotal)
+        """
+        Returns order items with their extra price fields and prices in
+        the order currency, computed once per instance.
+        """
+        if not hasattr(self, '_items'):
+            items = list(self.items.all())
+            for item in items:
+                item.currency_unit_price = self.calculate_currency(
+                    item.unit_price)
+                item.currency_line_total = self.calculate_currency(
+                    item.line_total)
+                item.currency_line_subtotal = self.calculate_currency(
+                    item.line_subtotal)
 
-            fields = []
-            for field in item.extraorderitempricefield_set.all():
-                field.currency_value = self.calculate_currency(field.value)
-                fields.append(field)
-            item.extra_price_fields = fields
-        return items
+                fields = []
+                for field in item.extraorderitempricefield_set.all():
+                    field.currency_value = self.calculate_currency(
+                        field.value)
+                    fields.append(field)
+                item.extra_price_fields = fields
+            self._items = items
+        return self._items
 
     @property
     def extra_price_fields(self):
-        fields = []
-        for field in self.extraorderpricefield_set.all():
-            field.currency_value = self.calculate_currency(field.value)
-            fields.append(field)
-        return fields
+        if not hasattr(self, '_extra_price_fields'):
+            fields = []
+            for field in self.extraorderpricefield_set.all():
+                field.currency_value = self.calculate_currency(field.value)
+                fields.append(field)
+            self._extra_price_fields = fields
+        return self._extra_price_fields
 
     def currency_order_subtotal(self):
         return self.calculate_currency(self.order_subtotal)
@@ -133,3 +232,526 @@ class Order(BaseOrder):
 
     def calculate_currency(self, price):
         return round_2(price * self.currency_factor)
+
+
+def chunked(items, size=500):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class ProductCoPurchaseManager(models.Manager):
+    def add_counts(self, counts):
+        """
+        Adds the given pair counts, a dictionary of '(product_id,
+        other_id): count', to the stored ones. Counts can be negative,
+        pairs left with no count are removed unless they are related.
+        """
+        for product_ids in chunked(set(x[0] for x in counts)):
+            queryset = self.filter(product__in=product_ids)
+            rows = {}
+            for pk, product_id, other_id, count in queryset.values_list(
+                    'pk', 'product_id', 'other_id', 'count'):
+                rows[(product_id, other_id)] = (pk, count)
+
+            # Existing counts are updated in place, grouped by the delta.
+            deltas, created = {}, []
+            for key in [x for x in counts if x[0] in product_ids]:
+                if key in rows:
+                    pk, count = rows[key]
+                    delta = max(counts[key], -count)
+                    if delta:
+                        deltas.setdefault(delta, []).append(pk)
+                elif counts[key] > 0:
+                    created.append(self.model(
+                        product_id=key[0], other_id=key[1],
+                        count=counts[key]))
+
+            with transaction.atomic():
+                for delta, pks in deltas.items():
+                    for chunk in chunked(pks):
+                        self.filter(pk__in=chunk).update(
+                            count=F('count') + delta)
+                self.bulk_create(created)
+                if any(x < 0 for x in deltas):
+                    queryset.filter(count=0, is_related=False).delete()
+
+    def update_related(self, product_ids, top, kind):
+        """
+        Makes the top co-purchased products of the given products their
+        related products of the given kind. Relations that were added
+        by hand are left untouched, pairs with no count are unrelated.
+        """
+        for chunk in chunked(product_ids):
+            existing = set(RelatedProduct.objects.filter(
+                base_product__in=chunk, kind=kind).values_list(
+                'base_product_id', 'product_id'))
+
+            relate, unrelate, seen = [], [], {}
+            for pk, product_id, other_id, count, is_related in self.filter(
+                    product__in=chunk).order_by(
+                    'product', '-count', 'other').values_list(
+                    'pk', 'product_id', 'other_id', 'count', 'is_related'):
+                seen[product_id] = seen.get(product_id, 0) + 1
+                if seen[product_id] <= top and count:
+                    if (product_id, other_id) not in existing:
+                        relate.append((pk, product_id, other_id))
+                elif is_related:
+                    unrelate.append((pk, product_id, other_id))
+
+            with transaction.atomic():
+                for part in chunked(unrelate):
+                    RelatedProduct.objects.filter(kind=kind).filter(
+                        reduce(operator.or_, (
+                            Q(base_product_id=x[1], product_id=x[2])
+                            for x in part))).delete()
+                    self.filter(pk__in=[x[0] for x in part]).update(
+                        is_related=False)
+                if unrelate:
+                    self.filter(
+                        product__in=chunk, count=0, is_related=False).delete()
+                RelatedProduct.objects.bulk_create([RelatedProduct(
+                    base_product_id=x[1], product_id=x[2], kind=kind)
+                    for x in relate])
+                for part in chunked(relate):
+                    self.filter(pk__in=[x[0] for x in part]).update(
+                        is_related=True)
+
+            cache.delete_many([get_related_products_cache_key(x)
+                               for x in chunk])
+
+    def clear(self, kind):
+        """
+        Removes all counts, relations that were generated from them and
+        the record of counted orders.
+        """
+        related = self.filter(is_related=True).values_list(
+            'product_id', 'other_id')
+        for chunk in chunked(related):
+            RelatedProduct.objects.filter(kind=kind).filter(
+                reduce(operator.or_, (Q(base_product_id=x[0], product_id=x[1])
+                                      for x in chunk))).delete()
+        self.all().delete()
+        ProductCoPurchaseOrder.objects.all().delete()
+
+
+class ProductCoPurchase(models.Model):
+    """
+    Number of orders in which two (top level) products were bought
+    together, used to generate related products.
+    """
+    product = models.ForeignKey(
+        Product, related_name='+', verbose_name=_('Product'))
+    other = models.ForeignKey(
+        Product, related_name='+', verbose_name=_('Other product'))
+    count = models.PositiveIntegerField(_('Count'), default=0)
+    is_related = models.BooleanField(
+        _('Is related?'), default=False, editable=False,
+        help_text=_('Was a related product generated for this pair.'))
+
+    objects = ProductCoPurchaseManager()
+
+    class Meta:
+        db_table = 'catalog_orders_product_co_purchases'
+        verbose_name = _('Product co-purchase')
+        verbose_name_plural = _('Product co-purchases')
+        unique_together = ('product', 'other')
+
+
+class ProductCoPurchaseOrder(models.Model):
+    """
+    Orders that are counted into co-purchases.
+    """
+    order = models.OneToOneField(
+        Order, primary_key=True, related_name='+', verbose_name=_('Order'))
+
+    class Meta:
+        db_table = 'catalog_orders_product_co_purchase_orders'
+        verbose_name = _('Product co-purchase order')
+        verbose_name_plural = _('Product co-purchase orders')
+
+
+class ProductCoPurchaseRun(models.Model):
+    """
+    Keeps track of the last co-purchases count, orders changed since
+    are counted (or discounted) on the next run.
+    """
+    started = models.DateTimeField(_('Started'))
+
+    class Meta:
+        db_table = 'catalog_orders_product_co_purchase_runs'
+        verbose_name = _('Product co-purchase run')
+        verbose_name_plural = _('Product co-purchase runs')
+        get_latest_by = 'started'
+
+
+class QueuedNotificationManager(models.Manager):
+    def enqueue(self, notification):
+        """
+        Renders the notification and saves it to the queue, returns None
+        if the notification has no recipients.
+        """
+        queued = self.enqueue_many([notification])
+        return queued[0] if queued else None
+
+    def enqueue_many(self, notifications):
+        """
+        Renders the notifications and saves them to the queue in a
+        single query. Returns a list of queued notifications.
+        """
+        queued = []
+        for notification, message in render_messages(notifications):
+            html_body = [x for x, mimetype in message.alternatives
+                         if mimetype == 'text/html']
+            queued.append(self.model(
+                order=notification.order, subject=message.subject,
+                text_body=message.body, html_body=(html_body or [''])[0],
+                from_email=message.from_email,
+                recipients=','.join(message.to)))
+        self.bulk_create(queued)
+        return queued
+
+    def due(self):
+        """
+        Returns notifications that should be sent now.
+        """
+        return self.filter(
+            sent__isnull=True, next_attempt__lte=timezone.now(),
+            attempts__lt=scs.ORDERS_NOTIFICATION_MAX_ATTEMPTS)
+
+    def claim(self, batch_size=100):
+        """
+        Claims a batch of due notifications for the calling worker by
+        moving their next attempt past the claim timeout, a conditional
+        update makes sure only one worker gets each of them. Returns a
+        list of claimed notifications.
+        """
+        ids = list(self.due().order_by('next_attempt', 'pk').values_list(
+            'pk', flat=True)[:batch_size])
+        if not ids:
+            return []
+        token = uuid4().hex
+        self.due().filter(pk__in=ids).update(
+            claim=token, next_attempt=timezone.now() + timedelta(
+                seconds=scs.ORDERS_NOTIFICATION_CLAIM_TIMEOUT))
+        return list(self.filter(claim=token).order_by('pk'))
+
+    def send_due(self, batch_size=100, connection=None):
+        """
+        Sends due notifications in batches over a single connection, the
+        connection is reopened after a failure. Failed ones are retried
+        later with an exponential backoff, claimed ones that were not
+        sent (eg. a worker died) after the claim timeout. Returns a tuple
+        of sent and failed notification counts.
+        """
+        if connection is None:
+            connection = get_connection(scs.ORDERS_EMAIL_BACKEND)
+
+        sent = failed = 0
+        connection.open()
+        try:
+            while True:
+                batch = self.claim(batch_size)
+                if not batch:
+                    break
+
+                sent_ids = []
+                try:
+                    for obj in batch:
+                        try:
+                            obj.get_message(connection).send()
+                        except Exception as e:
+                            obj.set_failed(e)
+                            failed += 1
+                            # Connection may be broken, reopen it.
+                            connection.close()
+                            connection.open()
+                        else:
+                            sent_ids.append(obj.pk)
+                finally:
+                    self.filter(pk__in=sent_ids).update(
+                        sent=timezone.now(), attempts=F('attempts') + 1,
+                        last_error='')
+                sent += len(sent_ids)
+        finally:
+            connection.close()
+        return sent, failed
+
+
+@python_2_unicode_compatible
+class QueuedNotification(models.Model):
+    """
+    Rendered order notification waiting to be sent.
+    """
+    order = models.ForeignKey(
+        Order, blank=True, null=True, related_name='notifications',
+        on_delete=models.SET_NULL, verbose_name=_('Order'))
+    subject = models.CharField(_('Subject'), max_length=255)
+    text_body = models.TextField(_('Text body'))
+    html_body = models.TextField(_('HTML body'), blank=True)
+    from_email = models.CharField(_('From email'), max_length=255)
+    recipients = models.TextField(
+        _('Recipients'), help_text=_('Comma separated emails.'))
+
+    created = models.DateTimeField(_('Created'), auto_now_add=True)
+    next_attempt = models.DateTimeField(
+        _('Next attempt'), default=timezone.now, db_index=True)
+    attempts = models.PositiveIntegerField(_('Attempts'), default=0)
+    sent = models.DateTimeField(_('Sent'), blank=True, null=True)
+    last_error = models.TextField(_('Last error'), blank=True)
+    claim = models.CharField(
+        max_length=32, blank=True, db_index=True, editable=False)
+
+    objects = QueuedNotificationManager()
+
+    class Meta:
+        db_table = 'catalog_orders_queued_notifications'
+        verbose_name = _('Queued notification')
+        verbose_name_plural = _('Queued notifications')
+
+    def __str__(self):
+        return self.subject
+
+    def get_message(self, connection=None):
+        message = EmailMultiAlternatives(
+            self.subject, self.text_body, self.from_email,
+            self.recipients.split(','), connection=connection)
+        if self.html_body:
+            message.attach_alternative(self.html_body, 'text/html')
+        return message
+
+    def set_failed(self, error):
+        """
+        Records a failed attempt and schedules the next one.
+        """
+        delay = scs.ORDERS_NOTIFICATION_RETRY_DELAY * 2 ** self.attempts
+        self.attempts += 1
+        self.last_error = force_text(error)
+        self.next_attempt = timezone.now() + timedelta(seconds=delay)
+        self.save(update_fields=['attempts', 'last_error', 'next_attempt'])
+
+
+SALES_STATUSES = (Order.CONFIRMED, Order.COMPLETED, Order.SHIPPED)
+
+
+def get_day_range(day):
+    """
+    Returns a tuple of (aware) datetimes the given day starts and ends on.
+    """
+    start = datetime.combine(day, time.min)
+    end = start + timedelta(days=1)
+    if settings.USE_TZ:
+        tz = timezone.get_current_timezone()
+        start, end = timezone.make_aware(start, tz), timezone.make_aware(
+            end, tz)
+    return start, end
+
+
+def get_order_days(queryset):
+    """
+    Returns a list of (local) days the given orders were created on.
+    """
+    days = set()
+    for created in queryset.values_list('created', flat=True).iterator():
+        if timezone.is_aware(created):
+            created = timezone.localtime(created)
+        days.add(created.date())
+    return sorted(days)
+
+
+def add_average(row, key='currency_revenue'):
+    """
+    Adds the average order value, computed from the given revenue key.
+    """
+    row['average'] = round_2(
+        row[key] / row['orders']) if row['orders'] else None
+    return row
+
+
+class SalesDayManager(models.Manager):
+    def rollup(self, days, get_rows):
+        """
+        Recomputes sales of the given days with rows returned by
+        `get_rows(day)`. Returns a number of rows.
+        """
+        count = 0
+        for day in sorted(set(days)):
+            rows = get_rows(day)
+            with transaction.atomic():
+                self.filter(date=day).delete()
+                self.bulk_create(rows)
+            count += len(rows)
+        return count
+
+    def between(self, date_from=None, date_to=None):
+        queryset = self.all()
+        if date_from is not None:
+            queryset = queryset.filter(date__gte=date_from)
+        if date_to is not None:
+            queryset = queryset.filter(date__lte=date_to)
+        return queryset
+
+
+class OrderSalesDayManager(SalesDayManager):
+    def rollup(self, days):
+        return super(OrderSalesDayManager, self).rollup(days, self.get_rows)
+
+    def get_rows(self, day):
+        start, end = get_day_range(day)
+        rows = {}
+        for values in Order.objects.filter(
+                created__gte=start, created__lt=end,
+                status__in=SALES_STATUSES).values(
+                'currency_code', 'currency_factor').annotate(
+                count=Count('pk'), total=Sum('order_total')).order_by():
+            code = values['currency_code'] or ''
+            row = rows.setdefault(code, self.model(
+                date=day, currency_code=code))
+            row.orders += values['count']
+            row.revenue += values['total']
+            row.currency_revenue += round_2(
+                values['total'] * values['currency_factor'])
+        return list(rows.values())
+
+    def by_currency(self, date_from=None, date_to=None):
+        """
+        Returns number of orders, revenue and average order value
+        per currency.
+        """
+        return [add_average(x) for x in self.between(
+            date_from, date_to).values('currency_code').annotate(
+            orders=Sum('orders'), revenue=Sum('revenue'),
+            currency_revenue=Sum('currency_revenue')).order_by(
+            'currency_code')]
+
+
+class ProductSalesDayManager(SalesDayManager):
+    def rollup(self, days):
+        return super(ProductSalesDayManager, self).rollup(
+            days, self.get_rows)
+
+    def get_rows(self, day):
+        start, end = get_day_range(day)
+        rows = {}
+        for values in Order.objects.filter(
+                created__gte=start, created__lt=end,
+                status__in=SALES_STATUSES,
+                items__product__isnull=False).values(
+                'items__product_id', 'items__product__category_id',
+                'items__product__parent__category_id', 'currency_code',
+                'currency_factor').annotate(
+                count=Count('pk', distinct=True),
+                quantity=Sum('items__quantity'),
+                total=Sum('items__line_total')).order_by():
+            product_id = values['items__product_id']
+            code = values['currency_code'] or ''
+            row = rows.setdefault((product_id, code), self.model(
+                date=day, product_id=product_id, currency_code=code,
+                # Variants are categorized by their parent.
+                category_id=(values['items__product__parent__category_id'] or
+                             values['items__product__category_id'])))
+            row.orders += values['count']
+            row.quantity += values['quantity']
+            row.revenue += values['total']
+            row.currency_revenue += round_2(
+                values['total'] * values['currency_factor'])
+        return list(rows.values())
+
+    def by_product(self, date_from=None, date_to=None, limit=None):
+        """
+        Returns products sorted by revenue, with units and orders sold
+        and the average revenue per order.
+        """
+        rows = self.between(date_from, date_to).values(
+            'product_id').annotate(
+            orders=Sum('orders'), quantity=Sum('quantity'),
+            revenue=Sum('revenue')).order_by('-revenue', 'product_id')
+        if limit is not None:
+            rows = rows[:limit]
+        return [add_average(x, 'revenue') for x in rows]
+
+    def by_category(self, date_from=None, date_to=None, category=None):
+        """
+        Returns totals of the given category subtree (or all categories)
+        grouped by category.
+        """
+        queryset = self.between(date_from, date_to)
+        if category is not None:
+            queryset = queryset.filter(
+                category__tree_id=category.tree_id,
+                category__lft__gte=category.lft,
+                category__rght__lte=category.rght)
+        return [add_average(x, 'revenue') for x in queryset.values(
+            'category_id').annotate(
+            orders=Sum('orders'), quantity=Sum('quantity'),
+            revenue=Sum('revenue')).order_by('-revenue')]
+
+    def for_category(self, category, date_from=None, date_to=None):
+        """
+        Returns totals of products in the category and it's descendants,
+        orders with many of these products are counted once per product.
+        """
+        return add_average(self.between(date_from, date_to).filter(
+            category__tree_id=category.tree_id,
+            category__lft__gte=category.lft,
+            category__rght__lte=category.rght).aggregate(
+            orders=Sum('orders'), quantity=Sum('quantity'),
+            revenue=Sum('revenue')), 'revenue')
+
+
+class SalesDayBase(models.Model):
+    """
+    Daily sales rollup, revenue is kept both in the default and in the
+    orders currency.
+    """
+    date = models.DateField(_('Date'))
+    currency_code = models.CharField(
+        _('Currency code'), max_length=3, blank=True)
+    orders = models.PositiveIntegerField(_('Orders'), default=0)
+    revenue = CurrencyField(verbose_name=_('Revenue'))
+    currency_revenue = CurrencyField(verbose_name=_('Revenue in currency'))
+
+    class Meta:
+        abstract = True
+
+
+class OrderSalesDay(SalesDayBase):
+    objects = OrderSalesDayManager()
+
+    class Meta:
+        db_table = 'catalog_orders_order_sales_days'
+        verbose_name = _('Order sales day')
+        verbose_name_plural = _('Order sales days')
+        unique_together = ('date', 'currency_code')
+
+
+class ProductSalesDay(SalesDayBase):
+    product = models.ForeignKey(
+        Product, related_name='+', verbose_name=_('Product'))
+    category = models.ForeignKey(
+        Category, blank=True, null=True, related_name='+',
+        on_delete=models.SET_NULL, verbose_name=_('Category'))
+    quantity = models.PositiveIntegerField(_('Quantity'), default=0)
+
+    objects = ProductSalesDayManager()
+
+    class Meta:
+        db_table = 'catalog_orders_product_sales_days'
+        verbose_name = _('Product sales day')
+        verbose_name_plural = _('Product sales days')
+        unique_together = ('date', 'product', 'currency_code')
+        index_together = ('category', 'date')
+
+
+class SalesRollupRun(models.Model):
+    """
+    Keeps track of the last sales rollup, orders changed since
+    are rolled up on the next run.
+    """
+    started = models.DateTimeField(_('Started'))
+
+    class Meta:
+        db_table = 'catalog_orders_sales_rollup_runs'
+        verbose_name = _('Sales rollup run')
+        verbose_name_plural = _('Sales rollup runs')
+        get_latest_by = 'started'
@@ -2,9 +2,39 @@
 from __future__ import unicode_literals
 
 from django.conf import settings
-from django.core.mail import EmailMultiAlternatives
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.template import loader, Context, TemplateDoesNotExist
-from django.utils.translation import activate, get_language
+from django.utils import translation
+
+from catalog import settings as scs
+
+
+def render_messages(notifications):
+    """
+    Renders messages of the given notifications, compiled templates are
+    shared between them. Returns a list of notification and message
+    pairs, skipping notifications without recipients.
+    """
+    templates, messages = {}, []
+    for notification in notifications:
+        notification.templates = templates
+        message = notification.render_message()
+        if message:
+            messages.append((notification, message))
+    return messages
+
+
+def send_notifications(notifications, connection=None):
+    """
+    Renders the given notifications and sends them over a single
+    connection. Returns the number of sent messages.
+    """
+    messages = [x[1] for x in render_messages(notifications)]
+    if not messages:
+        return 0
+    if connection is None:
+        connection = get_connection(scs.ORDERS_EMAIL_BACKEND)
+    return connection.send_messages(messages)
 
 
 class Notification(object):
@@ -13,6 +43,7 @@ class Notification(object):
     """
     order = None
     request = None
+    templates = None
     subject_template_name = None
     text_body_template_name = None
     html_body_template_name = None
@@ -28,19 +59,37 @@ class Notification(object):
     def get_recipients(self):
         return []
 
+    def get_template(self, template_name):
+        """
+        Returns a compiled template, caching it in 'templates' dict
+        when one is shared between notifications.
+        """
+        if self.templates is None:
+            return loader.get_template(template_name)
+        if template_name not in self.templates:
+            try:
+                template = loader.get_template(template_name)
+            except TemplateDoesNotExist:
+                template = None
+            self.templates[template_name] = template
+        if self.templates[template_name] is None:
+            raise TemplateDoesNotExist(template_name)
+        return self.templates[template_name]
+
+    def render_template(self, template_name):
+        return self.get_template(template_name).render(
+            Context({'order': self.order}))
+
     def get_subject(self):
-        subject = loader.render_to_string(
-            self.subject_template_name, Context({'order': self.order}))
+        subject = self.render_template(self.subject_template_name)
         return subject.join(subject.splitlines())
 
     def get_text_body(self):
-        return loader.render_to_string(
-            self.text_body_template_name, Context({'order': self.order}))
+        return self.render_template(self.text_body_template_name)
 
     def get_html_body(self):
         try:
-            return loader.render_to_string(
-                self.html_body_template_name, Context({'order': self.order}))
+            return self.render_template(self.html_body_template_name)
         except TemplateDoesNotExist:
             return None
 
@@ -57,12 +106,17 @@ class Notification(object):
                 message.attach_alternative(html_body, 'text/html')
             return message
 
+    def render_message(self):
+        """
+        Returns the message rendered in the orders language.
+        """
+        with translation.override(self.order.language_code):
+            return self.get_message()
+
     def send(self):
-        message = self.get_message()
+        message = self.render_message()
         if message:
-            activate(self.order.language_code)
             message.send()
-            activate(get_language())
 
 
 class ClientNotification(Notification):
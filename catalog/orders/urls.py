@@ -3,7 +3,7 @@ from __future__ import unicode_literals
 
 from django.conf.urls import url
 
-from shop.views.order import OrderListView, OrderDetailView
+from catalog.orders.views import OrderListView, OrderDetailView
 
 
 # Pats are automatically inserted into urlpatterns in catalog urls.py
@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from shop.views.order import (
+    OrderListView as BaseOrderListView,
+    OrderDetailView as BaseOrderDetailView)
+
+
+class OrderListView(BaseOrderListView):
+    def get_queryset(self):
+        return super(OrderListView, self).get_queryset().prefetch_items()
+
+
+class OrderDetailView(BaseOrderDetailView):
+    def get_queryset(self):
+        return super(OrderDetailView, self).get_queryset().prefetch_items()
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management.base import NoArgsCommand
+
+from catalog.reviews.models import ProductRating
+
+
+class Command(NoArgsCommand):
+    help = ('Recounts product rating summaries from reviews, summaries are '
+            'otherwise kept up to date as reviews change.')
+
+    def handle_noargs(self, **options):
+        count = ProductRating.objects.rebuild()
+        print 'Rebuilt ratings of {} products.'.format(count)
@@ -1,11 +1,18 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from django.db import models
+from decimal import Decimal
+from uuid import uuid4
+
+from django.db import models, transaction
+from django.db.models import F, Count
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
 from django.conf import settings
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
 from django.utils.translation import ugettext_lazy as _
-from django.utils.encoding import python_2_unicode_compatible
+from django.utils.encoding import python_2_unicode_compatible, force_str
 
 from catalog.models import Product
 
@@ -13,6 +20,24 @@ from catalog.models import Product
 USER_MODEL = getattr(settings, 'AUTH_USER_MODEL', 'auth.User')
 
 
+def get_reviews_version(product_id):
+    """
+    Returns a version of product reviews, it changes whenever any of the
+    reviews change. Use it in cache keys of rendered reviews.
+    """
+    key = 'catalog_reviews_version_{}'.format(product_id)
+    version = cache.get(key)
+    if version is None:
+        version = uuid4().hex
+        cache.set(key, version, None)
+    return version
+
+
+def invalidate_reviews(*product_ids):
+    cache.delete_many(['catalog_reviews_version_{}'.format(x)
+                       for x in product_ids])
+
+
 @python_2_unicode_compatible
 class Review(models.Model):
     """
@@ -49,3 +74,115 @@ class Review(models.Model):
     def get_absolute_url(self):
         return reverse(
             'catalog_review_detail', args=[self.product.get_slug(), self.pk])
+
+
+class ProductRatingManager(models.Manager):
+    def add(self, product_id, rating, count=1):
+        """
+        Adds (or with a negative count removes) a rating to the products
+        summary, counts are updated in place with F expressions.
+        """
+        with transaction.atomic():
+            if count > 0:
+                self.get_or_create(product_id=product_id)
+            queryset = self.filter(product_id=product_id)
+            queryset.update(**{
+                'count': F('count') + count,
+                'sum': F('sum') + rating * count,
+                'rating_{}'.format(rating): F(
+                    'rating_{}'.format(rating)) + count,
+            })
+            queryset.filter(count__gt=0).update(
+                average=F('sum') * Decimal('1.0') / F('count'))
+            queryset.filter(count=0).update(average=None)
+
+    def rebuild(self, product_ids=None):
+        """
+        Recounts summaries of the given (or all) products from reviews.
+        """
+        reviews = Review.objects.all()
+        if product_ids is not None:
+            reviews = reviews.filter(product_id__in=product_ids)
+        summaries = {}
+        for product_id, rating, count in reviews.values_list(
+                'product_id', 'rating').annotate(Count('pk')).order_by():
+            obj = summaries.setdefault(
+                product_id, self.model(product_id=product_id))
+            obj.count += count
+            obj.sum += rating * count
+            setattr(obj, 'rating_{}'.format(rating), count)
+        for obj in summaries.values():
+            obj.average = Decimal(obj.sum) / obj.count
+
+        with transaction.atomic():
+            queryset = self.all()
+            if product_ids is not None:
+                queryset = queryset.filter(product_id__in=product_ids)
+            queryset.delete()
+            self.bulk_create(summaries.values())
+        return len(summaries)
+
+
+class ProductRating(models.Model):
+    """
+    Summary of product reviews, kept up to date as reviews change.
+    """
+    product = models.OneToOneField(
+        Product, related_name='rating', verbose_name=_('Product'))
+    count = models.PositiveIntegerField(_('Count'), default=0)
+    sum = models.PositiveIntegerField(_('Sum'), default=0)
+    average = models.DecimalField(
+        _('Average'), max_digits=3, decimal_places=2, blank=True, null=True,
+        db_index=True)
+
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+
+    objects = ProductRatingManager()
+
+    class Meta:
+        db_table = 'catalog_reviews_product_ratings'
+        verbose_name = _('Product rating')
+        verbose_name_plural = _('Product ratings')
+
+    def get_histogram(self):
+        """
+        Returns a list of review counts for ratings 1 to 5.
+        """
+        return [getattr(self, 'rating_{}'.format(x[0]))
+                for x in Review.RATING_CHOICES]
+
+    @property
+    def as_dict(self):
+        average = force_str(self.average) if self.average else None
+        return dict(
+            count=self.count,
+            average=average,
+            histogram=self.get_histogram(),
+        )
+
+
+@receiver(post_init, sender=Review)
+def review_initialized(sender, instance, **kwargs):
+    # Keep the loaded values to update summaries when they change.
+    instance._loaded = (instance.product_id, instance.rating)
+
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, created, **kwargs):
+    current = (instance.product_id, instance.rating)
+    if not created and instance._loaded != current:
+        ProductRating.objects.add(*instance._loaded, count=-1)
+    if created or instance._loaded != current:
+        ProductRating.objects.add(*current)
+    invalidate_reviews(instance._loaded[0], instance.product_id)
+    instance._loaded = current
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    ProductRating.objects.add(*instance._loaded, count=-1)
+    invalidate_reviews(instance._loaded[0])
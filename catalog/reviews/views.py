@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+from django.core.cache import cache
 from django.core.urlresolvers import reverse_lazy
 from django.http import HttpResponseRedirect
 from django.core.exceptions import PermissionDenied
@@ -8,8 +9,9 @@ from django.views.generic import (
     ListView, DetailView, CreateView, DeleteView, UpdateView)
 
 from catalog.models import Product
-from catalog.reviews.models import Review
+from catalog.reviews.models import Review, get_reviews_version
 from catalog.utils.shortcuts import get_by_slug_or_404
+from catalog import settings as scs
 
 
 class ProductMixin(object):
@@ -43,12 +45,59 @@ class OwnerRequiredMixin(object):
 
 
 class ReviewListView(ProductMixin, ListView):
+    """
+    Lists product reviews newest first, paginated with a cursor passed
+    as 'before' GET parameter (id of the last review on previous page).
+    Ids of reviews on a page are cached until any of the product reviews
+    change, reviews (and their users) are loaded by these ids.
+    """
     model = Review
     template_name = 'shop/reviews/review_list.html'
+    per_page = scs.REVIEWS_PER_PAGE
 
     def get_queryset(self):
         qs = super(ReviewListView, self).get_queryset()
-        return qs.filter(product=self.product)
+        return qs.filter(product=self.product).select_related(
+            'user').order_by('-pk')
+
+    def get_cursor(self):
+        cursor = self.request.GET.get('before', '')
+        return int(cursor) if cursor.isdigit() else None
+
+    def get_page(self, cursor):
+        queryset = self.object_list
+        if cursor is not None:
+            queryset = queryset.filter(pk__lt=cursor)
+        reviews = list(queryset[:self.per_page + 1])
+        next_cursor = None
+        if len(reviews) > self.per_page:
+            reviews = reviews[:self.per_page]
+            next_cursor = reviews[-1].pk
+        return reviews, next_cursor
+
+    def get_context_data(self, **kwargs):
+        cursor = self.get_cursor()
+        version = get_reviews_version(self.product.pk)
+        cache_key = 'catalog_reviews_{}_{}_{}'.format(
+            self.product.pk, version, cursor or '')
+
+        page = cache.get(cache_key)
+        if page is None:
+            reviews, next_cursor = self.get_page(cursor)
+            cache.set(cache_key, ([x.pk for x in reviews], next_cursor),
+                      scs.CACHE_TIMEOUT)
+        else:
+            ids, next_cursor = page
+            reviews = list(self.object_list.filter(pk__in=ids)) if ids else []
+
+        context = {
+            'object_list': reviews,
+            'cursor': cursor,
+            'next_cursor': next_cursor,
+            'reviews_version': version,
+        }
+        context.update(kwargs)
+        return super(ReviewListView, self).get_context_data(**context)
 
 
 class ReviewDetailView(ProductMixin, DetailView):
@@ -67,8 +116,7 @@ class ReviewCreateView(ProductMixin, CreateView):
         update view for that review.
         """
         user = getattr(request, 'user', None)
-        product = get_by_slug_or_404(Product, kwargs.get('slug', None))
-        filters = {'product': product}
+        filters = {'product': self.product}
 
         if user and user.is_authenticated():
             filters['user'] = user
@@ -80,7 +128,7 @@ class ReviewCreateView(ProductMixin, CreateView):
                 review = Review.objects.get(**filters)
                 return HttpResponseRedirect(reverse_lazy(
                     'catalog_review_update',
-                    args=[product.get_slug(), review.pk]))
+                    args=[self.product.get_slug(), review.pk]))
             except Review.DoesNotExist:
                 pass
 
@@ -91,8 +139,7 @@ class ReviewCreateView(ProductMixin, CreateView):
         Force product and user values into a form after it's validated
         and save review_id to session.
         """
-        product = get_by_slug_or_404(Product, self.kwargs.get('slug', None))
-        form.instance.product = product
+        form.instance.product = self.product
 
         user = getattr(self.request, 'user', None)
         form.instance.user = user if user and user.is_authenticated() else None
@@ -113,4 +160,4 @@ class ReviewDeleteView(OwnerRequiredMixin, ProductMixin, DeleteView):
 
     def get_success_url(self):
         return reverse_lazy(
-            'catalog_review_list', args=[self.object.product.get_slug()])
+            'catalog_review_list', args=[self.product.get_slug()])
@@ -22,6 +22,17 @@ ACTIVE_FIELD_HELP_TEXT = _(
 PRODUCT_CHANGE_FORM_TEMPLATE = (
     'admin/catalog/product_change_form.html')
 
+GENERATE_VARIANTS_TEMPLATE = (
+    'admin/catalog/generate_variants.html')
+
+PRODUCT_PARENT_FILTER_TEMPLATE = (
+    'admin/catalog/product_parent_filter.html')
+
+# Number of group products listed in admin parent filter, above it the
+# filter turns into a search field with autocomplete.
+PRODUCT_PARENT_FILTER_LIMIT = getattr(
+    settings, 'CATALOG_PRODUCT_PARENT_FILTER_LIMIT', 100)
+
 ATTRIBUTE_TEMPLATE_CHOICES = getattr(
     settings, 'CATALOG_ATTRIBUTE_TEMPLATE_CHOICES', (
         ('radio', _('Radio')),
@@ -34,12 +45,27 @@ RELATED_PRODUCT_KIND_CHOICES = getattr(
     ))
 
 PRODUCTS_PER_PAGE = getattr(settings, 'CATALOG_PRODUCTS_PER_PAGE', 6)
+REVIEWS_PER_PAGE = getattr(settings, 'CATALOG_REVIEWS_PER_PAGE', 10)
+
+# Number of seconds computed catalog data (eg. product variations) is
+# kept in cache. Cached data is also invalidated when it changes.
+CACHE_TIMEOUT = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 60 * 60)
+
+# Number of seconds a suffixed slug handed out by 'slug_num_suffixes'
+# is reserved for, so that concurrent users don't get the same one.
+SLUG_RESERVE_TIMEOUT = getattr(
+    settings, 'CATALOG_SLUG_RESERVE_TIMEOUT', 60 * 10)
+
+# Number of seconds product quantity added to a cart is reserved for.
+STOCK_RESERVATION_TIMEOUT = getattr(
+    settings, 'CATALOG_STOCK_RESERVATION_TIMEOUT', 60 * 15)
 
 # Toggles.
 HAS_CATEGORIES = getattr(settings, 'CATALOG_HAS_CATEGORIES', True)
 HAS_BRANDS = getattr(settings, 'CATALOG_HAS_BRANDS', True)
 HAS_MANUFACTURERS = getattr(settings, 'CATALOG_HAS_MANUFACTURERS', True)
 HAS_MODIFIER_CODES = getattr(settings, 'CATALOG_HAS_MODIFIER_CODES', True)
+HAS_REVIEWS = 'catalog.reviews' in settings.INSTALLED_APPS
 
 PRODUCT_URL = getattr(
     settings, 'CATALOG_PRODUCT_URL', 'products')
@@ -66,3 +92,30 @@ MODIFIER_CONDITIONS = getattr(settings, 'CATALOG_MODIFIER_CONDITIONS', [
     'catalog.modifier_conditions.WeightGreaterThanModifierCondition',
     'catalog.modifier_conditions.WeightLessThanModifierCondition',
 ])
+
+# Set to True to queue order notifications and send them with the
+# 'sendnotifications' command, instead of while handling the order signal.
+ORDERS_QUEUE_NOTIFICATIONS = getattr(
+    settings, 'CATALOG_ORDERS_QUEUE_NOTIFICATIONS', False)
+
+# Email backend used to send queued notifications, defaults to
+# EMAIL_BACKEND. Use the console or file backend in development.
+ORDERS_EMAIL_BACKEND = getattr(settings, 'CATALOG_ORDERS_EMAIL_BACKEND', None)
+
+# Number of times sending a queued notification is attempted, and the
+# number of seconds before the first retry (doubled on every next one).
+ORDERS_NOTIFICATION_MAX_ATTEMPTS = getattr(
+    settings, 'CATALOG_ORDERS_NOTIFICATION_MAX_ATTEMPTS', 5)
+ORDERS_NOTIFICATION_RETRY_DELAY = getattr(
+    settings, 'CATALOG_ORDERS_NOTIFICATION_RETRY_DELAY', 60)
+
+# Number of seconds a batch of queued notifications is claimed by a
+# worker for, unsent ones are picked up by other workers afterwards.
+ORDERS_NOTIFICATION_CLAIM_TIMEOUT = getattr(
+    settings, 'CATALOG_ORDERS_NOTIFICATION_CLAIM_TIMEOUT', 60 * 10)
+
+ORDERS_SALES_REPORT_TEMPLATE = 'admin/orders/sales_report.html'
+
+# Number of top selling products listed in the sales report.
+ORDERS_SALES_REPORT_LIMIT = getattr(
+    settings, 'CATALOG_ORDERS_SALES_REPORT_LIMIT', 50)
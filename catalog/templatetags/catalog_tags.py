@@ -3,7 +3,7 @@ from __future__ import unicode_literals
 
 from django import template
 
-from catalog.models import Attribute, Product
+from catalog.models import Attribute, Product, RelatedProduct
 
 
 register = template.Library()
@@ -58,3 +58,12 @@ def get_price_steps(steps=5, products=None):
 
     steps_count = list(set(price_steps))
     return price_steps if len(steps_count) > 1 else []
+
+
+@register.assignment_tag
+def get_related_products(product):
+    """
+    Returns active and available related products of the given product
+    grouped by kind, eg. '{% get_related_products product as related %}'.
+    """
+    return RelatedProduct.objects.for_products([product])[product.pk]
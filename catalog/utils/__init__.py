@@ -1,25 +1,72 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import re
+from hashlib import md5
 from decimal import Decimal, ROUND_UP
 
-from django.core.exceptions import ObjectDoesNotExist
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.encoding import force_bytes
+from django.utils.translation import get_language
 
 from currencies.models import Currency
 
+from catalog import settings as scs
+
 
 def slug_num_suffix(slug, queryset, template='{slug}-{num}'):
     """
     Returns next available suffix number in a given queryset.
     """
-    num = 1
-    while True:
-        try:
-            queryset.get(
-                translations__slug=template.format(slug=slug, num=num))
-            num += 1
-        except ObjectDoesNotExist:
-            return num
+    return slug_num_suffixes(slug, queryset, template=template)[0]
+
+
+def slug_num_suffixes(slug, queryset, count=1, template='{slug}-{num}',
+                      exclude=()):
+    """
+    Returns a list of next `count` available suffix numbers in a given
+    queryset, fetching existing suffixed slugs in a single query. Slugs
+    in `exclude` are treated as taken. Returned numbers are reserved in
+    cache for a while so concurrent calls don't hand out the same ones.
+    """
+    prefix, suffix = [x.format(slug=slug) for x in template.split('{num}')]
+    pattern = re.compile(r'^{}(\d+){}$'.format(
+        re.escape(prefix), re.escape(suffix)))
+    slugs = list(queryset.filter(translations__slug__startswith=prefix).
+                 values_list('translations__slug', flat=True))
+    slugs.extend(exclude)
+    taken = set(int(x.group(1)) for x in map(pattern.match, slugs) if x)
+
+    nums, num = [], 0
+    while len(nums) < count:
+        num += 1
+        if num in taken:
+            continue
+        key = get_slug_reserve_key(
+            queryset.model, template.format(slug=slug, num=num))
+        if cache.add(key, True, scs.SLUG_RESERVE_TIMEOUT):
+            nums.append(num)
+    return nums
+
+
+def get_slug_reserve_key(model, slug):
+    return 'catalog_slug_reserve_{}_{}'.format(
+        model._meta.db_table, md5(force_bytes(slug)).hexdigest())
+
+
+def get_language_code(language_code=None):
+    """
+    Returns the given (or active) language code if it's defined in
+    LANGUAGES setting, otherwise falls back to LANGUAGE_CODE.
+    """
+    language_code = language_code or get_language() or settings.LANGUAGE_CODE
+    codes = [x[0] for x in settings.LANGUAGES]
+    if language_code not in codes:
+        if language_code[:2] in codes:
+            return language_code[:2]
+        return settings.LANGUAGE_CODE
+    return language_code
 
 
 def round_2(num):
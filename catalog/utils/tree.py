@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from django.db.models import Max, Q
+from django.db.models.signals import post_save, post_delete
+
+
+_deferred = threading.local()
+
+
+class DeferredTrees(object):
+    """
+    Keeps track of nodes saved and deleted while tree updates
+    are deferred for a model.
+    """
+    def __init__(self, model):
+        self.model = model
+        self.tree_ids = set()
+        self.parent_ids = set()
+        self.created_ids = set()
+
+    def add_node(self, node, created=False):
+        opts = self.model._mptt_meta
+        if created:
+            self.created_ids.add(node.pk)
+        tree_id = getattr(node, opts.tree_id_attr)
+        if tree_id:
+            self.tree_ids.add(tree_id)
+        parent_id = getattr(node, '%s_id' % opts.parent_attr)
+        if parent_id:
+            self.parent_ids.add(parent_id)
+
+    def rebuild(self):
+        opts = self.model._mptt_meta
+        if self.parent_ids:
+            self.tree_ids.update(
+                self.model._default_manager.filter(
+                    pk__in=self.parent_ids).values_list(
+                    opts.tree_id_attr, flat=True))
+        return rebuild_trees(self.model, self.tree_ids, self.created_ids)
+
+
+def get_deferred(model):
+    """
+    Returns `DeferredTrees` for the given model if tree updates are
+    currently deferred for it, otherwise None.
+    """
+    return getattr(_deferred, 'models', {}).get(model._tree_manager.tree_model)
+
+
+def tree_node_changed(sender, instance, **kwargs):
+    deferred = get_deferred(sender)
+    if deferred is not None:
+        deferred.add_node(instance, kwargs.get('created', False))
+
+
+def track_tree_nodes(model):
+    """
+    Connects receivers that record saved and deleted nodes of the given
+    model while its tree updates are deferred.
+    """
+    uid = 'catalog_tree_node_changed_{}'.format(model._meta.db_table)
+    post_save.connect(tree_node_changed, sender=model, dispatch_uid=uid)
+    post_delete.connect(tree_node_changed, sender=model, dispatch_uid=uid)
+
+
+@contextmanager
+def disable_mptt_updates(models):
+    """
+    Nests `disable_mptt_updates` of the given models tree managers.
+    """
+    if not models:
+        yield
+        return
+    with models[0]._tree_manager.disable_mptt_updates():
+        with disable_mptt_updates(models[1:]):
+            yield
+
+
+@contextmanager
+def defer_tree_updates(*models):
+    """
+    Context manager that disables MPTT updates for the given models and
+    rebuilds only the affected trees once on exit. Use it when saving,
+    moving or deleting many nodes at once. Tree fields of instances in
+    memory are stale after the rebuild.
+
+    Unlike mptt's `delay_mptt_updates`, which rebuilds every changed
+    tree with a query per node, trees are rebuilt in memory and only
+    the nodes which moved are updated.
+    """
+    if not hasattr(_deferred, 'models'):
+        _deferred.models = {}
+
+    tree_models = [x._tree_manager.tree_model for x in models]
+    tree_models = [x for x in tree_models if x not in _deferred.models]
+    for model in tree_models:
+        track_tree_nodes(model)
+        _deferred.models[model] = DeferredTrees(model)
+
+    try:
+        with transaction.atomic(), disable_mptt_updates(tree_models):
+            yield
+            for model in tree_models:
+                _deferred.models[model].rebuild()
+    finally:
+        for model in tree_models:
+            del _deferred.models[model]
+
+
+def get_tree_nodes(model, tree_ids):
+    """
+    Returns a dictionary of (pk, parent_id, tree_id, lft, rght, level)
+    tuples keyed by pk, of nodes in the given trees and nodes without a
+    tree (zero tree id). Trees of their parents are loaded as well.
+    """
+    opts = model._mptt_meta
+    manager = model._default_manager
+    fields = ['pk', '%s_id' % opts.parent_attr, opts.tree_id_attr,
+              opts.left_attr, opts.right_attr, opts.level_attr]
+
+    nodes, loaded = {}, set()
+    lookup = Q(**{opts.tree_id_attr: 0})
+    if tree_ids:
+        lookup |= Q(**{'%s__in' % opts.tree_id_attr: tree_ids})
+    while lookup is not None:
+        loaded.update(tree_ids)
+        for row in manager.filter(lookup).values_list(*fields):
+            nodes[row[0]] = row
+
+        # Load trees of parents that ended up outside of loaded trees.
+        missing = set(x[1] for x in nodes.values()
+                      if x[1] and x[1] not in nodes)
+        tree_ids = set(manager.filter(pk__in=missing).values_list(
+            opts.tree_id_attr, flat=True)) - loaded if missing else None
+        lookup = None
+        if tree_ids:
+            lookup = Q(**{'%s__in' % opts.tree_id_attr: tree_ids})
+    return nodes
+
+
+def get_tree_positions(root, children, tree_id, sibling_key):
+    """
+    Walks the tree from the given root and returns a list of (pk,
+    position) tuples of nodes which position changed, where position is
+    a (tree_id, lft, rght, level) tuple.
+    """
+    counter, lefts, moved = 1, {}, []
+    stack = [(root, 0, False)]
+    while stack:
+        row, level, visited = stack.pop()
+        if not visited:
+            lefts[row[0]] = counter
+            counter += 1
+            stack.append((row, level, True))
+            stack.extend((x, level + 1, False) for x in reversed(
+                sorted(children[row[0]], key=sibling_key)))
+            continue
+        position = (tree_id, lefts[row[0]], counter, level)
+        counter += 1
+        if position != row[2:]:
+            moved.append((row[0], position))
+    return moved
+
+
+def update_tree_positions(model, positions, batch_size=100):
+    """
+    Saves (pk, position) tuples of nodes, updating a batch of nodes
+    with a single query.
+    """
+    opts = model._mptt_meta
+    meta = model._meta
+    qn = connection.ops.quote_name
+    columns = [qn(meta.get_field(x).column) for x in (
+        opts.tree_id_attr, opts.left_attr, opts.right_attr, opts.level_attr)]
+    pk = qn(meta.pk.column)
+
+    cursor = connection.cursor()
+    for i in range(0, len(positions), batch_size):
+        batch = positions[i:i + batch_size]
+        cases = ', '.join('{0} = CASE {1} {2} END'.format(
+            column, pk, ' '.join(['WHEN %s THEN %s'] * len(batch)))
+            for column in columns)
+        params = [x for j in range(len(columns)) for pk_value, position in
+                  batch for x in (pk_value, position[j])]
+        cursor.execute('UPDATE {} SET {} WHERE {} IN ({})'.format(
+            qn(meta.db_table), cases, pk, ', '.join(['%s'] * len(batch))),
+            params + [x[0] for x in batch])
+
+
+def rebuild_trees(model, tree_ids, created_ids=()):
+    """
+    Rebuilds the given trees of a MPTT model in memory and saves only
+    the nodes which position changed. Nodes left without a tree (zero
+    tree id) and trees of their parents are included. Existing siblings
+    keep their order, new ones (without a tree or in `created_ids`) are
+    placed last. Returns a number of updated nodes.
+    """
+    opts = model._mptt_meta
+    manager = model._default_manager
+    created_ids = set(created_ids)
+    nodes = get_tree_nodes(model, set(tree_ids))
+
+    roots, children = [], defaultdict(list)
+    for row in nodes.values():
+        if row[1] in nodes:
+            children[row[1]].append(row)
+        elif not row[1]:
+            roots.append(row)
+
+    def is_new(row):
+        return not row[2] or row[0] in created_ids
+
+    def sibling_key(row):
+        moved = row[1] and row[2] != nodes[row[1]][2]
+        return (is_new(row) or moved, row[3], row[0])
+
+    next_tree_id = None
+    tree_ids, positions = set(), []
+    for root in sorted(roots, key=lambda x: (is_new(x), x[2], x[3], x[0])):
+        tree_id = root[2]
+        if is_new(root) or tree_id in tree_ids:
+            # New root or a node moved out of its tree gets a new tree.
+            if next_tree_id is None:
+                next_tree_id = (manager.aggregate(Max(opts.tree_id_attr))[
+                    '%s__max' % opts.tree_id_attr] or 0) + 1
+            tree_id, next_tree_id = next_tree_id, next_tree_id + 1
+        tree_ids.add(tree_id)
+        positions.extend(
+            get_tree_positions(root, children, tree_id, sibling_key))
+
+    update_tree_positions(model, positions)
+    return len(positions)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from uuid import uuid4
+from itertools import product as cartesian_product
+from collections import OrderedDict, defaultdict
+
+from django.db import transaction
+
+from catalog.models import (
+    Product, ProductAttributeValue, ProductFlagIndex, invalidate_variations)
+from catalog.utils import get_language_code, slug_num_suffixes
+from catalog.utils.tree import rebuild_trees
+
+
+def get_option_combinations(product, options):
+    """
+    Returns a list of option combinations (one option per attribute)
+    that are not yet defined on any of the products variants.
+    """
+    groups = OrderedDict()
+    for option in options:
+        groups.setdefault(option.attribute_id, []).append(option)
+    if not groups:
+        return []
+
+    existing = defaultdict(set)
+    for pk, attribute_id, option_id in ProductAttributeValue.objects.filter(
+            product__parent=product, attribute_id__in=groups.keys()).\
+            values_list('product_id', 'attribute_id', 'value_option_id'):
+        existing[pk].add((attribute_id, option_id))
+    existing = set(frozenset(x) for x in existing.values())
+
+    return [x for x in cartesian_product(*groups.values()) if frozenset(
+        (o.attribute_id, o.pk) for o in x) not in existing]
+
+
+def generate_variants(product, options, language_code=None, batch_size=500,
+                      **fields):
+    """
+    Creates variants of a group product for every combination of the
+    given attribute options, skipping combinations that already exist.
+    Variants, their translations and attribute values are inserted in
+    batches, extra `fields` are set on every variant. Returns a list of
+    created variants ids.
+    """
+    if product.is_variant:
+        product = product.parent
+    language_code = get_language_code(language_code)
+    combinations = get_option_combinations(product, options)
+    if not combinations:
+        return []
+
+    name = product.safe_translation_getter('name', language_code=language_code)
+    slug = product.safe_translation_getter('slug', language_code=language_code)
+    nums = slug_num_suffixes(slug, Product.objects.all(), len(combinations))
+
+    with transaction.atomic():
+        # Position in tree is set once the tree gets rebuilt. Variants
+        # are found by a unique upc marker, which is cleared after.
+        marker = uuid4().hex
+        Product.objects.bulk_create([Product(
+            parent=product, tree_id=0, level=1, lft=0, rght=0,
+            upc='{}-{}'.format(marker, i), **fields)
+            for i in range(len(combinations))], batch_size=batch_size)
+        pks = dict(Product.objects.filter(
+            upc__startswith='{}-'.format(marker)).values_list('upc', 'pk'))
+        pks = [pks['{}-{}'.format(marker, i)]
+               for i in range(len(combinations))]
+        Product.objects.filter(pk__in=pks).update(upc=None)
+
+        translation_model = Product._parler_meta.root_model
+        rows = list(zip(pks, combinations, nums))
+        for i in range(0, len(rows), batch_size):
+            items = rows[i:i + batch_size]
+            translation_model.objects.bulk_create([translation_model(
+                master_id=pk, language_code=language_code,
+                name='{} ({})'.format(name, ', '.join(
+                    x.safe_translation_getter(
+                        'value', language_code=language_code)
+                    for x in combination)),
+                slug='{}-{}'.format(slug, num))
+                for pk, combination, num in items])
+
+            ProductAttributeValue.objects.bulk_create([ProductAttributeValue(
+                product_id=pk, attribute_id=x.attribute_id, value_option=x)
+                for pk, combination, num in items for x in combination])
+            ProductAttributeValue.update_texts(
+                ProductAttributeValue.objects.filter(
+                    product__in=[x[0] for x in items]).select_related(
+                    'attribute'))
+            ProductFlagIndex.objects.rebuild([x[0] for x in items])
+            Product.objects.update_stock([x[0] for x in items])
+
+        rebuild_trees(Product, [product.tree_id])
+        product.variant_count = Product.objects.update_variant_count(
+            [product.pk])[product.pk]
+
+    invalidate_variations(product.pk)
+    return pks
@@ -3,6 +3,7 @@ from __future__ import unicode_literals
 
 import json
 import operator
+from decimal import Decimal, InvalidOperation
 
 from django.db.models import Q
 from django.http import Http404, HttpResponse
@@ -17,7 +18,8 @@ from shop.util.cart import get_or_create_cart
 from parler.views import TranslatableSlugMixin
 
 from catalog.models import (
-    CartModifierCode, Category, Brand, Manufacturer, Product, Attribute)
+    CartModifierCode, Category, Brand, Manufacturer, Product, Attribute,
+    ProductMeasurement)
 from catalog.forms import CartModifierCodeModelForm
 from catalog.utils.shortcuts import get_by_slug_or_404
 from catalog.utils import calculate_base_price
@@ -68,6 +70,45 @@ def get_date_filters(request):
     return date_from, date_to
 
 
+def get_rating_filter(request):
+    """
+    Returns minimal average rating, if 'catalog.reviews' is installed.
+    Invalid and non finite (NaN, Infinity) values are ignored.
+    """
+    rating = request.GET.get('rating-from', None)
+    if scs.HAS_REVIEWS and rating:
+        try:
+            rating = Decimal(rating)
+        except InvalidOperation:
+            return None
+        if rating.is_finite():
+            return rating
+    return None
+
+
+def get_measurement_filters(request):
+    """
+    Returns a list of measurement filters as (kind, from, to, unit).
+    """
+    filters = []
+    for kind, name in ProductMeasurement.KIND_CHOICES:
+        value_from = request.GET.get('{}-from'.format(kind), None)
+        value_to = request.GET.get('{}-to'.format(kind), None)
+        unit = request.GET.get('{}-unit'.format(kind), None)
+        if value_from or value_to:
+            filters.append((kind, value_from, value_to, unit))
+    return filters
+
+
+def get_flag_filters(request):
+    """
+    Returns flag filters as a dictionary of flag codes, codes prefixed
+    with '-' are excluded. Eg. '?flag=new&flag=-on_sale'.
+    """
+    flags = [x for x in request.GET.getlist('flag') if x.lstrip('-')]
+    return dict((x.lstrip('-'), not x.startswith('-')) for x in flags)
+
+
 def search_products(queryset, request):
     """
     Simple product serach by name and slug.
@@ -92,7 +133,16 @@ def sort_products(queryset, request):
     Sort products.
     """
     sort = request.GET.get('sort', None)
-    if sort and len(queryset) and hasattr(queryset[0], sort.lstrip('-')):
+    kinds = dict(ProductMeasurement.KIND_CHOICES)
+    if sort and sort.lstrip('-') == 'rating' and scs.HAS_REVIEWS:
+        pks = list(queryset.values_list('pk', flat=True))
+        queryset = Product.objects.translated().filter(pk__in=pks).\
+            order_by('{}rating__average'.format(sort[:-len('rating')]))
+    elif sort and sort.lstrip('-') in kinds:
+        pks = list(queryset.values_list('pk', flat=True))
+        queryset = Product.objects.translated().filter(pk__in=pks).\
+            order_by_measurement(sort.lstrip('-'), sort.startswith('-'))
+    elif sort and len(queryset) and hasattr(queryset[0], sort.lstrip('-')):
         pks = list(queryset.values_list('pk', flat=True))
         queryset = Product.objects.translated().filter(pk__in=pks).\
             order_by(sort)
@@ -115,6 +165,21 @@ def filter_products(queryset, request):
     if date_from or date_to:
         queryset = queryset.filter_date(date_from, date_to)
 
+    for kind, value_from, value_to, unit in get_measurement_filters(request):
+        queryset = queryset.filter_measurements(
+            kind, value_from, value_to, unit)
+
+    flags = get_flag_filters(request)
+    if flags:
+        queryset = queryset.with_flags(**flags)
+
+    if request.GET.get('in-stock', None):
+        queryset = queryset.in_stock()
+
+    rating = get_rating_filter(request)
+    if rating is not None:
+        queryset = queryset.filter(rating__average__gte=rating)
+
     attrs = Attribute.filter_dict(request.GET)
     if attrs:
         queryset = queryset.filter_attrs(**attrs)
@@ -122,6 +187,9 @@ def filter_products(queryset, request):
     queryset = search_products(queryset, request)
     queryset = sort_products(queryset, request)
 
+    if scs.HAS_REVIEWS:
+        queryset = queryset.select_related('rating')
+
     return queryset
 
 
@@ -280,6 +348,8 @@ class ProductVariantsJSONView(ShopView):
                 response = variant.as_dict
         else:
             variants = product.variants.select_related().all()
+            if scs.HAS_REVIEWS:
+                variants = variants.select_related('rating')
             if variants:
                 response = [x.as_dict for x in variants]
 
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import warnings
+
 from django import forms
 from django.utils.safestring import mark_safe
 from django.utils.html import format_html
@@ -13,7 +15,17 @@ class AttributeValueKindsMapSelect(forms.Select):
     """
     A custom Select widget for generating 'data-choices' attribute when
     selected attributes kind is Attribute.KIND_OPTION.
+
+    Deprecated, the product change form gets the attribute kinds map
+    as JSON from 'catalog.forms.get_attribute_kinds_map'. Will be removed
+    in the next release.
     """
+    def __init__(self, *args, **kwargs):
+        warnings.warn(
+            'AttributeValueKindsMapSelect is deprecated and will be removed '
+            'in the next release.', DeprecationWarning, stacklevel=2)
+        super(AttributeValueKindsMapSelect, self).__init__(*args, **kwargs)
+
     def render_option(self, selected_choices, option_value, option_label):
         option_value = force_text(option_value)
         if option_value in selected_choices:
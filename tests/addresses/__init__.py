@@ -1,2 +1,4 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
+
+from .commands import *  # noqa
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+import json
+import shutil
+import tempfile
+
+from django.test import TestCase
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from catalog.addresses.models import Region, Country
+
+
+class InitCountriesTestCase(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_source(self, content):
+        path = os.path.join(self.tmp_dir, 'countries.json')
+        with open(path, 'wb') as f:
+            f.write(content.encode('utf-8'))
+        return path
+
+    def test_initcountries(self):
+        # Regions and countries are loaded and inserted in bulk, the
+        # countries insert is split in two batches on sqlite.
+        with self.assertNumQueries(8):
+            call_command('initcountries')
+        self.assertEquals(Country.objects.count(), 250)
+        self.assertEquals(Region.objects.count(), 7)
+        country = Country.objects.select_related('region').get(code='HR')
+        self.assertEquals(
+            (country.name, country.region.code), ('Croatia', 'EU'))
+
+    def test_initcountries_again(self):
+        call_command('initcountries', 'HR', 'IT')
+        self.assertEquals(Country.objects.count(), 2)
+        self.assertEquals(Region.objects.count(), 1)
+        Country.objects.filter(code='HR').update(name='Hrvatska')
+
+        # Existing countries and regions are kept as they are.
+        call_command('initcountries')
+        self.assertEquals(Country.objects.count(), 250)
+        self.assertEquals(Region.objects.count(), 7)
+        self.assertEquals(Country.objects.get(code='HR').name, 'Hrvatska')
+        with self.assertNumQueries(4):
+            call_command('initcountries')
+        self.assertEquals(Country.objects.count(), 250)
+
+    def test_initcountries_source(self):
+        path = self.write_source(json.dumps({'geonames': [{
+            'countryCode': 'XK', 'countryName': 'Kosovo',
+            'continent': 'EU', 'continentName': 'Europe'}]}))
+        call_command('initcountries', source=path)
+        self.assertEquals(
+            list(Country.objects.values_list('code', flat=True)), ['XK'])
+
+    def test_initcountries_bad_source(self):
+        sources = [
+            os.path.join(self.tmp_dir, 'missing.json'),
+            self.write_source('{"geonames": ['),
+            self.write_source('{"status": "error"}'),
+            'http://127.0.0.1:1/countryInfoJSON',
+        ]
+        for source in sources:
+            self.assertRaises(
+                CommandError, call_command, 'initcountries', source=source)
+        self.assertFalse(Country.objects.exists())
@@ -3,3 +3,6 @@ from __future__ import unicode_literals
 
 from .models import *  # noqa
 from .views import *  # noqa
+from .importers import *  # noqa
+from .variants import *  # noqa
+from .inventory import *  # noqa
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from io import BytesIO
+from decimal import Decimal as D
+
+from django.test import TestCase
+
+from catalog.models import (
+    Product, Attribute, AttributeOption, Flag, ProductMeasurement)
+from catalog.importers import ProductImporter, read_csv
+
+from .models import create_product, create_category
+
+
+class ProductImporterTestCase(TestCase):
+    def setUp(self):
+        create_category('Chairs')
+        create_product('Existing', upc='existing')
+        Attribute.objects.language().create(
+            code='color', name='Color', kind=Attribute.KIND_OPTION)
+        Attribute.objects.language().create(
+            code='size', name='Size', kind=Attribute.KIND_INTEGER)
+        Flag.objects.language().create(code='new', name='New')
+
+        self.rows = [
+            {'upc': 'chair', 'name': 'Chair', 'unit_price': '10',
+             'category': 'chairs', 'measurement:width': '50 cm',
+             'flag:new': 'yes'},
+            {'upc': 'chair-red', 'parent': 'chair', 'name': 'Chair',
+             'attr:color': 'Red', 'attr:size': '1'},
+            {'upc': 'chair-blue', 'parent': 'chair', 'name': 'Chair',
+             'attr:color': 'Blue', 'attr:size': '2', 'quantity': '3'},
+            {'upc': 'existing', 'name': 'Existing'},
+            {'upc': 'orphan', 'parent': 'missing', 'name': 'Orphan'},
+            {'upc': 'bad', 'name': 'Bad', 'attr:size': 'big'},
+        ]
+
+    def test_run(self):
+        stats = ProductImporter(batch_size=2).run(self.rows)
+        self.assertEquals(stats['rows'], 6)
+        self.assertEquals(stats['created'], 3)
+        self.assertEquals(stats['skipped'], 1)
+        self.assertEquals([x[0] for x in stats['errors']], [5, 6])
+
+        chair = Product.objects.language('en').get(upc='chair')
+        self.assertEquals(chair.get_name(), 'Chair')
+        self.assertEquals(chair.category.get_slug(), 'chairs')
+        self.assertEquals(chair.unit_price, D(10))
+        self.assertEquals(chair.measurements.get().standard_value, 0.5)
+        self.assertTrue(chair.get_flags()['new']['is_true'])
+        self.assertEquals(AttributeOption.objects.count(), 2)
+
+        variants = chair.get_descendants()
+        self.assertEquals(
+            [x.upc for x in variants], ['chair-red', 'chair-blue'])
+        self.assertEquals((chair.lft, chair.rght), (1, 6))
+        self.assertEquals(len(set(x.get_slug() for x in variants)), 2)
+
+        red = variants[0]
+        self.assertTrue(red.get_flags()['new']['is_true'])
+        self.assertEquals(chair.get_variant(color='Blue', size=2).upc,
+                          'chair-blue')
+        self.assertEquals(chair.get_variations()['size']['values'],
+                          ['1', '2'])
+
+    def test_read_csv(self):
+        data = BytesIO(b'upc,name,measurement:width\np1,P 1,1 m\n')
+        stats = ProductImporter().run(read_csv(data))
+        self.assertEquals(stats['created'], 1)
+        self.assertEquals(
+            ProductMeasurement.objects.get(product__upc='p1').unit, 'm')
+
+    def test_run_interrupted(self):
+        def rows():
+            for row in self.rows[:3]:
+                yield row
+            # Product created by someone else between the batches.
+            create_product('Other')
+            raise IOError
+
+        self.assertRaises(IOError, ProductImporter(batch_size=2).run, rows())
+        self.assertFalse(Product.objects.filter(tree_id=0).exists())
+        chair = Product.objects.get(upc='chair')
+        self.assertEquals((chair.lft, chair.rght), (1, 4))
+        tree_ids = Product.objects.filter(parent=None).values_list(
+            'tree_id', flat=True)
+        self.assertEquals(len(tree_ids), len(set(tree_ids)))
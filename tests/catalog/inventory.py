@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import threading
+import multiprocessing
+from datetime import timedelta
+
+from django.db import connection
+from django.db.models import F
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+
+from shop.models import Cart, Order, OrderItem
+
+from catalog.managers import InsufficientStock
+from catalog.models import (
+    Product, RelatedProduct, StockReservation, update_order_stock)
+
+from .models import LOCMEM_CACHES, create_product
+
+
+class StockReservationTestCase(TestCase):
+    def setUp(self):
+        self.prod = create_product('Prod', quantity=5)
+        self.unlimited = create_product('Unlimited')
+        self.cart_1 = Cart.objects.create()
+        self.cart_2 = Cart.objects.create()
+
+    def test_reserve(self):
+        StockReservation.objects.reserve(self.cart_1, self.prod, 3)
+        self.assertEquals(self.prod.get_available_quantity(), 2)
+        self.assertEquals(self.prod.get_available_quantity(self.cart_1), 5)
+        self.assertRaises(
+            InsufficientStock, StockReservation.objects.reserve,
+            self.cart_2, self.prod, 3)
+        StockReservation.objects.reserve(self.cart_1, self.prod, 4)
+        self.assertEquals(self.prod.get_available_quantity(), 1)
+        self.assertIsNone(StockReservation.objects.reserve(
+            self.cart_1, self.unlimited, 10))
+        self.assertIsNone(self.unlimited.get_available_quantity())
+
+    def test_expire(self):
+        StockReservation.objects.reserve(self.cart_1, self.prod, 3)
+        StockReservation.objects.reserve(self.cart_2, self.prod, 1)
+        StockReservation.objects.filter(cart=self.cart_1).update(
+            expires=timezone.now() - timedelta(seconds=1))
+        self.assertEquals(self.prod.get_available_quantity(), 4)
+        self.assertEquals(StockReservation.objects.expire(), 1)
+        self.assertEquals(StockReservation.objects.count(), 1)
+
+    def test_cart_item_changed(self):
+        item = self.cart_1.add_product(self.prod, 2)
+        self.cart_1.add_product(self.prod, 1)
+        self.assertEquals(self.prod.get_available_quantity(), 2)
+        item.delete()
+        self.assertEquals(self.prod.get_available_quantity(), 5)
+
+    def test_cart_item_insufficient_stock(self):
+        self.cart_1.add_product(self.prod, 3)
+        item = self.cart_2.add_product(self.prod, 3)
+        self.assertEquals(item.quantity, 3)
+        self.assertEquals(StockReservation.objects.get(
+            cart=self.cart_2).quantity, 2)
+        self.assertEquals(self.prod.get_available_quantity(), 0)
+
+        # Lowering a reservation keeps what's held.
+        Product.objects.filter(pk=self.prod.pk).update(quantity=1)
+        self.cart_1.update_quantity(self.cart_1.items.get().pk, 2)
+        self.assertEquals(StockReservation.objects.get(
+            cart=self.cart_1).quantity, 2)
+        item.delete()
+        self.assertFalse(StockReservation.objects.filter(
+            cart=self.cart_2).exists())
+
+    def test_can_be_added_to_cart(self):
+        self.assertTrue(self.prod.can_be_added_to_cart)
+        self.cart_1.add_product(self.prod, 5)
+        self.assertTrue(self.prod.is_available)
+        self.assertFalse(self.prod.can_be_added_to_cart)
+        self.assertIsNone(self.cart_2.add_product(self.prod))
+        self.assertTrue(self.unlimited.can_be_added_to_cart)
+
+        # Listings don't query reservations.
+        with CaptureQueriesContext(connection) as queries:
+            self.assertTrue(self.prod.as_dict['can_be_added_to_cart'])
+        self.assertFalse([x for x in queries.captured_queries if
+                          StockReservation._meta.db_table in x['sql']])
+
+    def create_order(self, cart, quantities):
+        order = Order.objects.create(
+            order_subtotal=0, order_total=0, cart_pk=cart.pk)
+        for product, quantity in quantities:
+            OrderItem.objects.create(
+                order=order, product=product, quantity=quantity,
+                unit_price=0, line_subtotal=0, line_total=0)
+        return order
+
+    def get_quantity(self, product):
+        return Product.objects.get(pk=product.pk).quantity
+
+    def test_order_confirmed(self):
+        self.cart_1.add_product(self.prod, 2)
+        self.cart_2.add_product(self.prod, 3)
+        order = self.create_order(
+            self.cart_1, [(self.prod, 2), (self.unlimited, 2)])
+        order.status = Order.CONFIRMED
+        order.save()
+        self.assertEquals(self.get_quantity(self.prod), 3)
+        self.assertFalse(StockReservation.objects.filter(
+            cart=self.cart_1).exists())
+
+        # Stock is decremented only once.
+        order.status = Order.COMPLETED
+        order.save()
+        self.assertEquals(self.get_quantity(self.prod), 3)
+
+        order.status = Order.CANCELED
+        order.save()
+        self.assertEquals(self.get_quantity(self.prod), 5)
+
+    def test_order_insufficient_stock(self):
+        self.cart_2.add_product(self.prod, 4)
+        order = self.create_order(self.cart_1, [(self.prod, 2)])
+        order.status = Order.CONFIRMED
+        order.save()
+        order = Order.objects.get(pk=order.pk)
+        self.assertEquals(order.status, Order.CANCELED)
+        self.assertIn(str(self.prod.pk), order.extra_info.get().text)
+        self.assertEquals(self.get_quantity(self.prod), 5)
+
+    def test_update_order_stock(self):
+        order = self.create_order(self.cart_1, [(self.prod, 2)])
+        order.status = Order.COMPLETED
+        update_order_stock(order, Order.PROCESSING)
+        self.assertEquals(self.get_quantity(self.prod), 3)
+        order.status = Order.PROCESSING
+        update_order_stock(order, Order.COMPLETED)
+        self.assertEquals(self.get_quantity(self.prod), 5)
+
+        order = self.create_order(self.cart_1, [(self.prod, 6)])
+        order.status = Order.COMPLETED
+        update_order_stock(order, Order.PROCESSING)
+        self.assertEquals(order.status, Order.CANCELED)
+        self.assertEquals(self.get_quantity(self.prod), 5)
+
+    def test_decrement_stock(self):
+        other = create_product('Other', quantity=1)
+        self.assertRaises(
+            InsufficientStock, Product.objects.decrement_stock,
+            {self.prod.pk: 2, other.pk: 2})
+        self.assertEquals(self.get_quantity(self.prod), 5)
+        Product.objects.decrement_stock({self.prod.pk: 5, other.pk: 1})
+        self.assertEquals(self.get_quantity(self.prod), 0)
+
+    def test_decrement_stock_reserved(self):
+        StockReservation.objects.reserve(self.cart_1, self.prod, 3)
+        self.assertRaises(
+            InsufficientStock, Product.objects.decrement_stock,
+            {self.prod.pk: 3}, self.cart_2)
+        Product.objects.decrement_stock({self.prod.pk: 3}, self.cart_1)
+        self.assertEquals(self.get_quantity(self.prod), 2)
+
+    def test_decrement_stock_stale(self):
+        # Buyers that read the same quantity can't sell more than it.
+        first = Product.objects.get(pk=self.prod.pk)
+        second = Product.objects.get(pk=self.prod.pk)
+        Product.objects.decrement_stock({first.pk: first.quantity - 1})
+        self.assertRaises(
+            InsufficientStock, Product.objects.decrement_stock,
+            {second.pk: second.quantity - 1})
+        self.assertEquals(self.get_quantity(self.prod), 1)
+
+    def test_decrement_stock_competing(self):
+        # Another buyer takes stock after the quantity was read, the
+        # conditional update must not sell it again.
+        manager = StockReservation.objects
+
+        def get_reserved(*args, **kwargs):
+            Product.objects.filter(pk=self.prod.pk).update(
+                quantity=F('quantity') - 4)
+            return type(manager).get_reserved(manager, *args, **kwargs)
+
+        manager.get_reserved = get_reserved
+        try:
+            self.assertRaises(
+                InsufficientStock, Product.objects.decrement_stock,
+                {self.prod.pk: 2})
+        finally:
+            del manager.get_reserved
+
+        # Running on the same connection, the competing update is rolled
+        # back together with the failed decrement.
+        self.assertEquals(self.get_quantity(self.prod), 5)
+
+
+class ProductStockTestCase(TestCase):
+    def setUp(self):
+        self.prod = create_product('Prod')
+        self.var_1 = create_product('Prod 1', parent=self.prod, quantity=1)
+        self.var_2 = create_product('Prod 2', parent=self.prod, quantity=0)
+
+    def get_has_stock(self, product):
+        return Product.objects.get(pk=product.pk).has_stock
+
+    def test_has_stock(self):
+        self.assertTrue(self.get_has_stock(self.prod))
+        self.assertFalse(self.get_has_stock(self.var_2))
+
+        self.var_1.active = False
+        self.var_1.save()
+        self.assertFalse(self.get_has_stock(self.prod))
+        self.var_2.quantity = None
+        self.var_2.save()
+        self.assertTrue(self.get_has_stock(self.prod))
+        self.var_2.delete()
+        self.assertFalse(self.get_has_stock(self.prod))
+
+    def test_decrement_stock(self):
+        Product.objects.decrement_stock({self.var_1.pk: 1})
+        self.assertFalse(self.get_has_stock(self.var_1))
+        self.assertFalse(self.get_has_stock(self.prod))
+        self.assertEquals(list(Product.objects.in_stock()), [])
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_decrement_stock_related(self):
+        other = create_product('Other')
+        RelatedProduct.objects.create(
+            base_product=other, product=self.var_1, kind='cross_sell')
+        self.assertEquals(RelatedProduct.objects.get_related_ids(
+            [other.pk]), {other.pk: {'cross_sell': [self.var_1.pk]}})
+
+        # Cached related products are invalidated once out of stock.
+        Product.objects.decrement_stock({self.var_1.pk: 1})
+        self.assertEquals(
+            RelatedProduct.objects.get_related_ids([other.pk]),
+            {other.pk: {}})
+        Product.objects.increment_stock({self.var_1.pk: 1})
+        self.assertEquals(RelatedProduct.objects.get_related_ids(
+            [other.pk]), {other.pk: {'cross_sell': [self.var_1.pk]}})
+
+
+def buy(product_id, times):
+    sold = 0
+    for i in range(times):
+        try:
+            Product.objects.decrement_stock({product_id: 1})
+            sold += 1
+        except InsufficientStock:
+            pass
+    connection.close()
+    return sold
+
+
+def buy_in_process(product_id, times, results):
+    results.put(buy(product_id, times))
+
+
+# Concurrent writers need row locks, see 'test_decrement_stock_competing'
+# for a deterministic test that runs on every database.
+@skipUnlessDBFeature('has_select_for_update')
+class StockConcurrencyTestCase(TransactionTestCase):
+    def setUp(self):
+        self.prod = create_product('Prod', quantity=50)
+
+    def test_threads(self):
+        results = []
+        threads = [threading.Thread(
+            target=lambda: results.append(buy(self.prod.pk, 20)))
+            for x in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEquals(sum(results), 50)
+        self.assertEquals(Product.objects.get(pk=self.prod.pk).quantity, 0)
+
+    def test_processes(self):
+        connection.close()
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(
+            target=buy_in_process, args=(self.prod.pk, 20, results))
+            for x in range(5)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEquals(sum(results.get() for x in processes), 50)
+        self.assertEquals(Product.objects.get(pk=self.prod.pk).quantity, 0)
@@ -3,15 +3,36 @@ from __future__ import unicode_literals
 
 from decimal import Decimal as D
 from datetime import datetime
-
-from django.test import TestCase
+from importlib import import_module
+
+from django.apps import apps
+from django.test import TestCase, RequestFactory
+from django.contrib.admin import AdminSite
+from django.forms.models import inlineformset_factory
+from django.test.utils import override_settings
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
+from django.utils import translation
 from django.utils.text import slugify
+from django.utils.encoding import force_str
 
 from shop.models import Cart, CartItem
 
 from catalog.models import *  # noqa
 from catalog import settings as scs
+from catalog.filters import ProductParentListFilter, get_product_names
+from catalog.forms import (
+    ProductAttributeValueModelForm, ProductAttributeValueInlineFormSet,
+    get_attribute_kinds_map)
+from catalog.utils import slug_num_suffix, slug_num_suffixes
+from catalog.utils.tree import defer_tree_updates, rebuild_trees
+
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
 
 
 def create_product(name, unit_price=100, **kwargs):
@@ -347,3 +368,558 @@ class ProductBaseTestCase(TestCase):
         self.assertFalse(self.prod_1.filter_variants(attr_1=10, attr_2=False))
         self.assertTrue(self.prod_1.filter_variants(attr_2=True))
         self.assertFalse(self.prod_1.filter_variants(attr_1=20, attr_2=False))
+
+
+class ProductVariationsTestCase(TestCase):
+    def setUp(self):
+        self.prod = create_product('Prod')
+        self.var_1 = create_product('Prod 1', parent=self.prod)
+        self.var_2 = create_product('Prod 2', parent=self.prod)
+        self.var_3 = create_product('Prod 3', parent=self.prod)
+
+        self.size = Attribute.objects.language().create(
+            code='size', name='Size', kind=Attribute.KIND_INTEGER)
+        self.promo = Attribute.objects.language().create(
+            code='promo', name='Promo', kind=Attribute.KIND_BOOLEAN)
+
+        for var, size in [(self.var_1, 1), (self.var_2, 2), (self.var_3, 2)]:
+            ProductAttributeValue.objects.create(
+                attribute=self.size, product=var, value_integer=size)
+        ProductAttributeValue.objects.create(
+            attribute=self.promo, product=self.var_1, value_boolean=True)
+
+    def test_get_variations(self):
+        variations = self.prod.get_variations()
+        self.assertEquals(sorted(variations.keys()), ['promo', 'size'])
+        self.assertEquals(variations['size']['values'], ['1', '2'])
+        self.assertEquals(variations['size']['name'], 'Size')
+        self.assertFalse(variations['size']['is_nullable'])
+        self.assertTrue(variations['promo']['is_nullable'])
+
+    def test_get_variations_exclude(self):
+        variations = self.prod.get_variations(exclude={'pk': self.var_1.pk})
+        self.assertEquals(list(variations.keys()), ['size'])
+        self.assertEquals(variations['size']['values'], ['2'])
+
+    def test_get_variations_not_group(self):
+        self.assertEquals(self.var_1.get_variations(), {})
+
+    def test_is_nullable(self):
+        self.assertFalse(Attribute.is_nullable('size', self.prod))
+        self.assertTrue(Attribute.is_nullable('promo', self.prod))
+        self.assertTrue(Attribute.is_nullable('missing', self.prod))
+        self.assertIsNone(Attribute.is_nullable('size', self.var_1))
+
+
+class AttributeValueTextTestCase(TestCase):
+    def setUp(self):
+        self.prod = create_product('Prod')
+        self.var_1 = create_product('Prod 1', parent=self.prod)
+        self.var_2 = create_product('Prod 2', parent=self.prod)
+
+        self.color = Attribute.objects.language().create(
+            code='color', name='Color', kind=Attribute.KIND_OPTION)
+        self.red = AttributeOption.objects.language('en').create(
+            attribute=self.color, value='Red')
+        self.red.set_current_language('it')
+        self.red.value = 'Rosso'
+        self.red.save()
+        self.size = Attribute.objects.language().create(
+            code='size', name='Size', kind=Attribute.KIND_INTEGER)
+
+        self.var_1_color = ProductAttributeValue.objects.create(
+            attribute=self.color, product=self.var_1, value_option=self.red)
+        ProductAttributeValue.objects.create(
+            attribute=self.size, product=self.var_1, value_integer=1)
+        ProductAttributeValue.objects.create(
+            attribute=self.size, product=self.var_2, value_integer=2)
+
+    def get_texts(self, value):
+        return dict(value.texts.values_list('language_code', 'text'))
+
+    def test_update_texts(self):
+        self.assertEquals(self.get_texts(self.var_1_color), {
+            'en': 'Red', 'it': 'Rosso', 'hr': 'Red'})
+
+    def test_option_translation_saved(self):
+        self.red.set_current_language('hr')
+        self.red.value = 'Crvena'
+        self.red.save()
+        self.assertEquals(self.get_texts(self.var_1_color)['hr'], 'Crvena')
+
+    def test_update_texts_unicode(self):
+        # Texts are truncated by characters, not by bytes.
+        self.red.set_current_language('hr')
+        self.red.value = '\u010d' * 128
+        self.red.save()
+        self.assertEquals(
+            self.get_texts(self.var_1_color)['hr'], '\u010d' * 128)
+
+    def test_attribute_kind_changed(self):
+        self.color.kind = Attribute.KIND_INTEGER
+        self.color.save()
+        self.assertEquals(self.get_texts(self.var_1_color), {})
+
+    def test_get_values(self):
+        self.assertEquals(sorted(self.size.get_values()), ['1', '2'])
+        with translation.override('it'):
+            self.assertEquals(self.color.get_values(), ['Rosso'])
+
+    def test_filter_attrs(self):
+        products = Product.objects.all().filter_attrs(color='Red', size='1')
+        self.assertEquals(list(products), [self.prod])
+        self.assertFalse(
+            Product.objects.all().filter_attrs(color='Red', size='2'))
+
+    def test_get_variant(self):
+        self.assertEquals(self.prod.get_variant(size=2), self.var_2)
+        self.assertIsNone(self.prod.get_variant(size=1))
+        self.assertEquals(
+            self.prod.get_variant(size=1, color='Red'), self.var_1)
+
+
+class AttributeRegistryTestCase(TestCase):
+    def setUp(self):
+        self.size = Attribute.objects.language('en').create(
+            code='size', name='Size', kind=Attribute.KIND_INTEGER,
+            template='radio')
+        self.size.set_current_language('it')
+        self.size.name = 'Taglia'
+        self.size.save()
+
+    def test_get_attribute_registry(self):
+        registry = get_attribute_registry('it')
+        self.assertEquals(registry['ids'], {self.size.pk: 'size'})
+        self.assertEquals(registry['codes']['size']['name'], 'Taglia')
+        self.assertEquals(registry['codes']['size']['type'], 'integer')
+
+    def test_invalidate_on_change(self):
+        get_attribute_registry('en')
+        self.size.set_current_language('en')
+        self.size.name = 'Width'
+        self.size.save()
+        registry = get_attribute_registry('en')
+        self.assertEquals(registry['codes']['size']['name'], 'Width')
+
+    def test_template_for(self):
+        self.assertEquals(Attribute.template_for('size'), 'radio')
+        self.assertIsNone(Attribute.template_for('missing'))
+
+    def test_filter_dict(self):
+        self.assertEquals(
+            Attribute.filter_dict({'size': '1', 'color': 'red', 'page': 2}),
+            {'size': '1'})
+
+
+class MeasurementTestCase(TestCase):
+    def setUp(self):
+        self.prod = create_product('Prod')
+        self.var = create_product('Prod 1', parent=self.prod)
+        self.width = ProductMeasurement.objects.create(
+            product=self.prod, kind='width', value=D('1.5'), unit='m')
+        self.weight = ProductMeasurement.objects.create(
+            product=self.var, kind='weight', value=D(2), unit='kg')
+
+    def test_get_measure_alias(self):
+        aliases = get_measure_alias(Distance)
+        aliases['metre'] = 'mm'
+        self.assertEquals(get_measure_alias(Distance)['metre'], 'm')
+        self.assertIn('cm', get_measure_units(Distance))
+        self.assertNotIn('kg', get_measure_units(Distance))
+
+    def test_distance_weight(self):
+        self.assertEquals(self.width.distance.cm, 150)
+        self.assertIsNone(self.width.weight)
+        self.assertEquals(self.weight.weight.g, 2000)
+
+    def test_get_dict(self):
+        data = self.width.get_dict(units=['cm', 'kg'])
+        self.assertEquals(data['cm'], '150.0')
+        self.assertEquals(data['original_unit'], 'm')
+        self.assertNotIn('mm', data)
+        self.assertNotIn('kg', data)
+        self.assertIn('mm', self.width.as_dict)
+
+    def test_get_measurements(self):
+        measurements = self.var.get_measurements(units=[])
+        self.assertEquals(measurements['width']['original_value'], '1.5')
+        self.assertEquals(measurements['weight']['standard_unit'], 'g')
+        self.assertIsNone(measurements['height'])
+
+
+class MeasurementFilterTestCase(TestCase):
+    def setUp(self):
+        self.prod_1 = create_product('Prod 1')
+        self.prod_1_var_1 = create_product('Prod 1 1', parent=self.prod_1)
+        self.prod_1_var_2 = create_product('Prod 1 2', parent=self.prod_1)
+        self.prod_2 = create_product('Prod 2')
+        self.prod_3 = create_product('Prod 3')
+
+        for product, value in [(self.prod_1, 100), (self.prod_1_var_2, 250),
+                               (self.prod_2, 180)]:
+            ProductMeasurement.objects.create(
+                product=product, kind='width', value=D(value), unit='cm')
+
+    def filter(self, *args):
+        return set(Product.objects.all().filter_measurements(*args))
+
+    def test_standard_value(self):
+        self.assertEquals(self.prod_2.measurements.get().standard_value, 1.8)
+
+    def test_filter_measurements(self):
+        self.assertEquals(self.filter('width', 1.5, 2), set([self.prod_2]))
+        self.assertEquals(self.filter('width', 90, 110, 'cm'), set([
+            self.prod_1, self.prod_1_var_1]))
+        self.assertEquals(self.filter('width', 2), set([
+            self.prod_1, self.prod_1_var_2]))
+        self.assertEquals(self.filter('weight', 1), set())
+        self.assertEquals(len(self.filter('width', None, None)), 5)
+
+    def test_filter_measurements_overridden(self):
+        ProductMeasurement.objects.create(
+            product=self.prod_1_var_1, kind='width', value=D(50), unit='cm')
+        self.assertEquals(self.filter('width', 90, 110, 'cm'), set())
+        self.assertEquals(self.filter('width', 40, 60, 'cm'), set([
+            self.prod_1, self.prod_1_var_1]))
+
+    def test_set_standard_values(self):
+        migration = import_module(
+            'catalog.migrations.0003_measurement_standard_value')
+        ProductMeasurement.objects.update(standard_value=None)
+        migration.set_standard_values(apps, None)
+        self.assertEquals(self.prod_2.measurements.get().standard_value, 1.8)
+
+    def test_order_by_measurement(self):
+        products = Product.objects.top_level().filter(
+            pk__in=[self.prod_1.pk, self.prod_2.pk])
+        self.assertEquals(list(products.order_by_measurement('width')), [
+            self.prod_1, self.prod_2])
+        self.assertEquals(
+            list(products.order_by_measurement('width', descending=True)),
+            [self.prod_2, self.prod_1])
+
+
+class ProductFlagIndexTestCase(TestCase):
+    def setUp(self):
+        self.new = Flag.objects.language().create(code='new', name='New')
+        self.sale = Flag.objects.language().create(code='sale', name='Sale')
+
+        self.prod_1 = create_product('Prod 1')
+        self.prod_1_var_1 = create_product('Prod 1 1', parent=self.prod_1)
+        self.prod_1_var_2 = create_product('Prod 1 2', parent=self.prod_1)
+        self.prod_2 = create_product('Prod 2')
+
+        ProductFlag.objects.create(product=self.prod_1, flag=self.new)
+        ProductFlag.objects.create(
+            product=self.prod_1_var_2, flag=self.new, is_true=False)
+        ProductFlag.objects.create(product=self.prod_2, flag=self.sale)
+
+    def with_flags(self, **kwargs):
+        return set(Product.objects.all().with_flags(**kwargs))
+
+    def test_with_flags(self):
+        self.assertEquals(self.with_flags(new=True), set([
+            self.prod_1, self.prod_1_var_1]))
+        self.assertEquals(self.with_flags(new=False), set([
+            self.prod_1_var_2, self.prod_2]))
+        self.assertEquals(self.with_flags(new=False, sale=True), set([
+            self.prod_2]))
+
+    def test_get_flags(self):
+        flags = self.prod_1_var_1.get_flags()
+        self.assertEquals(flags['new'], {
+            'name': 'New', 'code': 'new', 'is_true': True})
+        self.assertFalse(self.prod_1_var_2.get_flags()['new']['is_true'])
+        self.assertEquals(self.prod_2.get_flags().keys(), ['sale'])
+
+    def test_rebuild_on_change(self):
+        ProductFlag.objects.filter(product=self.prod_1).delete()
+        self.assertEquals(self.with_flags(new=True), set())
+
+        self.prod_2.parent = self.prod_1
+        self.prod_2.save()
+        ProductFlag.objects.create(product=self.prod_1, flag=self.new)
+        self.assertIn(self.prod_2, self.with_flags(new=True, sale=True))
+
+    def test_flag_code_changed(self):
+        self.new.code = 'fresh'
+        self.new.save()
+        self.assertEquals(self.with_flags(fresh=True), set([
+            self.prod_1, self.prod_1_var_1]))
+
+
+class RelatedProductTestCase(TestCase):
+    def setUp(self):
+        self.prod_1 = create_product('Prod 1')
+        self.prod_1_var_1 = create_product('Prod 1 1', parent=self.prod_1)
+        self.prod_2 = create_product('Prod 2')
+        self.prod_3 = create_product('Prod 3', quantity=0)
+        self.prod_4 = create_product('Prod 4')
+
+        kind = scs.RELATED_PRODUCT_KIND_CHOICES[0][0]
+        for product in [self.prod_2, self.prod_3]:
+            RelatedProduct.objects.create(
+                base_product=self.prod_1, product=product, kind=kind)
+        RelatedProduct.objects.create(
+            base_product=self.prod_2, product=self.prod_4, kind=kind)
+        self.kind = kind
+
+    def test_for_products(self):
+        data = RelatedProduct.objects.for_products([
+            self.prod_1_var_1, self.prod_2, self.prod_4])
+        self.assertEquals(
+            data[self.prod_1_var_1.pk][self.kind]['products'], [self.prod_2])
+        self.assertEquals(
+            data[self.prod_2.pk][self.kind]['products'], [self.prod_4])
+        self.assertEquals(data[self.prod_4.pk][self.kind]['products'], [])
+
+    def test_get_related_products(self):
+        related = self.prod_1.get_related_products()
+        self.assertEquals(
+            related[self.kind]['products'], [force_str(self.prod_2.pk)])
+        self.assertEquals(self.prod_1_var_1.get_related_products(), related)
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_invalidate_related_products(self):
+        cache.clear()
+        self.assertEquals(len(self.prod_1.get_related_products()[
+            self.kind]['products']), 1)
+        self.prod_3.quantity = 5
+        self.prod_3.save()
+        self.assertEquals(len(self.prod_1.get_related_products()[
+            self.kind]['products']), 2)
+        RelatedProduct.objects.filter(product=self.prod_2).delete()
+        self.assertEquals(len(self.prod_1.get_related_products()[
+            self.kind]['products']), 1)
+
+
+class DeferTreeUpdatesTestCase(TestCase):
+    def get_tree(self, node):
+        model = type(node)
+        tree_id = model.objects.get(pk=node.pk).tree_id
+        return [
+            (x.safe_translation_getter('name')[2:], x.lft, x.rght, x.level)
+            for x in model.objects.filter(tree_id=tree_id).order_by('lft')]
+
+    def create_trees(self, prefix):
+        group = create_product('%s Group' % prefix)
+        for i in range(3):
+            create_product('%s Var %s' % (prefix, i), parent=group)
+        cat = create_category('%s Cat' % prefix)
+        sub = create_category('%s Sub' % prefix, parent=cat)
+        create_category('%s Sub 1' % prefix, parent=sub)
+        create_category('%s Sub 2' % prefix, parent=cat)
+        return group, cat
+
+    def test_defer_tree_updates(self):
+        group_a, cat_a = self.create_trees('A')
+        with defer_tree_updates(Product, Category):
+            group_b, cat_b = self.create_trees('B')
+        self.assertEquals(self.get_tree(group_a), self.get_tree(group_b))
+        self.assertEquals(self.get_tree(cat_a), self.get_tree(cat_b))
+        self.assertNotEquals(
+            Product.objects.get(pk=group_a.pk).tree_id,
+            Product.objects.get(pk=group_b.pk).tree_id)
+
+    def test_defer_tree_updates_move(self):
+        group_a, cat_a = self.create_trees('A')
+        group_b, cat_b = self.create_trees('B')
+        variant_a = group_a.get_children()[0]
+        variant_a.move_to(group_b)
+        Category.objects.get(translations__name='A Sub 1').delete()
+
+        with defer_tree_updates(Product, Category):
+            variant_b = Product.objects.get(upc=slugify('B Var 0'))
+            variant_b.parent = Product.objects.get(pk=group_a.pk)
+            variant_b.save()
+            Category.objects.get(translations__name='B Sub 1').delete()
+        self.assertEquals(
+            [x[1:] for x in self.get_tree(group_a)],
+            [x[1:] for x in self.get_tree(group_b)])
+        self.assertEquals(self.get_tree(cat_a), self.get_tree(cat_b))
+
+        with defer_tree_updates(Category):
+            sub = Category.objects.get(translations__name='B Sub')
+            sub.parent = None
+            sub.save()
+        self.assertEquals(self.get_tree(sub), [('Sub', 1, 2, 0)])
+        self.assertEquals(self.get_tree(cat_b), [
+            ('Cat', 1, 4, 0), ('Sub 2', 2, 3, 1)])
+
+    def test_rebuild_trees(self):
+        group = create_product('Group')
+        Product.objects.bulk_create([Product(
+            parent=group, tree_id=0, level=1, lft=0, rght=0)
+            for i in range(5)])
+        # Nodes are loaded and moved nodes updated in a single query.
+        with self.assertNumQueries(2):
+            self.assertEquals(rebuild_trees(Product, [group.tree_id]), 6)
+        self.assertEquals(
+            list(Product.objects.filter(tree_id=group.tree_id).order_by(
+                'lft').values_list('lft', 'rght', 'level')),
+            [(1, 12, 0)] + [(x, x + 1, 1) for x in range(2, 12, 2)])
+
+
+class SlugNumSuffixTestCase(TestCase):
+    def setUp(self):
+        for slug in ('prod', 'prod-1', 'prod-3', 'prod-x', 'prod-4-1'):
+            create_product(slug, slug=slug)
+
+    def test_slug_num_suffixes(self):
+        with self.assertNumQueries(1):
+            nums = slug_num_suffixes('prod', Product.objects.all(), 3)
+        self.assertEquals(nums, [2, 4, 5])
+        self.assertEquals(slug_num_suffixes(
+            'prod', Product.objects.all(), 2, exclude=['prod-2']), [4, 5])
+        self.assertEquals(slug_num_suffix('prod', Product.objects.all()), 2)
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_slug_num_suffixes_reserved(self):
+        cache.clear()
+        self.assertEquals(slug_num_suffix('prod', Product.objects.all()), 2)
+        self.assertEquals(slug_num_suffix('prod', Product.objects.all()), 4)
+        self.assertEquals(
+            slug_num_suffixes('prod', Product.objects.all(), 2), [5, 6])
+
+
+class VariantCountTestCase(TestCase):
+    def setUp(self):
+        self.prod_1 = create_product('Prod 1')
+        self.prod_2 = create_product('Prod 2')
+        self.var_1 = create_product('Prod 1 1', parent=self.prod_1)
+        self.var_2 = create_product('Prod 1 2', parent=self.prod_1)
+
+    def get_count(self, product):
+        return Product.objects.get(pk=product.pk).variant_count
+
+    def test_is_group(self):
+        with self.assertNumQueries(0):
+            self.assertTrue(self.prod_1.is_group)
+            self.assertFalse(self.prod_2.is_group)
+            self.assertFalse(self.var_1.is_group)
+
+    def test_variant_count(self):
+        self.assertEquals(self.get_count(self.prod_1), 2)
+        self.var_2.parent = self.prod_2
+        self.var_2.save()
+        self.assertEquals(self.get_count(self.prod_1), 1)
+        self.assertEquals(self.get_count(self.prod_2), 1)
+        self.var_1.delete()
+        self.assertEquals(self.get_count(self.prod_1), 0)
+        self.assertEquals(
+            Product.objects.update_variant_count([self.prod_2.pk]),
+            {self.prod_2.pk: 1})
+
+
+class ProductParentListFilterTestCase(TestCase):
+    def setUp(self):
+        self.prod_1 = create_product('Prod 1')
+        self.prod_2 = create_product('Prod 2')
+        self.prod_3 = create_product('Prod 3')
+        self.var_1 = create_product('Prod 1 1', parent=self.prod_1)
+        self.var_2 = create_product('Prod 2 1', parent=self.prod_2)
+        self.factory = RequestFactory()
+
+    def get_filter(self, **params):
+        request = self.factory.get('/', params)
+        return request, ProductParentListFilter(
+            request, params, Product, None)
+
+    def test_get_product_names(self):
+        with self.assertNumQueries(1):
+            self.assertEquals(get_product_names(Product.objects.filter(
+                pk__in=[self.prod_2.pk, self.prod_1.pk])), [
+                (self.prod_1.pk, 'Prod 1'), (self.prod_2.pk, 'Prod 2')])
+
+    def test_lookups(self):
+        request, spec = self.get_filter()
+        self.assertEquals(spec.lookup_choices, [
+            (self.prod_1.pk, 'Prod 1'), (self.prod_2.pk, 'Prod 2')])
+
+        request, spec = self.get_filter(parent=str(self.prod_2.pk))
+        self.assertEquals(
+            list(spec.queryset(request, Product.objects.all())),
+            [self.prod_2, self.var_2])
+
+    def test_search(self):
+        limit = scs.PRODUCT_PARENT_FILTER_LIMIT
+        scs.PRODUCT_PARENT_FILTER_LIMIT = 1
+        try:
+            request, spec = self.get_filter(parent='prod 1', o='1')
+        finally:
+            scs.PRODUCT_PARENT_FILTER_LIMIT = limit
+        self.assertEquals(spec.template, scs.PRODUCT_PARENT_FILTER_TEMPLATE)
+        self.assertEquals(spec.lookup_choices, [])
+        self.assertEquals(spec.params, [('o', '1')])
+        self.assertTrue(spec.has_output())
+        self.assertEquals(
+            list(spec.queryset(request, Product.objects.all())),
+            [self.prod_1, self.var_1])
+
+
+@override_settings(SITE_ID=1)
+class ProductAdminTestCase(TestCase):
+    def setUp(self):
+        from catalog.admin import ProductAdmin
+        self.admin = ProductAdmin(Product, AdminSite())
+        self.request = RequestFactory().get('/')
+        tax = Tax.objects.create(name='Tax', percent=D(25))
+        for i in range(5):
+            parent = create_product('Prod %d' % i, tax=tax)
+            for j in range(3):
+                create_product('Prod %d %d' % (i, j), unit_price=0,
+                               parent=parent)
+
+    def test_list_display_queries(self):
+        columns = ('get_name', 'get_slug', 'get_unit_price',
+                   'get_discount_percent', 'get_price')
+        with self.assertNumQueries(2):
+            rows = [[getattr(self.admin, x)(obj) for x in columns]
+                    for obj in self.admin.get_queryset(self.request)]
+        self.assertEquals(len(rows), 20)
+        self.assertIn(['--- Prod 1 2', 'prod-1-2', D(100), '0%', D(125)],
+                      rows)
+
+
+class AttributeValueFormSetTestCase(TestCase):
+    def setUp(self):
+        self.prod = create_product('Prod')
+        self.var = create_product('Prod 1', parent=self.prod)
+        self.size = Attribute.objects.language().create(
+            code='size', name='Size', kind=Attribute.KIND_INTEGER)
+        self.color = Attribute.objects.language().create(
+            code='color', name='Color', kind=Attribute.KIND_OPTION)
+        self.red = AttributeOption.objects.language().create(
+            attribute=self.color, value='Red')
+        self.blue = AttributeOption.objects.language().create(
+            attribute=self.color, value='Blue')
+        ProductAttributeValue.objects.create(
+            attribute=self.size, product=self.var, value_integer=1)
+        ProductAttributeValue.objects.create(
+            attribute=self.color, product=self.var, value_option=self.red)
+
+    def render_formset(self, extra):
+        FormSet = inlineformset_factory(
+            Product, ProductAttributeValue,
+            form=ProductAttributeValueModelForm,
+            formset=ProductAttributeValueInlineFormSet, extra=extra)
+        formset = FormSet(instance=self.var)
+        # File fields are left out, their widgets need admin urls.
+        return ''.join('{}{}'.format(x['attribute'], x['value_option'])
+                       for x in formset.forms + [formset.empty_form])
+
+    def test_get_attribute_kinds_map(self):
+        self.assertEquals(get_attribute_kinds_map(), {
+            self.size.pk: {'kind': 'integer', 'options': []},
+            self.color.pk: {
+                'kind': 'option', 'options': [self.red.pk, self.blue.pk]},
+        })
+
+    def test_shared_choices(self):
+        get_attribute_registry()
+        with self.assertNumQueries(3):
+            html = self.render_formset(extra=1)
+        self.assertIn('>color (Option)</option>', html)
+        self.assertIn('>Blue</option>', html)
+        with self.assertNumQueries(3):
+            self.render_formset(extra=10)
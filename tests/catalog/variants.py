@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.test import TestCase
+
+from catalog.models import (
+    Product, Attribute, AttributeOption, ProductAttributeValue, Flag,
+    ProductFlag)
+from catalog.variants import generate_variants
+
+from .models import create_product
+
+
+class GenerateVariantsTestCase(TestCase):
+    def setUp(self):
+        self.prod = create_product('Shirt')
+        create_product('Other', slug='shirt-2')
+        color = Attribute.objects.language().create(
+            code='color', name='Color', kind=Attribute.KIND_OPTION)
+        size = Attribute.objects.language().create(
+            code='size', name='Size', kind=Attribute.KIND_OPTION)
+        self.red, self.blue = [AttributeOption.objects.language().create(
+            attribute=color, value=x) for x in ('Red', 'Blue')]
+        self.small, self.large = [AttributeOption.objects.language().create(
+            attribute=size, value=x) for x in ('S', 'L')]
+
+        self.var = create_product('Shirt red S', parent=self.prod)
+        for option in (self.red, self.small):
+            ProductAttributeValue.objects.create(
+                product=self.var, attribute=option.attribute,
+                value_option=option)
+        ProductFlag.objects.create(
+            product=self.prod,
+            flag=Flag.objects.language().create(code='new', name='New'))
+
+    def test_generate_variants(self):
+        options = [self.red, self.blue, self.small, self.large]
+        pks = generate_variants(self.prod, options, quantity=5)
+        self.assertEquals(len(pks), 3)
+
+        variants = Product.objects.language('en').filter(pk__in=pks)
+        self.assertEquals(
+            sorted(x.get_slug() for x in variants),
+            ['shirt-1', 'shirt-3', 'shirt-4'])
+        self.assertEquals(set(x.quantity for x in variants), set([5]))
+        self.assertEquals(
+            Product.objects.language('en').get(pk=pks[0]).get_name(),
+            'Shirt (Red, L)')
+        self.assertEquals(self.prod.get_variant(color='Blue', size='S'),
+                          Product.objects.get(pk=pks[1]))
+        self.assertTrue(all(
+            'new' in x.get_flags() for x in variants))
+
+        prod = Product.objects.get(pk=self.prod.pk)
+        self.assertEquals((prod.lft, prod.rght), (1, 10))
+        self.assertEquals(
+            list(prod.get_children().values_list('pk', flat=True)),
+            [self.var.pk] + pks)
+
+        self.assertEquals(generate_variants(self.prod, options), [])
+
+    def test_generate_variants_stale_nodes(self):
+        # Variant left without a position (eg. by a failed import).
+        Product.objects.bulk_create([Product(
+            parent=self.prod, tree_id=0, level=1, lft=0, rght=0,
+            upc='stale')])
+        stale = Product.objects.get(upc='stale')
+        options = [self.red, self.blue, self.small, self.large]
+        pks = generate_variants(self.prod, options)
+        self.assertEquals(len(pks), 3)
+        self.assertNotIn(stale.pk, pks)
+        self.assertFalse(Product.objects.filter(
+            pk__in=pks, upc__isnull=False).exists())
+        self.assertEquals(Product.objects.get(pk=self.prod.pk).rght, 12)
@@ -1,9 +1,19 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from django.test import TestCase
+from decimal import Decimal as D
+
+import json
+
+from django.db import connection
+from django.test import TestCase, RequestFactory
+from django.test.utils import CaptureQueriesContext
 from django.core.urlresolvers import reverse
 
+from catalog.models import Product, ProductMeasurement, Flag, ProductFlag
+from catalog.reviews.models import ProductRating
+from catalog.views import get_rating_filter
+
 from .models import (
     create_product, create_category, create_brand, create_manufacturer)
 
@@ -52,3 +62,68 @@ class FilterProductsTestCase(TestCase):
 
     def test_sort_products(self):
         pass
+
+    def test_get_measurement_filters(self):
+        product = Product.objects.get(upc='p2')
+        ProductMeasurement.objects.create(
+            product=product, kind='width', value=D(50), unit='cm')
+        resp = self.get_products_response(**{
+            'width-from': 40, 'width-to': 60, 'width-unit': 'cm'})
+        self.assertEquals(list(resp.context['object_list']), [product])
+
+    def test_get_flag_filters(self):
+        flag = Flag.objects.language().create(code='new', name='New')
+        product = Product.objects.get(upc='p1')
+        ProductFlag.objects.create(product=product, flag=flag)
+        resp = self.get_products_response(flag='new')
+        self.assertEquals(list(resp.context['object_list']), [product])
+        resp = self.get_products_response(flag='-new')
+        self.assertEquals(len(resp.context['object_list']), 2)
+
+    def test_in_stock_filter(self):
+        product = Product.objects.get(upc='p1')
+        create_product('P1 1', parent=product, quantity=0)
+        Product.objects.filter(upc='p2').update(quantity=0)
+        Product.objects.update_stock(
+            Product.objects.values_list('pk', flat=True))
+        resp = self.get_products_response(**{'in-stock': 1})
+        self.assertEquals(
+            sorted(x.upc for x in resp.context['object_list']), ['p3'])
+
+    def test_get_rating_filter(self):
+        product = Product.objects.get(upc='p1')
+        ProductRating.objects.add(product.pk, 4)
+        ProductRating.objects.add(Product.objects.get(upc='p2').pk, 2)
+        resp = self.get_products_response(**{'rating-from': '3.5'})
+        self.assertEquals(list(resp.context['object_list']), [product])
+
+        # Invalid and non finite values are ignored.
+        for value in ('abc', 'NaN', 'sNaN', 'Infinity', '-inf'):
+            request = RequestFactory().get('/', {'rating-from': value})
+            self.assertIsNone(get_rating_filter(request), value)
+            resp = self.get_products_response(**{'rating-from': value})
+            self.assertEquals(len(resp.context['object_list']), 3)
+
+
+class ProductVariantsJSONViewTestCase(TestCase):
+    def setUp(self):
+        self.prod = create_product('Prod')
+        self.var_1 = create_product('Var 1', parent=self.prod)
+        self.var_2 = create_product('Var 2', parent=self.prod)
+        ProductRating.objects.add(self.var_1.pk, 4)
+        self.url = reverse(
+            'catalog_product_variants', kwargs={'slug': self.prod.slug})
+
+    def test_variants_rating(self):
+        with CaptureQueriesContext(connection) as context:
+            resp = self.client.get(self.url)
+        ratings = dict((x['slug'], x['rating']) for x in json.loads(
+            resp.content.decode('utf-8')))
+        self.assertEquals(ratings['var-1']['count'], 1)
+        self.assertIsNone(ratings['var-2'])
+
+        # Ratings are selected along with the variants.
+        queries = [x['sql'] for x in context.captured_queries
+                  if 'catalog_reviews_product_ratings' in x['sql']]
+        self.assertEquals(len(queries), 1)
+        self.assertIn('catalog_products', queries[0])
@@ -1,2 +1,9 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
+
+from .models import *  # noqa
+from .commands import *  # noqa
+from .notifications import *  # noqa
+from .admin import *  # noqa
+from .views import *  # noqa
+from .sales import *  # noqa
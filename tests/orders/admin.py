@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core import mail
+from django.contrib.admin import AdminSite
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.test import TestCase, RequestFactory
+from django.test.utils import override_settings
+
+from shop.order_signals import completed
+
+from catalog.models import Product
+from catalog.orders.models import (
+    Order, QueuedNotification, batch_notifications)
+from catalog.orders.notifications import ClientNotification, render_messages
+from catalog import settings as scs
+
+from tests.catalog.models import create_product
+from .models import create_order
+
+
+class QueueNotificationsMixin(object):
+    def setUp(self):
+        self.queue_notifications = scs.ORDERS_QUEUE_NOTIFICATIONS
+
+    def tearDown(self):
+        scs.ORDERS_QUEUE_NOTIFICATIONS = self.queue_notifications
+
+
+@override_settings(MANAGERS=[('Owner', 'owner@example.com')])
+class BatchNotificationsTestCase(QueueNotificationsMixin, TestCase):
+    def setUp(self):
+        super(BatchNotificationsTestCase, self).setUp()
+        prod = create_product('Prod')
+        self.orders = [create_order(
+            [prod], billing_email='client{}@example.com'.format(i))
+            for i in range(3)]
+
+    def get_sent(self):
+        return sorted((x.to[0], x.subject) for x in mail.outbox)
+
+    def test_batch_notifications(self):
+        with batch_notifications():
+            with batch_notifications():
+                for order in self.orders:
+                    completed.send(sender=self, order=order)
+            self.assertEquals(len(mail.outbox), 0)
+
+        sent = self.get_sent()
+        self.assertEquals(len(sent), 6)
+        for i, order in enumerate(self.orders):
+            subject = 'Order {}'.format(order.pk)
+            self.assertIn(('client{}@example.com'.format(i), subject), sent)
+            self.assertEquals(sent.count(('owner@example.com', subject)), 1)
+
+    def test_batch_notifications_queued(self):
+        scs.ORDERS_QUEUE_NOTIFICATIONS = True
+        with batch_notifications():
+            for order in self.orders:
+                completed.send(sender=self, order=order)
+        self.assertEquals(len(mail.outbox), 0)
+        self.assertEquals(sorted(QueuedNotification.objects.values_list(
+            'order_id', flat=True)), sorted([x.pk for x in self.orders] * 2))
+
+    def test_render_messages(self):
+        notifications = [ClientNotification(x) for x in self.orders]
+        notifications.append(ClientNotification(create_order([])))
+        messages = render_messages(notifications)
+        self.assertEquals([x[0] for x in messages], notifications[:3])
+        self.assertEquals(
+            [x[1].to for x in messages],
+            [['client{}@example.com'.format(i)] for i in range(3)])
+
+        # Templates are loaded once and shared, missing ones included.
+        templates = notifications[0].templates
+        self.assertTrue(all(x.templates is templates for x in notifications))
+        self.assertIsNone(
+            templates[ClientNotification.html_body_template_name])
+        self.assertEquals(len(templates), 3)
+
+
+@override_settings(SITE_ID=1)
+class OrderAdminTestCase(QueueNotificationsMixin, TestCase):
+    def setUp(self):
+        from catalog.orders.admin import OrderAdmin
+        super(OrderAdminTestCase, self).setUp()
+        self.admin = OrderAdmin(Order, AdminSite())
+        self.prod = create_product('Prod', quantity=1)
+        self.order_1 = create_order(
+            [self.prod], billing_email='client1@example.com')
+        self.order_2 = create_order(
+            [self.prod], billing_email='client2@example.com')
+
+    def get_request(self):
+        request = RequestFactory().post('/')
+        request._messages = CookieStorage(request)
+        return request
+
+    def get_message(self, request):
+        return [x.message for x in request._messages][0]
+
+    def get_statuses(self):
+        return list(Order.objects.order_by('pk').values_list(
+            'status', flat=True))
+
+    def test_actions(self):
+        scs.ORDERS_QUEUE_NOTIFICATIONS = True
+        actions = [
+            ('mark_completed', Order.COMPLETED),
+            ('mark_shipped', Order.SHIPPED),
+            ('mark_cancelled', Order.CANCELLED),
+        ]
+        for action, status in actions:
+            QueuedNotification.objects.all().delete()
+            request = self.get_request()
+            getattr(self.admin, action)(request, Order.objects.all())
+            self.assertEquals(self.get_statuses(), [status, status])
+            self.assertEquals(sorted(QueuedNotification.objects.values_list(
+                'order_id', flat=True)), [self.order_1.pk, self.order_2.pk])
+            self.assertIn('2 orders', self.get_message(request))
+
+        # Orders that have the status already are left out.
+        request = self.get_request()
+        self.admin.mark_cancelled(request, Order.objects.all())
+        self.assertIn('0 orders', self.get_message(request))
+
+    def test_change_status_stock(self):
+        Order.objects.update(status=Order.PROCESSING)
+        request = self.get_request()
+        self.admin.mark_completed(request, Order.objects.order_by('pk'))
+        self.assertEquals(
+            self.get_statuses(), [Order.COMPLETED, Order.CANCELED])
+        self.assertIn('1 order', self.get_message(request))
+        self.assertEquals(mail.outbox[-1].to, ['client2@example.com'])
+
+        self.admin.mark_cancelled(self.get_request(), Order.objects.all())
+        self.assertEquals(Product.objects.get(pk=self.prod.pk).quantity, 1)
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from datetime import date, timedelta
+
+from django.test import TestCase
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from catalog.models import RelatedProduct
+from catalog.orders.models import (
+    Order, ProductCoPurchase, ProductCoPurchaseOrder, OrderSalesDay,
+    ProductSalesDay, SalesRollupRun, get_day_range)
+
+from tests.catalog.models import create_product
+from .models import create_order
+
+
+class RelateProductsTestCase(TestCase):
+    def setUp(self):
+        self.prod_1 = create_product('Prod 1')
+        self.prod_1_var = create_product('Prod 1 1', parent=self.prod_1)
+        self.prod_2 = create_product('Prod 2')
+        self.prod_3 = create_product('Prod 3')
+
+    def get_count(self, product, other):
+        return ProductCoPurchase.objects.filter(
+            product=product, other=other).values_list(
+            'count', flat=True).first() or 0
+
+    def test_relateproducts(self):
+        create_order([self.prod_1_var, self.prod_2])
+        create_order([self.prod_1, self.prod_2, self.prod_3],
+                     status=Order.SHIPPED)
+        create_order([self.prod_1, self.prod_3], status=Order.PROCESSING)
+        call_command('relateproducts', top=1)
+
+        self.assertEquals(self.get_count(self.prod_1, self.prod_2), 2)
+        self.assertEquals(self.get_count(self.prod_2, self.prod_1), 2)
+        self.assertEquals(self.get_count(self.prod_1, self.prod_3), 1)
+        self.assertEquals(ProductCoPurchaseOrder.objects.count(), 2)
+        self.assertEquals(list(RelatedProduct.objects.filter(
+            base_product=self.prod_1).values_list('product', flat=True)),
+            [self.prod_2.pk])
+
+    def test_relateproducts_incremental(self):
+        old = create_order([self.prod_1, self.prod_3],
+                           status=Order.PROCESSING)
+        new = create_order([self.prod_1, self.prod_2])
+        call_command('relateproducts')
+        self.assertEquals(self.get_count(self.prod_1, self.prod_3), 0)
+
+        # Older order confirmed after a newer one was counted.
+        old.status = Order.CONFIRMED
+        old.save()
+        call_command('relateproducts')
+        self.assertEquals(self.get_count(self.prod_1, self.prod_3), 1)
+        self.assertEquals(self.get_count(self.prod_1, self.prod_2), 1)
+
+        # Changes between counted statuses are not counted twice.
+        new.status = Order.COMPLETED
+        new.save()
+        call_command('relateproducts')
+        self.assertEquals(self.get_count(self.prod_1, self.prod_2), 1)
+
+        new.status = Order.CANCELLED
+        new.save()
+        call_command('relateproducts')
+        self.assertEquals(self.get_count(self.prod_1, self.prod_2), 0)
+        self.assertFalse(RelatedProduct.objects.filter(
+            base_product=self.prod_1, product=self.prod_2).exists())
+
+        call_command('relateproducts', full=True)
+        self.assertEquals(self.get_count(self.prod_1, self.prod_3), 1)
+        self.assertEquals(ProductCoPurchaseOrder.objects.count(), 1)
+
+
+class RollupSalesTestCase(TestCase):
+    def setUp(self):
+        self.prod = create_product('Prod')
+        self.day = date(2015, 3, 10)
+        self.order = create_order([self.prod])
+        Order.objects.filter(pk=self.order.pk).update(
+            created=get_day_range(self.day)[0] + timedelta(hours=12))
+
+    def get_rows(self):
+        return list(OrderSalesDay.objects.values_list('date', 'orders'))
+
+    def test_rollupsales(self):
+        call_command('rollupsales')
+        self.assertEquals(self.get_rows(), [(self.day, 1)])
+        self.assertEquals(ProductSalesDay.objects.count(), 1)
+
+        # Only days of orders changed since the last run are rolled up.
+        OrderSalesDay.objects.update(orders=5)
+        call_command('rollupsales')
+        self.assertEquals(self.get_rows(), [(self.day, 5)])
+        order = Order.objects.get(pk=self.order.pk)
+        order.status = Order.CANCELLED
+        order.save()
+        call_command('rollupsales')
+        self.assertEquals(self.get_rows(), [])
+        self.assertEquals(SalesRollupRun.objects.count(), 3)
+
+    def test_rollupsales_since(self):
+        call_command('rollupsales', since='2015-03-11')
+        self.assertEquals(self.get_rows(), [])
+        call_command('rollupsales', since='2015-03-10')
+        self.assertEquals(self.get_rows(), [(self.day, 1)])
+        self.assertRaises(
+            CommandError, call_command, 'rollupsales', since='10.3.2015')
+
+    def test_rollupsales_full(self):
+        OrderSalesDay.objects.create(date=self.day, currency_code='EUR')
+        call_command('rollupsales', full=True)
+        self.assertEquals(self.get_rows(), [(self.day, 1)])
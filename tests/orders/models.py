@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.test import TestCase
+
+from shop.models import OrderItem
+
+from catalog.models import RelatedProduct
+from catalog.orders.models import Order, ProductCoPurchase
+
+from tests.catalog.models import create_product
+
+
+def create_order(products, status=Order.CONFIRMED, **kwargs):
+    total = sum(x.unit_price for x in products)
+    order = Order.objects.create(
+        status=status, order_subtotal=total, order_total=total, **kwargs)
+    for product in products:
+        OrderItem.objects.create(
+            order=order, product=product, product_reference=product.pk,
+            unit_price=product.unit_price, quantity=1,
+            line_subtotal=product.unit_price, line_total=product.unit_price)
+    return order
+
+
+class ProductCoPurchaseTestCase(TestCase):
+    def setUp(self):
+        self.prod_1 = create_product('Prod 1')
+        self.prod_2 = create_product('Prod 2')
+        self.prod_3 = create_product('Prod 3')
+
+    def get_counts(self):
+        return dict(((x.product_id, x.other_id), x.count)
+                    for x in ProductCoPurchase.objects.all())
+
+    def get_related(self):
+        return set(RelatedProduct.objects.filter(kind='cross_sell').
+                   values_list('base_product_id', 'product_id'))
+
+    def test_add_counts(self):
+        pair = (self.prod_1.pk, self.prod_2.pk)
+        ProductCoPurchase.objects.add_counts({pair: 2})
+        ProductCoPurchase.objects.add_counts({pair: 1})
+        self.assertEquals(self.get_counts(), {pair: 3})
+        ProductCoPurchase.objects.add_counts({pair: -5})
+        self.assertEquals(self.get_counts(), {})
+
+    def test_add_counts_in_place(self):
+        pair_1 = (self.prod_1.pk, self.prod_2.pk)
+        pair_2 = (self.prod_1.pk, self.prod_3.pk)
+        ProductCoPurchase.objects.add_counts({pair_1: 1, pair_2: 1})
+        pks = set(ProductCoPurchase.objects.values_list('pk', flat=True))
+        ProductCoPurchase.objects.filter(other=self.prod_3).update(
+            is_related=True)
+
+        # Existing rows are updated, related ones are kept with no count.
+        ProductCoPurchase.objects.add_counts({pair_1: 2, pair_2: -2})
+        self.assertEquals(self.get_counts(), {pair_1: 3, pair_2: 0})
+        self.assertEquals(set(ProductCoPurchase.objects.values_list(
+            'pk', flat=True)), pks)
+
+    def test_update_related(self):
+        pks = [self.prod_1.pk, self.prod_2.pk, self.prod_3.pk]
+        ProductCoPurchase.objects.add_counts({
+            (pks[0], pks[1]): 1, (pks[0], pks[2]): 3})
+        RelatedProduct.objects.create(
+            base_product=self.prod_1, product=self.prod_2, kind='cross_sell')
+
+        ProductCoPurchase.objects.update_related([pks[0]], 1, 'cross_sell')
+        self.assertEquals(self.get_related(), set([
+            (pks[0], pks[1]), (pks[0], pks[2])]))
+
+        # Generated relations are removed once their count drops to 0.
+        ProductCoPurchase.objects.add_counts({(pks[0], pks[2]): -3})
+        ProductCoPurchase.objects.update_related([pks[0]], 1, 'cross_sell')
+        self.assertEquals(self.get_related(), set([(pks[0], pks[1])]))
+        self.assertEquals(self.get_counts(), {(pks[0], pks[1]): 1})
+
+        ProductCoPurchase.objects.clear('cross_sell')
+        self.assertFalse(ProductCoPurchase.objects.exists())
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from smtplib import SMTPException
+from datetime import timedelta
+
+from django.core import mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.test import TestCase
+from django.utils import timezone
+
+from shop.order_signals import completed
+
+from catalog.orders.models import QueuedNotification
+from catalog import settings as scs
+
+from tests.catalog.models import create_product
+from .models import create_order
+
+
+class RecordingBackend(BaseEmailBackend):
+    """
+    Records opened connections and sent messages, fails to send to
+    recipients starting with 'fail'.
+    """
+    def __init__(self, *args, **kwargs):
+        super(RecordingBackend, self).__init__(*args, **kwargs)
+        self.opened, self.is_open, self.sent = 0, False, []
+
+    def open(self):
+        if not self.is_open:
+            self.opened += 1
+            self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def send_messages(self, messages):
+        for message in messages:
+            if message.to[0].startswith('fail'):
+                raise SMTPException('Recipient refused.')
+            self.sent.append((message.to[0], self.is_open))
+        return len(messages)
+
+
+def queue(*recipients):
+    return [QueuedNotification.objects.create(
+        subject='Order', text_body='Body', from_email='shop@example.com',
+        recipients=x) for x in recipients]
+
+
+class QueuedNotificationTestCase(TestCase):
+    def setUp(self):
+        self.order = create_order(
+            [create_product('Prod')], billing_email='client@example.com')
+        self.queue_notifications = scs.ORDERS_QUEUE_NOTIFICATIONS
+
+    def tearDown(self):
+        scs.ORDERS_QUEUE_NOTIFICATIONS = self.queue_notifications
+
+    def get(self, obj):
+        return QueuedNotification.objects.get(pk=obj.pk)
+
+    def test_send_without_queue(self):
+        completed.send(sender=self, order=self.order)
+        self.assertEquals(len(mail.outbox), 1)
+        self.assertEquals(mail.outbox[0].subject, 'Order {}'.format(
+            self.order.pk))
+        self.assertFalse(QueuedNotification.objects.exists())
+
+    def test_enqueue(self):
+        scs.ORDERS_QUEUE_NOTIFICATIONS = True
+        completed.send(sender=self, order=self.order)
+        self.assertEquals(len(mail.outbox), 0)
+        obj = QueuedNotification.objects.get()
+        self.assertEquals(obj.order, self.order)
+        self.assertEquals(obj.recipients, 'client@example.com')
+
+        self.assertEquals(QueuedNotification.objects.send_due(), (1, 0))
+        self.assertEquals(len(mail.outbox), 1)
+        self.assertIsNotNone(self.get(obj).sent)
+        self.assertEquals(QueuedNotification.objects.send_due(), (0, 0))
+
+    def test_claim(self):
+        objs = queue('a@example.com', 'b@example.com', 'c@example.com')
+        self.assertEquals(
+            QueuedNotification.objects.claim(2), objs[:2])
+        self.assertEquals(QueuedNotification.objects.claim(2), objs[2:])
+        self.assertEquals(QueuedNotification.objects.claim(2), [])
+
+        # Claimed but unsent ones are due after the claim timeout.
+        QueuedNotification.objects.filter(pk=objs[0].pk).update(
+            next_attempt=timezone.now())
+        self.assertEquals(QueuedNotification.objects.claim(2), objs[:1])
+
+    def test_retry(self):
+        ok_1, fail, ok_2 = queue(
+            'a@example.com', 'fail@example.com', 'b@example.com')
+        backend = RecordingBackend()
+        self.assertEquals(QueuedNotification.objects.send_due(
+            connection=backend), (2, 1))
+
+        # Connection is reopened once and kept for the next messages.
+        self.assertEquals(backend.opened, 2)
+        self.assertEquals(backend.sent, [
+            ('a@example.com', True), ('b@example.com', True)])
+
+        fail = self.get(fail)
+        self.assertIsNone(fail.sent)
+        self.assertEquals(fail.attempts, 1)
+        self.assertEquals(fail.last_error, 'Recipient refused.')
+        delay = fail.next_attempt - timezone.now()
+        self.assertTrue(timedelta(seconds=0) < delay <= timedelta(
+            seconds=scs.ORDERS_NOTIFICATION_RETRY_DELAY))
+        self.assertEquals(self.get(ok_1).attempts, 1)
+
+        # Delay is doubled on every next attempt.
+        QueuedNotification.objects.filter(pk=fail.pk).update(
+            next_attempt=timezone.now())
+        QueuedNotification.objects.send_due(connection=backend)
+        delay = self.get(fail).next_attempt - timezone.now()
+        self.assertTrue(timedelta(
+            seconds=scs.ORDERS_NOTIFICATION_RETRY_DELAY) < delay)
+
+    def test_give_up(self):
+        fail = queue('fail@example.com')[0]
+        QueuedNotification.objects.filter(pk=fail.pk).update(
+            attempts=scs.ORDERS_NOTIFICATION_MAX_ATTEMPTS - 1)
+        backend = RecordingBackend()
+        self.assertEquals(QueuedNotification.objects.send_due(
+            connection=backend), (0, 1))
+        QueuedNotification.objects.filter(pk=fail.pk).update(
+            next_attempt=timezone.now())
+        self.assertFalse(QueuedNotification.objects.due().exists())
+        self.assertEquals(QueuedNotification.objects.send_due(
+            connection=backend), (0, 0))
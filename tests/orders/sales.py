@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from datetime import date, timedelta
+from decimal import Decimal as D
+
+from django.contrib.admin import AdminSite
+from django.test import TestCase, RequestFactory
+from django.test.utils import override_settings
+
+from catalog.orders.models import (
+    Order, OrderSalesDay, ProductSalesDay, get_day_range)
+
+from tests.catalog.models import create_product, create_category
+from .models import create_order
+
+
+def create_day_order(day, products, **kwargs):
+    order = create_order(products, **kwargs)
+    Order.objects.filter(pk=order.pk).update(
+        created=get_day_range(day)[0] + timedelta(hours=12))
+    return order
+
+
+class SalesRollupTestCase(TestCase):
+    def setUp(self):
+        self.day = date(2015, 3, 10)
+        self.shoes = create_category('Shoes')
+        self.boots = create_category('Boots', parent=self.shoes)
+        self.prod_1 = create_product('Prod 1', category=self.boots)
+        self.prod_1_var = create_product(
+            'Prod 1 1', unit_price=50, parent=self.prod_1)
+        self.prod_2 = create_product('Prod 2', unit_price=40)
+
+        self.order_1 = create_day_order(
+            self.day, [self.prod_1, self.prod_1_var],
+            currency_code='EUR', currency_factor=D(2))
+        self.order_2 = create_day_order(
+            self.day, [self.prod_1, self.prod_2], status=Order.SHIPPED)
+        create_day_order(
+            self.day, [self.prod_2], status=Order.CANCELLED)
+        create_day_order(self.day + timedelta(days=1), [self.prod_2])
+
+    def rollup(self, days):
+        OrderSalesDay.objects.rollup(days)
+        ProductSalesDay.objects.rollup(days)
+
+    def get_order_rows(self):
+        return sorted(OrderSalesDay.objects.values_list(
+            'date', 'currency_code', 'orders', 'revenue', 'currency_revenue'))
+
+    def get_product_rows(self):
+        return sorted(ProductSalesDay.objects.values_list(
+            'product_id', 'currency_code', 'category_id', 'orders',
+            'quantity', 'revenue'))
+
+    def test_rollup(self):
+        self.assertEquals(OrderSalesDay.objects.rollup([self.day]), 2)
+        self.assertEquals(ProductSalesDay.objects.rollup([self.day]), 4)
+        self.assertEquals(self.get_order_rows(), [
+            (self.day, '', 1, D(140), D(140)),
+            (self.day, 'EUR', 1, D(150), D(300)),
+        ])
+        self.assertEquals(self.get_product_rows(), [
+            (self.prod_1.pk, '', self.boots.pk, 1, 1, D(100)),
+            (self.prod_1.pk, 'EUR', self.boots.pk, 1, 1, D(100)),
+            (self.prod_1_var.pk, 'EUR', self.boots.pk, 1, 1, D(50)),
+            (self.prod_2.pk, '', None, 1, 1, D(40)),
+        ])
+
+    def test_rollup_again(self):
+        self.rollup([self.day, self.day + timedelta(days=1)])
+        self.assertEquals(OrderSalesDay.objects.count(), 3)
+        Order.objects.filter(pk=self.order_1.pk).update(
+            status=Order.CANCELLED)
+
+        # A day is rolled up once, replaced with a delete and a bulk
+        # insert within a savepoint.
+        with self.assertNumQueries(5):
+            OrderSalesDay.objects.rollup([self.day, self.day])
+        self.assertEquals(self.get_order_rows(), [
+            (self.day, '', 1, D(140), D(140)),
+            (self.day + timedelta(days=1), '', 1, D(40), D(40)),
+        ])
+        ProductSalesDay.objects.rollup([self.day])
+        self.assertEquals(
+            ProductSalesDay.objects.filter(date=self.day).count(), 2)
+
+    def test_reports(self):
+        self.rollup([self.day, self.day + timedelta(days=1)])
+        self.assertEquals(OrderSalesDay.objects.by_currency(), [
+            {'currency_code': '', 'orders': 2, 'revenue': D(180),
+             'currency_revenue': D(180), 'average': D(90)},
+            {'currency_code': 'EUR', 'orders': 1, 'revenue': D(150),
+             'currency_revenue': D(300), 'average': D(300)},
+        ])
+        self.assertEquals(
+            [x['orders'] for x in OrderSalesDay.objects.by_currency(
+                date_to=self.day)], [1, 1])
+
+        self.assertEquals(ProductSalesDay.objects.by_product(limit=2), [
+            {'product_id': self.prod_1.pk, 'orders': 2, 'quantity': 2,
+             'revenue': D(200), 'average': D(100)},
+            {'product_id': self.prod_2.pk, 'orders': 2, 'quantity': 2,
+             'revenue': D(80), 'average': D(40)},
+        ])
+        self.assertEquals(
+            ProductSalesDay.objects.by_category(category=self.shoes),
+            [{'category_id': self.boots.pk, 'orders': 3, 'quantity': 3,
+              'revenue': D(250), 'average': D('83.34')}])
+        self.assertEquals(
+            ProductSalesDay.objects.for_category(self.shoes),
+            {'orders': 3, 'quantity': 3, 'revenue': D(250),
+             'average': D('83.34')})
+
+
+@override_settings(SITE_ID=1)
+class SalesReportTestCase(TestCase):
+    def setUp(self):
+        from catalog.orders.admin import OrderAdmin
+        self.admin = OrderAdmin(Order, AdminSite())
+        self.day = date(2015, 3, 10)
+        self.shoes = create_category('Shoes')
+        self.prod_1 = create_product('Prod 1', category=self.shoes)
+        self.prod_2 = create_product('Prod 2', unit_price=40)
+        create_day_order(self.day, [self.prod_1, self.prod_2])
+        create_day_order(self.day + timedelta(days=1), [self.prod_2])
+        days = [self.day, self.day + timedelta(days=1)]
+        OrderSalesDay.objects.rollup(days)
+        ProductSalesDay.objects.rollup(days)
+
+    def get_context(self, **params):
+        request = RequestFactory().get('/', params)
+        return self.admin.sales_report(request).context_data
+
+    def test_sales_report(self):
+        context = self.get_context()
+        self.assertTrue(context['has_rollups'])
+        self.assertEquals(
+            [(x['currency_code'], x['orders']) for x in context[
+                'currencies']], [('', 2)])
+        self.assertEquals(
+            [(x['name'], x['revenue']) for x in context['products']],
+            [('Prod 1', D(100)), ('Prod 2', D(80))])
+        self.assertEquals(
+            sorted((x['name'], x['revenue']) for x in context['categories']),
+            [('Shoes', D(100)), ('Uncategorized', D(80))])
+        self.assertIsNone(context['category_totals'])
+
+    def test_sales_report_filtered(self):
+        context = self.get_context(
+            date_from='2015-03-11', category=self.shoes.pk)
+        self.assertTrue(context['form'].is_valid())
+        self.assertEquals(
+            [(x['name'], x['revenue']) for x in context['products']],
+            [('Prod 2', D(40))])
+        self.assertEquals(context['categories'], [])
+        self.assertEquals(context['category_totals'], {
+            'orders': None, 'quantity': None, 'revenue': None,
+            'average': None})
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from decimal import Decimal as D
+
+from django.contrib.auth.models import User
+from django.test import TestCase, RequestFactory
+
+from shop.models import ExtraOrderPriceField, ExtraOrderItemPriceField
+
+from catalog.orders.views import OrderListView, OrderDetailView
+
+from tests.catalog.models import create_product
+from .models import create_order
+
+
+def add_price_fields(order):
+    ExtraOrderPriceField.objects.create(
+        order=order, label='Shipping', value=D(10))
+    for item in order.items.all():
+        ExtraOrderItemPriceField.objects.create(
+            order_item=item, label='Tax', value=D(5))
+
+
+class OrderViewsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='user')
+        self.prods = [create_product('Prod %d' % i) for i in range(3)]
+        self.orders = []
+        for i in range(3):
+            order = create_order(
+                self.prods[:i + 1], user=self.user, currency_factor=D(2))
+            add_price_fields(order)
+            self.orders.append(order)
+        self.request = RequestFactory().get('/')
+        self.request.user = self.user
+
+    def get_view(self, view_class, **kwargs):
+        view = view_class()
+        view.request, view.args, view.kwargs = self.request, (), kwargs
+        return view
+
+    def get_prices(self, order):
+        return (
+            [(x.currency_unit_price, [y.currency_value for y in
+              x.extra_price_fields]) for x in order.get_items()],
+            [x.currency_value for x in order.extra_price_fields])
+
+    def test_order_list_queries(self):
+        view = self.get_view(OrderListView)
+        # Orders, items, their price fields and order price fields.
+        with self.assertNumQueries(4):
+            prices = [self.get_prices(x) for x in view.get_queryset()]
+        self.assertEquals(len(prices), 3)
+        self.assertIn(([(D(200), [D(10)])] * 3, [D(20)]), prices)
+
+    def test_order_detail_queries(self):
+        view = self.get_view(OrderDetailView, pk=self.orders[1].pk)
+        with self.assertNumQueries(4):
+            order = view.get_object()
+            prices = self.get_prices(order)
+        self.assertEquals(prices, ([(D(200), [D(10)])] * 2, [D(20)]))
+
+    def test_currency_prices_cached(self):
+        order = self.orders[2]
+        items = order.get_items()
+        fields = order.extra_price_fields
+        with self.assertNumQueries(0):
+            self.assertIs(order.get_items(), items)
+            self.assertIs(order.extra_price_fields, fields)
+            self.get_prices(order)
+        self.assertEquals(
+            [x.currency_line_total for x in items], [D(200)] * 3)
@@ -1,2 +1,6 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
+
+from .models import *  # noqa
+from .commands import *  # noqa
+from .views import *  # noqa
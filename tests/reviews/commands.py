@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.test import TestCase
+from django.core.management import call_command
+
+from catalog.reviews.models import ProductRating
+
+from tests.catalog.models import create_product
+from .models import create_review
+
+
+class RebuildRatingsTestCase(TestCase):
+    def test_rebuildratings(self):
+        prod = create_product('Prod')
+        create_review(prod, 5)
+        create_review(prod, 3)
+        ProductRating.objects.all().delete()
+        call_command('rebuildratings')
+        rating = ProductRating.objects.get(product=prod)
+        self.assertEquals((rating.count, rating.sum), (2, 8))
+        self.assertEquals(rating.get_histogram(), [0, 0, 1, 0, 1])
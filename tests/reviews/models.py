@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from decimal import Decimal as D
+
+from django.test import TestCase
+
+from catalog.models import Product
+from catalog.reviews.models import Review, ProductRating
+
+from tests.catalog.models import create_product
+
+
+def create_review(product, rating, **kwargs):
+    return Review.objects.create(product=product, rating=rating, **kwargs)
+
+
+class ProductRatingTestCase(TestCase):
+    def setUp(self):
+        self.prod_1 = create_product('Prod 1')
+        self.prod_2 = create_product('Prod 2')
+
+    def get_rating(self, product):
+        return ProductRating.objects.filter(product=product).values_list(
+            'count', 'sum', 'average').first()
+
+    def get_histogram(self, product):
+        return ProductRating.objects.get(product=product).get_histogram()
+
+    def test_add(self):
+        ProductRating.objects.add(self.prod_1.pk, 5)
+        ProductRating.objects.add(self.prod_1.pk, 2)
+        self.assertEquals(self.get_rating(self.prod_1), (2, 7, D('3.50')))
+        self.assertEquals(self.get_histogram(self.prod_1), [0, 1, 0, 0, 1])
+
+        ProductRating.objects.add(self.prod_1.pk, 5, count=-1)
+        ProductRating.objects.add(self.prod_1.pk, 2, count=-1)
+        self.assertEquals(self.get_rating(self.prod_1), (0, 0, None))
+
+        # Removing a rating of a product without a summary is a no-op.
+        ProductRating.objects.add(self.prod_2.pk, 3, count=-1)
+        self.assertIsNone(self.get_rating(self.prod_2))
+
+    def test_review_signals(self):
+        review = create_review(self.prod_1, 4)
+        create_review(self.prod_1, 1)
+        self.assertEquals(self.get_rating(self.prod_1), (2, 5, D('2.50')))
+
+        # Saving without changes leaves the summary as is.
+        review.body = 'Good'
+        review.save()
+        self.assertEquals(self.get_rating(self.prod_1), (2, 5, D('2.50')))
+
+        review = Review.objects.get(pk=review.pk)
+        review.rating = 2
+        review.save()
+        self.assertEquals(self.get_rating(self.prod_1), (2, 3, D('1.50')))
+        self.assertEquals(self.get_histogram(self.prod_1), [1, 1, 0, 0, 0])
+
+        review.product = self.prod_2
+        review.save()
+        self.assertEquals(self.get_rating(self.prod_1), (1, 1, D('1.00')))
+        self.assertEquals(self.get_rating(self.prod_2), (1, 2, D('2.00')))
+
+        review.delete()
+        self.assertEquals(self.get_rating(self.prod_2), (0, 0, None))
+
+    def test_rebuild(self):
+        create_review(self.prod_1, 5)
+        create_review(self.prod_1, 4)
+        create_review(self.prod_2, 3)
+        ProductRating.objects.all().update(count=0, sum=0, average=None)
+        self.assertEquals(ProductRating.objects.rebuild([self.prod_1.pk]), 1)
+        self.assertEquals(self.get_rating(self.prod_1), (2, 9, D('4.50')))
+        self.assertEquals(self.get_rating(self.prod_2), (0, 0, None))
+
+        self.assertEquals(ProductRating.objects.rebuild(), 2)
+        self.assertEquals(self.get_rating(self.prod_2), (1, 3, D('3.00')))
+        self.assertEquals(self.get_histogram(self.prod_1), [0, 0, 0, 1, 1])
+
+    def test_as_dict(self):
+        self.assertIsNone(self.prod_1.as_dict['rating'])
+        create_review(self.prod_1, 5)
+        create_review(self.prod_1, 4)
+        rating = Product.objects.get(pk=self.prod_1.pk).as_dict['rating']
+        self.assertEquals(D(rating.pop('average')), D('4.5'))
+        self.assertEquals(rating, {'count': 2, 'histogram': [0, 0, 0, 1, 1]})
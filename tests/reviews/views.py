@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, RequestFactory
+from django.test.utils import override_settings
+
+from catalog.reviews.views import ReviewListView
+
+from tests.catalog.models import create_product, LOCMEM_CACHES
+from .models import create_review
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ReviewListViewTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.prod = create_product('Prod')
+        self.reviews = [create_review(
+            self.prod, 5, user=User.objects.create(username='user%d' % i))
+            for i in range(5)]
+        self.reviews.reverse()
+        self.view = ReviewListView.as_view(per_page=2)
+
+    def get_page(self, **params):
+        request = RequestFactory().get('/', params)
+        context = self.view(request, slug='prod').context_data
+        return context['object_list'], context['next_cursor']
+
+    def test_cursor(self):
+        reviews, cursor = self.get_page()
+        self.assertEquals(reviews, self.reviews[:2])
+        self.assertEquals(cursor, self.reviews[1].pk)
+        reviews, cursor = self.get_page(before=cursor)
+        self.assertEquals(reviews, self.reviews[2:4])
+        reviews, cursor = self.get_page(before=cursor)
+        self.assertEquals(reviews, self.reviews[4:])
+        self.assertIsNone(cursor)
+
+        # Invalid cursor lists the first page.
+        self.assertEquals(self.get_page(before='-1'), self.get_page())
+
+    def test_cache(self):
+        self.get_page()
+        keys = [x for x in cache._cache if 'catalog_reviews_{}_'.format(
+            self.prod.pk) in x]
+        self.assertEquals(len(keys), 1)
+        self.assertEquals(cache.get(keys[0].split(':', 2)[-1]), (
+            [x.pk for x in self.reviews[:2]], self.reviews[1].pk))
+
+        # Product, and cached reviews with their users.
+        with self.assertNumQueries(2):
+            reviews, cursor = self.get_page()
+            [x.user.username for x in reviews]
+        self.assertEquals(reviews, self.reviews[:2])
+
+        # A new review changes the version, so the first page is new.
+        review = create_review(self.prod, 1)
+        self.assertEquals(self.get_page()[0], [review, self.reviews[0]])
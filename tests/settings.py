@@ -25,6 +25,10 @@ FIXTURE_DIRS = (
     root_path('tests', 'fixtures'),
 )
 
+TEMPLATE_DIRS = (
+    root_path('tests', 'templates'),
+)
+
 USE_TZ = True
 
 ROOT_URLCONF = 'tests.urls'
@@ -66,11 +70,16 @@ INSTALLED_APPS = (
     'shop',
     'shop.addressmodel',
     'catalog',
+    'catalog.addresses',
+    'catalog.orders',
+    'catalog.reviews',
     'currencies',
 )
 
 SHOP_PRODUCT_MODEL = 'catalog.models.Product'
 
+SHOP_ORDER_MODEL = 'catalog.orders.models.Order'
+
 SHOP_CART_MODIFIERS = (
     'catalog.cart_modifiers.ShopCatalogCartModifier',
 )